@@ -1,107 +1,230 @@
 import argparse
+import importlib
+import os
 import sys
+from typing import List
 
-from loguru import logger
-
-from Swit.inner.add import add
-from Swit.inner.branch import branch
-from Swit.inner.checkout import checkout
-from Swit.inner.commit import commit
-from Swit.inner.graph import graph
-from Swit.inner.init import init
-from Swit.inner.merge import merge
-from Swit.inner.status import status
-
-parser = argparse.ArgumentParser(
-    description="Swit is an open source version control system.",
-    epilog="Thank you for supporting Swit! <3"
-)
-subparser = parser.add_subparsers(
-    dest="command", description="Swit commands:", required=True
-)
-
-# Init:
-_init = subparser.add_parser(
-    "init",
-    description="Create a new swit repository.",
-)
-
-# Add:
-_add = subparser.add_parser(
-    "add",
-    description="Tells swit to include updates to a particular file or folder in the next commit.",
-)
-_add.add_argument(
-    "path", type=str, help="an absolute or relative path to a file or dir"
-)
-
-# Commit:
-_commit = subparser.add_parser(
-    "commit",
-    description="Creates a snapshot of the repository.",
-)
-_commit.add_argument("--message", "--m", type=str, help="user message")
-
-# Status:
-_status = subparser.add_parser(
-    "status",
-    description="Display the repository and the staging area. Shows which changes have been staged, which haven't, and which files aren't being tracked by swit.",
-)
-
-# Checkout:
-_checkout = subparser.add_parser(
-    "checkout",
-    description="Updates files in the repository to match the version in the specified image.",
-)
-_checkout.add_argument(
-    "indicator", type=str, help="either a branch name or a commit id"
-)
-
-# Graph:
-_graph = subparser.add_parser(
-    "graph",
-    description="Shows a graph of all parental hierarchy, starting from HEAD.",
-)
-_graph.add_argument("--full", action="store_true", help="show all commits and the relations between them")
-_graph.add_argument("--entire", "--e", action="store_true", help="show the entire id of each entry (default: first 6 chars)")
-
-# Branch:
-_branch = subparser.add_parser(
-    "branch",
-    description="Create another line of development in the project. Committing under a branch will give your commits a name that's easy to remember.",
-)
-_branch.add_argument("name", type=str, help="branch name")
-
-# Merge:
-_merge = subparser.add_parser(
-    "merge",
-    description="Creates a new commit, that is an integration of two other commits.",
-)
-_merge.add_argument(
-    "indicator", type=str, help="either a branch name or a commit id"
-)
-
-
-args = parser.parse_args()
+import Swit.common.client as client
 
 
+# Each command's module is imported only when the command runs, so that
+# e.g. `Swit status` doesn't pay for importing what `Swit graph` needs.
 WIT_COMMANDS = {
-        "init": init,
-        "add": add,
-        "commit": commit,
-        "status": status,
-        "checkout": checkout,
-        "graph": graph,
-        "branch": branch,
-        "merge": merge,
-    }
+    "init": "Swit.inner.init:init",
+    "add": "Swit.inner.add:add",
+    "commit": "Swit.inner.commit:commit",
+    "status": "Swit.inner.status:status",
+    "checkout": "Swit.inner.checkout:checkout",
+    "graph": "Swit.inner.graph:graph",
+    "log": "Swit.inner.log:log",
+    "diff": "Swit.inner.diff:diff",
+    "branch": "Swit.inner.branch:branch",
+    "merge": "Swit.inner.merge:merge",
+    "config": "Swit.inner.config:config",
+    "gc": "Swit.inner.gc:gc",
+    "commit-graph": "Swit.inner.commit_graph:commit_graph",
+    "monitor": "Swit.inner.monitor:monitor",
+    "server": "Swit.inner.server:server",
+}
+
+# Commands that take paths after `--`, e.g. `Swit log -- README.md`.
+PATH_COMMANDS = {"log", "diff"}
+
+# Commands that always run in the calling process, rather than on the server of the repository:
+# `init` may create a repository inside another one, and `server` and `monitor` manage processes themselves.
+LOCAL_COMMANDS = {"init", "server", "monitor"}
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Swit is an open source version control system.",
+        epilog="Thank you for supporting Swit! <3"
+    )
+    subparser = parser.add_subparsers(
+        dest="command", description="Swit commands:", required=True
+    )
+
+    # Init:
+    _init = subparser.add_parser(
+        "init",
+        description="Create a new swit repository.",
+    )
+
+    # Add:
+    _add = subparser.add_parser(
+        "add",
+        description="Tells swit to include updates to particular files or folders in the next commit. "
+                    "Only new files and files that changed since they were added are read.",
+    )
+    _add.add_argument(
+        "pathspecs", type=str, nargs="+", metavar="path",
+        help="absolute or relative paths to files or dirs (a path that was removed stages the removal of its files)"
+    )
+    _add.add_argument("--stats", action="store_true", help="tell how fast files were hashed, to tune `core.workers`")
+
+    # Commit:
+    _commit = subparser.add_parser(
+        "commit",
+        description="Creates a snapshot of the repository.",
+    )
+    _commit.add_argument("--message", "--m", type=str, help="user message")
+
+    # Status:
+    _status = subparser.add_parser(
+        "status",
+        description="Display the repository and the index. Shows which changes have been staged, which haven't, and which files aren't being tracked by swit.",
+    )
+    _status.add_argument("--refresh", action="store_true", help="rewrite the cached stat info of unchanged files, so they won't be read again")
+    _status.add_argument("--stats", action="store_true", help="tell how fast files were hashed, to tune `core.workers`")
+
+    # Checkout:
+    _checkout = subparser.add_parser(
+        "checkout",
+        description="Updates files in the repository to match the version in the specified image.",
+    )
+    _checkout.add_argument(
+        "indicator", type=str, help="either a branch name or a commit id"
+    )
+
+    # Graph:
+    _graph = subparser.add_parser(
+        "graph",
+        description="Shows a graph of all parental hierarchy, starting from HEAD.",
+    )
+    _graph.add_argument("--full", action="store_true", help="show all commits and the relations between them")
+    _graph.add_argument("--entire", "--e", action="store_true", help="show the entire id of each entry (default: first 6 chars)")
+    _graph.add_argument("--max-count", "-n", type=int, help="show at most this many commits")
+    _graph.add_argument("--since", type=str, help="show only commits made after this date (e.g. 2021-01-29)")
+    _graph.add_argument("--plot", action="store_true", help="draw the graph in a window instead (requires networkx and matplotlib)")
+
+    # Log:
+    _log = subparser.add_parser(
+        "log",
+        description="Shows the commits reachable from HEAD (or from a branch or a commit), newest first. "
+                    "Add `-- <path>...` to show only the commits that changed those paths.",
+    )
+    _log.add_argument("indicator", type=str, nargs="?", help="a branch name or a commit id to start from (default: HEAD)")
+    _log.add_argument("--max-count", "-n", type=int, help="show at most this many commits")
+    _log.add_argument("--skip", type=int, default=0, help="skip this many commits before starting to show them")
+    _log.add_argument("--oneline", action="store_true", help="show each commit on a single line")
+    _log.add_argument("--format", type=str, help="format string, e.g. '%%h %%ad %%s' (see README)")
+
+    # Diff:
+    _diff = subparser.add_parser(
+        "diff",
+        description="Shows the changes between the index and the repository, or HEAD and the index (`--cached`), "
+                    "or a commit and the repository, or two commits. Add `-- <path>...` to show only those paths.",
+    )
+    _diff.add_argument("commits", type=str, nargs="*", help="up to two branch names or commit ids")
+    _diff.add_argument("--cached", action="store_true", help="show the changes staged for the next commit")
+    _diff.add_argument("--stat", action="store_true", help="show the number of changed lines of each file")
+    _diff.add_argument("--name-only", action="store_true", help="show only the paths of the changed files")
+
+    # Branch:
+    _branch = subparser.add_parser(
+        "branch",
+        description="Create another line of development in the project. Committing under a branch will give your commits a name that's easy to remember.",
+    )
+    _branch.add_argument("name", type=str, help="branch name")
+
+    # Merge:
+    _merge = subparser.add_parser(
+        "merge",
+        description="Creates a new commit, that is an integration of two other commits.",
+    )
+    _merge.add_argument(
+        "indicator", type=str, help="either a branch name or a commit id"
+    )
+
+    # Config:
+    _config = subparser.add_parser(
+        "config",
+        description="Get or set a repository setting, e.g. `core.workers`.",
+    )
+    _config.add_argument("name", type=str, help="setting name, as <section>.<key>")
+    _config.add_argument("value", type=str, nargs="?", help="new value (omit to print the current one)")
+
+    # Gc:
+    _gc = subparser.add_parser(
+        "gc",
+        description="Packs all reachable objects into a single file, storing similar file versions as deltas, and removes unreachable commits and objects.",
+    )
+
+    # Commit graph:
+    _commit_graph = subparser.add_parser(
+        "commit-graph",
+        description="Rewrites the commit graph from the history.",
+    )
+    _commit_graph.add_argument("--changed-paths", action="store_true", help="also create the changed-path filters of commits that have none, which speed up `log -- <path>`")
+
+    # Monitor:
+    _monitor = subparser.add_parser(
+        "monitor",
+        description="Watches the repository in the background (using inotify, on Linux), so `status` only checks the files that changed.",
+    )
+    _monitor.add_argument(
+        "action", nargs="?", default="status", choices=["start", "stop", "run", "status"],
+        help="start or stop the monitor, run it in the foreground, or tell if it's running (default)"
+    )
+
+    # Server:
+    _server = subparser.add_parser(
+        "server",
+        description="Runs commands in a long-lived background process, which keeps the repository loaded between them.",
+    )
+    _server.add_argument(
+        "action", nargs="?", default="status", choices=["start", "stop", "run", "status"],
+        help="start or stop the server, run it in the foreground, or tell if it's running (default)"
+    )
+
+    return parser
+
+
+def load_command(command: str):
+    module_name, _, func_name = WIT_COMMANDS[command].partition(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def run(argv: List[str]) -> None:
+    """Parses the arguments of a command, and runs it on the repository that contains the working dir."""
+    paths = None
+    if "--" in argv:
+        split = argv.index("--")
+        argv, paths = argv[:split], argv[split + 1:]
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    params = vars(args)
+    if args.command in PATH_COMMANDS:
+        params["paths"] = paths
+    elif paths is not None:
+        parser.error(f"`{args.command}` does not take paths.")
+    command = params.pop("command")
+    func = load_command(command)
+    if command == "init":
+        func(**params)
+        return
+    # Imported here, as the client doesn't need them to forward a command to the server:
+    from loguru import logger
+    from Swit.common.exceptions import WitDirectoryNotFoundError
+    from Swit.repository import Repository
+
+    try:
+        repo = Repository(os.getcwd())
+    except WitDirectoryNotFoundError as e:
+        logger.error(e)
+        sys.exit(1)
+    with repo.use():
+        func(**params)
 
 
 def main():
-    func = WIT_COMMANDS[args.command]
-    params = vars(args)
-    params.pop("command")
-    func(**params)
+    argv = sys.argv[1:]
+    # A plot is drawn by the process that was called:
+    if argv and argv[0] not in LOCAL_COMMANDS and "--plot" not in argv:
+        exit_code = client.forward(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+    run(argv)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,6 @@
+def __getattr__(name: str):
+    # Imported on first use, so that the CLI doesn't pay for it before forwarding a command to the server.
+    if name == "Repository":
+        from Swit.repository import Repository
+        return Repository
+    raise AttributeError(f"module 'Swit' has no attribute '{name}'")
@@ -0,0 +1,182 @@
+import hashlib
+import math
+import os
+import struct
+import tempfile
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import Swit.common.commit_graph as commit_graph
+import Swit.common.objects as objects
+import Swit.common.paths as path_to
+from Swit.common.helper_funcs import get_commit_metadata, get_commit_tree
+
+
+# Changed-path Bloom filters: for every commit, a small filter of the paths it changed compared to its first parent
+# (files, and the dirs that contain them). A filter can tell for sure that a path was not changed,
+# so history queries on a path skip most commits without reading their trees.
+#   commit-graph-bloom.idx: header (magic, version, hashes per path, bits per path),
+#                           then the offset and size of the filter of each commit, in commit graph order
+#   commit-graph-bloom.dat: the filters, back to back
+MAGIC = b"SWBF"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")
+RECORD = struct.Struct("<QI")
+HASHES = 7
+BITS_PER_PATH = 10
+# Commits that changed more paths than this get an empty filter, which matches every path.
+MAX_PATHS = 512
+# The size of commits that were made before filters were kept, and have none.
+NO_FILTER = 0xFFFFFFFF
+
+
+def get_hashes(rel_path: str) -> Tuple[int, int]:
+    """The two base hashes of a path; the filter's hashes are combinations of them."""
+    return struct.unpack_from("<II", hashlib.sha1(rel_path.encode()).digest())
+
+
+def _bits(hashes: Tuple[int, int], size: int) -> Iterable[int]:
+    first, second = hashes
+    return ((first + i * second) % (size * 8) for i in range(HASHES))
+
+
+def make_filter(rel_paths: Set[str]) -> bytes:
+    if len(rel_paths) > MAX_PATHS:
+        return b""
+    size = max(1, math.ceil(len(rel_paths) * BITS_PER_PATH / 8))
+    bloom = bytearray(size)
+    for rel_path in rel_paths:
+        for bit in _bits(get_hashes(rel_path), size):
+            bloom[bit // 8] |= 1 << (bit % 8)
+    return bytes(bloom)
+
+
+def might_contain(bloom: bytes, hashes: Tuple[int, int]) -> bool:
+    """Returns False if the path is certainly not in the filter."""
+    if not bloom:
+        return True
+    return all(bloom[bit // 8] & (1 << (bit % 8)) for bit in _bits(hashes, len(bloom)))
+
+
+def get_commit_changes(commit_id: str) -> Set[str]:
+    """Returns the paths a commit changed compared to its first parent (all of its paths for the first commit)."""
+    parents = commit_graph.parse_parents(get_commit_metadata(commit_id).get("parent"))
+    parent_tree_id = get_commit_tree(parents[0]) if parents else None
+    return objects.get_changed_paths(parent_tree_id, get_commit_tree(commit_id))
+
+
+# Reading:
+
+class BloomFilters:
+    def __init__(self, index_data: bytes, data: bytes):
+        magic, version, hashes, bits_per_path = HEADER.unpack_from(index_data)
+        if magic != MAGIC or version != VERSION or (hashes, bits_per_path) != (HASHES, BITS_PER_PATH):
+            raise ValueError(f"'{path_to.bloom_index}' is not a supported changed-paths file.")
+        self._index = index_data
+        self._data = data
+
+    def __len__(self) -> int:
+        return (len(self._index) - HEADER.size) // RECORD.size
+
+    def get(self, position: int) -> Optional[bytes]:
+        """Returns the filter of a commit, by its position in the commit graph; None if it has none."""
+        if position >= len(self):
+            return None
+        offset, size = RECORD.unpack_from(self._index, HEADER.size + position * RECORD.size)
+        if size == NO_FILTER:
+            return None
+        return self._data[offset:offset + size]
+
+
+_cache: Dict[str, Tuple[Tuple[int, int], BloomFilters]] = {}
+
+
+def read_filters() -> Optional[BloomFilters]:
+    """Loads the filters, once per process (again only if they changed). Returns None if there are none."""
+    try:
+        st = os.stat(path_to.bloom_index)
+    except FileNotFoundError:
+        return None
+    signature = (st.st_size, st.st_mtime_ns)
+    cached = _cache.get(str(path_to.bloom_index))
+    if cached and cached[0] == signature:
+        return cached[1]
+    filters = BloomFilters(path_to.bloom_index.read_bytes(), path_to.bloom_data.read_bytes())
+    _cache[str(path_to.bloom_index)] = (signature, filters)
+    return filters
+
+
+# Writing:
+
+def add_commit(commit_id: str) -> None:
+    """Appends the filter of a new commit. Must be called after it was added to the commit graph.
+    Commits before it that have no filter (made before filters were kept) are marked as such;
+    `Swit commit-graph --changed-paths` fills them in.
+    """
+    position = commit_graph.read_graph().find(commit_id)
+    if not path_to.bloom_index.exists():
+        path_to.bloom_data.write_bytes(b"")
+        path_to.bloom_index.write_bytes(HEADER.pack(MAGIC, VERSION, HASHES, BITS_PER_PATH))
+    count = (os.path.getsize(path_to.bloom_index) - HEADER.size) // RECORD.size
+    if count > position:
+        return
+    bloom = make_filter(get_commit_changes(commit_id))
+    # The data is written first, so the index never points past its end.
+    with open(path_to.bloom_data, "ab") as f:
+        offset = f.tell()
+        f.write(bloom)
+    with open(path_to.bloom_index, "ab") as f:
+        f.write(RECORD.pack(0, NO_FILTER) * (position - count))
+        f.write(RECORD.pack(offset, len(bloom)))
+
+
+def get_filters_by_id() -> Dict[str, bytes]:
+    """Returns the existing filters by commit id, so they can be kept while the commit graph is rewritten."""
+    filters = read_filters()
+    if filters is None or not path_to.commit_graph.exists():
+        return {}
+    graph = commit_graph.read_graph()
+    by_id = {}
+    for position in range(min(len(graph), len(filters))):
+        bloom = filters.get(position)
+        if bloom is not None:
+            by_id[graph.id_at(position)] = bloom
+    return by_id
+
+
+def write_filters(known: Optional[Dict[str, bytes]] = None) -> int:
+    """Creates a filter for every commit of the commit graph that has none. Returns how many were created.
+    Filters are taken from `known` (by commit id) if it's given, or else from the existing filters.
+    """
+    graph = commit_graph.read_graph()
+    existing = read_filters() if known is None else None
+    created = 0
+    index_records = [HEADER.pack(MAGIC, VERSION, HASHES, BITS_PER_PATH)]
+    data = bytearray()
+    for position in range(len(graph)):
+        if known is not None:
+            bloom = known.get(graph.id_at(position))
+        else:
+            bloom = existing.get(position) if existing else None
+        if bloom is None:
+            bloom = make_filter(get_commit_changes(graph.id_at(position)))
+            created += 1
+        index_records.append(RECORD.pack(len(data), len(bloom)))
+        data += bloom
+
+    for path, content in ((path_to.bloom_data, bytes(data)), (path_to.bloom_index, b"".join(index_records))):
+        fd, tmp = tempfile.mkstemp(dir=path_to.wit_repo, prefix="bloom_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return created
+
+
+def remove_filters() -> None:
+    """Filters are stored by position in the commit graph, so they must be removed when it's rewritten."""
+    for path in (path_to.bloom_index, path_to.bloom_data):
+        if path.exists():
+            path.unlink()
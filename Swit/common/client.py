@@ -0,0 +1,92 @@
+import json
+import os
+import socket
+import struct
+import sys
+from typing import List, Optional
+
+
+# The server (`Swit server start`) runs commands for the repository it was started in, listening on `.swit/server.sock`.
+# A request is a line of JSON: {"argv": [...], "cwd": "..."}, or {"type": "ping"} / {"type": "stop"}.
+# The answer is a stream of frames: a channel (b"o" for stdout, b"e" for stderr, b"x" for the exit code),
+# the length of the payload, and the payload.
+# This module is all the client needs, so it imports nothing but the standard library.
+FRAME = struct.Struct(">cI")
+SOCKET_NAME = "server.sock"
+
+
+def find_socket(cwd: str) -> Optional[str]:
+    """Returns the path of the server's socket of the repository that contains `cwd`, if there's one."""
+    cur_path = cwd
+    while True:
+        wit_repo = os.path.join(cur_path, ".swit")
+        if os.path.isdir(wit_repo):
+            socket_path = os.path.join(wit_repo, SOCKET_NAME)
+            return socket_path if os.path.exists(socket_path) else None
+        parent = os.path.dirname(cur_path)
+        if parent == cur_path:
+            return None
+        cur_path = parent
+
+
+def connect(socket_path: str) -> Optional[socket.socket]:
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except OSError:
+        conn.close()
+        return None
+    return conn
+
+
+def _recv_exactly(conn: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = conn.recv(min(size, 1024 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def iter_frames(conn: socket.socket):
+    """Yields the (channel, payload) of every frame, until the server closes the connection."""
+    while True:
+        header = _recv_exactly(conn, FRAME.size)
+        if header is None:
+            return
+        channel, length = FRAME.unpack(header)
+        payload = _recv_exactly(conn, length)
+        if payload is None:
+            return
+        yield channel, payload
+
+
+def send_request(request: dict, cwd: Optional[str] = None) -> Optional[socket.socket]:
+    """Sends a request to the server of the repository, and returns the connection to read the answer from.
+    Returns None if no server is running.
+    """
+    socket_path = find_socket(cwd or os.getcwd())
+    conn = connect(socket_path) if socket_path else None
+    if conn is not None:
+        conn.sendall(json.dumps(request).encode() + b"\n")
+    return conn
+
+
+def forward(argv: List[str]) -> Optional[int]:
+    """Runs a command on the server, writing its output as it comes. Returns its exit code,
+    or None if no server is running (the command should then run in this process).
+    """
+    conn = send_request({"argv": argv, "cwd": os.getcwd()})
+    if conn is None:
+        return None
+    with conn:
+        for channel, payload in iter_frames(conn):
+            if channel == b"x":
+                return int(payload)
+            stream = sys.stdout if channel == b"o" else sys.stderr
+            stream.buffer.write(payload)
+            stream.flush()
+    sys.stderr.write("The server stopped while running the command.\n")
+    return 1
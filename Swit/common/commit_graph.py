@@ -0,0 +1,334 @@
+import heapq
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import Swit.common.helper_funcs as helper
+import Swit.common.paths as path_to
+
+
+# The commit graph holds the history of the repository in a compact binary file:
+#   header:  magic, version
+#   records: commit id, position of the first and second parent, generation, commit time
+# Records are appended in commit order, so parents always come before their children,
+# and a parent is referred to by the position of its record.
+# The generation of a commit is 1 for the first commit, and 1 + the highest generation of its parents otherwise;
+# a commit is never an ancestor of a commit with a lower or equal generation.
+# Numbers are little-endian, so the file can be viewed as an array of words on most machines, without parsing.
+MAGIC = b"SWCG"
+VERSION = 2
+HEADER = struct.Struct("<4sI")
+RECORD = struct.Struct("<20sIIII")
+NO_PARENT = 0xFFFFFFFF
+
+# A record is 9 words: 5 for the id, then the parents, generation and time.
+RECORD_WORDS = RECORD.size // 4
+FIRST_PARENT, SECOND_PARENT, GENERATION, TIME = range(5, 9)
+
+DATE_FORMAT = "%a %b %d %H:%M:%S %Y %z"
+
+# The id index lists the commits of the graph sorted by id, to find a commit by the start of its id:
+#   header:  magic, version, number of commits
+#   fanout:  for each first byte, the number of ids that start with a lower or equal byte
+#   records: commit id, position in the commit graph
+# Commits added to the graph after it was written are searched one by one,
+# until there are more than MAX_UNSORTED of them, and the index is written again.
+IDS_MAGIC = b"SWCI"
+IDS_VERSION = 1
+IDS_HEADER = struct.Struct("<4sII")
+FANOUT = struct.Struct("<256I")
+ID_RECORD = struct.Struct("<20sI")
+MAX_UNSORTED = 1024
+
+
+class CommitGraph:
+    """The parsed history of the repository. Commits are referred to by their position in the file.
+    Nothing is parsed up front: the numbers are read through strided views over the raw file (one column each),
+    and ids are sliced out only when needed. A million commits load in a single read, into ~36MB.
+    """
+
+    def __init__(self, data: bytes):
+        magic, version = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"'{path_to.commit_graph}' is not a swit commit graph.")
+        self._data = data
+        self._ids: Optional[IdIndex] = None
+        words = memoryview(data)[HEADER.size:].cast("I")
+        if sys.byteorder != "little":
+            words = array("I", words.tobytes())
+            words.byteswap()
+        self.first_parents = words[FIRST_PARENT::RECORD_WORDS]
+        self.second_parents = words[SECOND_PARENT::RECORD_WORDS]
+        self.generations = words[GENERATION::RECORD_WORDS]
+        self.times = words[TIME::RECORD_WORDS]
+
+    def __len__(self) -> int:
+        return len(self.generations)
+
+    def id_at(self, position: int) -> str:
+        return self.digest_at(position).hex()
+
+    def find(self, commit_id: str) -> Optional[int]:
+        """Returns the position of a commit, or None if it's not in the graph.
+        The id index is binary-searched; the few commits appended since it was written are compared one by one.
+        """
+        digest = bytes.fromhex(commit_id)
+        ids = self.ids
+        position = ids.find(digest)
+        if position is not None:
+            return position
+        for position in range(ids.count, len(self)):
+            if self.digest_at(position) == digest:
+                return position
+        return None
+
+    @property
+    def ids(self) -> "IdIndex":
+        """The id index of the graph, loaded the first time a commit is looked up."""
+        if self._ids is None:
+            self._ids = read_id_index_of(self)
+        return self._ids
+
+    def digest_at(self, position: int) -> bytes:
+        start = HEADER.size + position * RECORD.size
+        return self._data[start:start + 20]
+
+    def parents_of(self, position: int) -> Tuple[int, ...]:
+        first, second = self.first_parents[position], self.second_parents[position]
+        if first == NO_PARENT:
+            return ()
+        return (first,) if second == NO_PARENT else (first, second)
+
+
+class IdIndex:
+    def __init__(self, data: bytes):
+        magic, version, count = IDS_HEADER.unpack_from(data)
+        if magic != IDS_MAGIC or version != IDS_VERSION:
+            raise ValueError(f"'{path_to.commit_ids}' is not a swit id index.")
+        self._data = data
+        self.count = count
+        self._fanout = FANOUT.unpack_from(data, IDS_HEADER.size)
+
+    def digest_at(self, i: int) -> bytes:
+        start = IDS_HEADER.size + FANOUT.size + i * ID_RECORD.size
+        return self._data[start:start + 20]
+
+    def position_at(self, i: int) -> int:
+        return ID_RECORD.unpack_from(self._data, IDS_HEADER.size + FANOUT.size + i * ID_RECORD.size)[1]
+
+    def _bisect(self, key: bytes) -> int:
+        """Returns the number of ids lower than the key, searching only those that start with its first byte."""
+        low = self._fanout[key[0] - 1] if key[0] else 0
+        high = self._fanout[key[0]]
+        while low < high:
+            mid = (low + high) // 2
+            if self.digest_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def find(self, digest: bytes) -> Optional[int]:
+        """Returns the position of an id in the commit graph, or None if it's not listed."""
+        i = self._bisect(digest)
+        if i < self.count and self.digest_at(i) == digest:
+            return self.position_at(i)
+        return None
+
+    def find_prefix(self, prefix: str) -> List[str]:
+        """Returns the ids that start with a prefix (of at least two hex digits), using a binary search."""
+        low = self._bisect(bytes.fromhex(prefix.ljust(40, "0")))
+        matches = []
+        while low < self.count and self.digest_at(low).hex().startswith(prefix):
+            matches.append(self.digest_at(low).hex())
+            low += 1
+        return matches
+
+
+_cache: Dict[str, Tuple[Tuple[int, int], CommitGraph]] = {}
+_ids_cache: Dict[str, Tuple[Tuple[int, int], IdIndex]] = {}
+
+
+# Reading:
+
+def read_graph() -> CommitGraph:
+    """Loads the commit graph, once per process: it's parsed again only if the file changed since.
+    It's created from `parents.txt` if it doesn't exist yet.
+    """
+    if not path_to.commit_graph.exists():
+        write_graph()
+    st = os.stat(path_to.commit_graph)
+    signature = (st.st_size, st.st_mtime_ns)
+    cached = _cache.get(str(path_to.commit_graph))
+    if cached and cached[0] == signature:
+        return cached[1]
+    try:
+        graph = CommitGraph(path_to.commit_graph.read_bytes())
+    except ValueError:
+        # Written by an older version (or broken): it's recreated from parents.txt.
+        write_graph()
+        return read_graph()
+    _cache[str(path_to.commit_graph)] = (signature, graph)
+    return graph
+
+
+def read_graph_with(*commit_ids: str) -> CommitGraph:
+    """Loads the commit graph, making sure it includes the given commits.
+    Commits made by versions of swit that didn't keep a commit graph are added by rewriting it.
+    """
+    graph = read_graph()
+    if any(graph.find(commit_id) is None for commit_id in commit_ids):
+        write_graph()
+        graph = read_graph()
+    return graph
+
+
+def read_id_index() -> IdIndex:
+    """Loads the id index, once per process (again only if it changed). It's created if it doesn't exist yet."""
+    if not path_to.commit_ids.exists():
+        write_id_index(read_graph())
+    st = os.stat(path_to.commit_ids)
+    signature = (st.st_size, st.st_mtime_ns)
+    cached = _ids_cache.get(str(path_to.commit_ids))
+    if cached and cached[0] == signature:
+        return cached[1]
+    ids = IdIndex(path_to.commit_ids.read_bytes())
+    _ids_cache[str(path_to.commit_ids)] = (signature, ids)
+    return ids
+
+
+def read_id_index_of(graph: CommitGraph) -> IdIndex:
+    """Loads the id index, and writes it again first if it doesn't belong to the graph
+    (e.g. the graph was written again by an older version).
+    """
+    ids = read_id_index()
+    if ids.count > len(graph) or (ids.count and graph.digest_at(ids.position_at(0)) != ids.digest_at(0)):
+        write_id_index(graph)
+        ids = read_id_index()
+    return ids
+
+
+def find_prefix(prefix: str) -> List[str]:
+    """Returns the ids of the commits that start with a prefix of hex digits (at least two)."""
+    graph = read_graph()
+    ids = graph.ids
+    matches = ids.find_prefix(prefix)
+    matches += [
+        graph.id_at(position) for position in range(ids.count, len(graph))
+        if graph.id_at(position).startswith(prefix)
+    ]
+    return matches
+
+
+def get_merge_base(first_id: str, second_id: str) -> Optional[str]:
+    """Returns the id of a lowest common ancestor of two commits: a commit that both of them descend from,
+    and that no other such commit descends from. Returns None if the commits share no history.
+
+    Commits are visited from the highest generation down, marking each one with the tips it was reached from.
+    A commit is only visited after all of its children that were reached, so the first commit that is marked
+    with both tips is a lowest common ancestor, and the walk stops there:
+    only commits between the tips and the merge base are read.
+    """
+    graph = read_graph_with(first_id, second_id)
+    first, second = graph.find(first_id), graph.find(second_id)
+    if first == second:
+        return first_id
+    flags = {first: 1, second: 2}
+    queue = sorted([(-graph.generations[first], first), (-graph.generations[second], second)])
+    while queue:
+        _, position = heapq.heappop(queue)
+        if flags[position] == 3:
+            return graph.id_at(position)
+        for parent in graph.parents_of(position):
+            if parent not in flags:
+                flags[parent] = 0
+                heapq.heappush(queue, (-graph.generations[parent], parent))
+            flags[parent] |= flags[position]
+    return None
+
+
+# Writing:
+
+def get_commit_time(commit_id: str) -> int:
+    """Returns the time a commit was created at, in seconds since the epoch."""
+    date = helper.get_commit_metadata(commit_id)["date"]
+    return int(datetime.strptime(date, DATE_FORMAT).timestamp())
+
+
+def parse_parents(parents: Optional[str]) -> List[str]:
+    """Parents are written as `<id>,<id>`, or `None` for the first commit."""
+    if not parents or parents == "None":
+        return []
+    return parents.split(",")
+
+
+def _pack_record(commit_id: str, parents: List[int], generation: int) -> bytes:
+    first, second = (parents + [NO_PARENT, NO_PARENT])[:2]
+    return RECORD.pack(bytes.fromhex(commit_id), first, second, generation, get_commit_time(commit_id))
+
+
+def _write_file(path, data: bytes, prefix: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path_to.wit_repo, prefix=prefix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_id_index(graph: CommitGraph) -> None:
+    """Writes the id index of every commit of the graph."""
+    records = sorted((graph.digest_at(position), position) for position in range(len(graph)))
+    fanout = [0] * 256
+    for digest, _ in records:
+        fanout[digest[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+    data = b"".join([
+        IDS_HEADER.pack(IDS_MAGIC, IDS_VERSION, len(records)), FANOUT.pack(*fanout),
+        *(ID_RECORD.pack(digest, position) for digest, position in records),
+    ])
+    _write_file(path_to.commit_ids, data, "commit-ids_")
+
+
+def write_graph() -> None:
+    """Creates the commit graph from `parents.txt`, which lists every commit and its parents in commit order."""
+    positions = {}
+    generations = []
+    records = [HEADER.pack(MAGIC, VERSION)]
+    if path_to.parents.exists():
+        for line in path_to.parents.read_text().split("\n"):
+            commit_id, _, parents = line.strip().partition("=")
+            if not commit_id:
+                continue
+            parent_positions = [positions[p] for p in parse_parents(parents)]
+            generation = 1 + max((generations[p] for p in parent_positions), default=0)
+            records.append(_pack_record(commit_id, parent_positions, generation))
+            positions[commit_id] = len(generations)
+            generations.append(generation)
+    _write_file(path_to.commit_graph, b"".join(records), "commit-graph_")
+    write_id_index(read_graph())
+
+
+def add_commit(commit_id: str, parents: Optional[str]) -> None:
+    """Appends a new commit to the commit graph. Must be called after it was added to `parents.txt`."""
+    if not path_to.commit_graph.exists():
+        write_graph()
+        return
+    parent_ids = parse_parents(parents)
+    graph = read_graph_with(*parent_ids)
+    if graph.find(commit_id) is not None:
+        # The graph was just recreated from `parents.txt`, which already lists the commit.
+        return
+    parent_positions = [graph.find(p) for p in parent_ids]
+    generation = 1 + max((graph.generations[p] for p in parent_positions), default=0)
+    with open(path_to.commit_graph, "ab") as f:
+        f.write(_pack_record(commit_id, parent_positions, generation))
+    if path_to.commit_ids.exists() and len(graph) + 1 - read_id_index().count > MAX_UNSORTED:
+        write_id_index(read_graph())
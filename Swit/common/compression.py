@@ -0,0 +1,183 @@
+import io
+import math
+import zlib
+from collections import Counter
+from typing import BinaryIO, Optional
+
+from loguru import logger
+
+import Swit.common.config as config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Loose objects are stored raw (no suffix), or compressed with the codec their suffix names.
+NONE = "none"
+ZLIB = "zlib"
+ZSTD = "zstd"
+SUFFIXES = {NONE: "", ZLIB: ".z", ZSTD: ".zst"}
+
+CHUNK_SIZE = 64 * 1024
+
+# Content that starts with one of these is already compressed, and is stored as is.
+COMPRESSED_MAGIC = (
+    b"\x1f\x8b",                # gzip
+    b"PK\x03\x04",              # zip, jar, docx, xlsx...
+    b"\x28\xb5\x2f\xfd",        # zstd
+    b"\xfd7zXZ\x00",            # xz
+    b"BZh",                     # bzip2
+    b"7z\xbc\xaf\x27\x1c",      # 7z
+    b"Rar!\x1a\x07",            # rar
+    b"\x89PNG\r\n\x1a\n",       # png
+    b"\xff\xd8\xff",            # jpeg
+    b"GIF8",                    # gif
+    b"OggS",                    # ogg
+    b"fLaC",                    # flac
+    b"ID3",                     # mp3
+)
+# Samples with more bits of entropy per byte than this would barely shrink.
+MAX_ENTROPY = 7.5
+
+_warned_missing_zstd = False
+
+
+def get_codec() -> str:
+    """The codec new objects are written with: `Swit config compression.codec zlib|zstd|none`.
+    zstd requires the `zstandard` package; without it, zlib is used.
+    """
+    global _warned_missing_zstd
+    codec = config.get("compression.codec")
+    if codec == ZSTD and zstandard is None:
+        if not _warned_missing_zstd:
+            logger.warning("The `zstandard` package is not installed; compressing with zlib instead.")
+            _warned_missing_zstd = True
+        return ZLIB
+    if codec not in SUFFIXES:
+        raise ValueError(f"'{codec}' is not a supported codec. Use one of: {', '.join(SUFFIXES)}.")
+    return codec
+
+
+def get_level(codec: str) -> int:
+    level = config.get("compression.level")
+    if level:
+        return int(level)
+    return 3 if codec == ZSTD else 6
+
+
+def _entropy(sample: bytes) -> float:
+    """Shannon entropy of the sample, in bits per byte."""
+    total = len(sample)
+    return -sum(c / total * math.log2(c / total) for c in Counter(sample).values())
+
+
+def is_compressible(sample: bytes) -> bool:
+    """A cheap check on the first chunk of a file, to pass through data that is already compressed."""
+    if sample.startswith(COMPRESSED_MAGIC) or sample[4:8] == b"ftyp" or (
+        sample.startswith(b"RIFF") and sample[8:12] == b"WEBP"
+    ):
+        return False
+    return len(sample) < 512 or _entropy(sample) < MAX_ENTROPY
+
+
+# Writing:
+
+class _CompressingWriter(io.RawIOBase):
+    """Compresses everything written to it into the underlying file, chunk by chunk."""
+
+    def __init__(self, f: BinaryIO, codec: str, level: int):
+        self._f = f
+        if codec == ZLIB:
+            self._compressor = zlib.compressobj(level)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._f.write(self._compressor.compress(bytes(data)))
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._f.write(self._compressor.flush())
+        super().close()
+
+
+def compressing_writer(f: BinaryIO, codec: str) -> BinaryIO:
+    """Wraps a file, so that whatever is written is compressed with the codec.
+    Must be closed to flush the end of the stream.
+    """
+    return _CompressingWriter(f, codec, get_level(codec))
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == ZLIB:
+        return zlib.compress(data, get_level(codec))
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=get_level(codec)).compress(data)
+    return data
+
+
+# Reading:
+
+class _ZlibReader(io.RawIOBase):
+    """Decompresses a zlib stream, never holding more than a chunk of it in memory."""
+
+    def __init__(self, f: BinaryIO, length: Optional[int] = None):
+        self._f = f
+        self._decompressor = zlib.decompressobj()
+        self._pending = b""
+        self._remaining = length
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            if self._decompressor.unconsumed_tail:
+                data = self._decompressor.unconsumed_tail
+            else:
+                data = self._f.read(CHUNK_SIZE if self._remaining is None else min(CHUNK_SIZE, self._remaining))
+                if self._remaining is not None:
+                    self._remaining -= len(data)
+                if not data:
+                    self._pending = self._decompressor.flush()
+                    if not self._pending:
+                        return 0
+                    break
+            self._pending = self._decompressor.decompress(data, len(buffer))
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self) -> None:
+        self._f.close()
+        super().close()
+
+
+def decompressing_reader(f: BinaryIO, codec: str, length: Optional[int] = None) -> BinaryIO:
+    """Wraps a file of compressed data, so that reading it returns the original data, in a streaming manner.
+    `length` limits a zlib stream to that many bytes from the current position, for streams inside packs.
+    """
+    if codec == NONE:
+        return f
+    if codec == ZLIB:
+        return io.BufferedReader(_ZlibReader(f, length), CHUNK_SIZE)
+    if zstandard is None:
+        raise ModuleNotFoundError("Reading zstd compressed objects requires the `zstandard` package.")
+    return zstandard.ZstdDecompressor().stream_reader(f, closefd=True)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ModuleNotFoundError("Reading zstd compressed objects requires the `zstandard` package.")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
@@ -0,0 +1,104 @@
+import configparser
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+import Swit.common.paths as path_to
+
+
+# Settings are stored in `.swit/config`, using the same layout as Git:
+# [core]
+#     workers = 8
+# and are referred to as `<section>.<key>` (e.g. `core.workers`).
+DEFAULTS: Dict[str, str] = {
+    "core.workers": str(min(32, (os.cpu_count() or 1) + 4)),
+    "core.hardlinks": "false",
+    "compression.codec": "zlib",
+    "compression.level": "",
+    "pack.depth": "10",
+    "pack.window": "4",
+}
+
+TRUE = ("1", "true", "yes", "on")
+FALSE = ("0", "false", "no", "off")
+
+
+def _is_int(value: str, minimum: Optional[int] = None) -> bool:
+    try:
+        number = int(value)
+    except ValueError:
+        return False
+    return minimum is None or number >= minimum
+
+
+# What each setting of DEFAULTS accepts, checked before it's saved (a bad value would break every later command).
+# Other settings are saved as they are.
+VALIDATORS: Dict[str, Tuple[Callable[[str], bool], str]] = {
+    "core.workers": (lambda value: _is_int(value, 1), "a positive integer"),
+    "core.hardlinks": (lambda value: value.strip().lower() in TRUE + FALSE, "true or false"),
+    "compression.codec": (lambda value: value in ("zlib", "zstd", "none"), "zlib, zstd or none"),
+    "compression.level": (lambda value: not value or _is_int(value), "an integer, or empty for the codec's default"),
+    "pack.depth": (lambda value: _is_int(value, 0), "a non-negative integer"),
+    "pack.window": (lambda value: _is_int(value, 0), "a non-negative integer"),
+}
+
+_cache: Dict[str, Tuple[Tuple[int, int], configparser.ConfigParser]] = {}
+
+
+def split_name(name: str) -> Tuple[str, str]:
+    section, _, key = name.partition(".")
+    if not section or not key:
+        raise ValueError(f"'{name}' is not a valid setting name. Use `<section>.<key>`, e.g. `core.workers`.")
+    return section, key
+
+
+def read_config() -> configparser.ConfigParser:
+    """Parses the config file. It's parsed again only if it changed since the last read."""
+    try:
+        st = os.stat(path_to.config)
+        signature = (st.st_size, st.st_mtime_ns)
+    except FileNotFoundError:
+        signature = (-1, -1)
+    cached = _cache.get(str(path_to.config))
+    if cached and cached[0] == signature:
+        return cached[1]
+    parser = configparser.ConfigParser()
+    parser.read(path_to.config)
+    _cache[str(path_to.config)] = (signature, parser)
+    return parser
+
+
+def get(name: str) -> Optional[str]:
+    """Returns a setting, or its default if it's not set."""
+    section, key = split_name(name)
+    return read_config().get(section, key, fallback=DEFAULTS.get(name))
+
+
+def get_int(name: str) -> int:
+    return int(get(name))
+
+
+def get_bool(name: str) -> bool:
+    return get(name).strip().lower() in TRUE
+
+
+def check_value(name: str, value: str) -> None:
+    """Raises ValueError if the value is not one the setting accepts."""
+    if name in VALIDATORS:
+        is_valid, accepted = VALIDATORS[name]
+        if not is_valid(value):
+            raise ValueError(f"'{value}' is not a valid value of {name}. Use {accepted}.")
+
+
+def set_value(name: str, value: str) -> None:
+    """Saves a setting. ValueError is raised if its name or value is invalid; nothing is saved then."""
+    section, key = split_name(name)
+    check_value(name, value)
+    parser = configparser.ConfigParser()
+    parser.read(path_to.config)
+    if not parser.has_section(section):
+        parser.add_section(section)
+    parser.set(section, key, value)
+    with open(path_to.config, "w") as f:
+        parser.write(f)
+    # A rewrite in the same tick, of the same size, would look unchanged to `read_config`:
+    _cache.pop(str(path_to.config), None)
@@ -0,0 +1,373 @@
+import itertools
+import math
+import tempfile
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+
+# Line diffs use Myers' O(ND) algorithm, in its linear space form: the "middle snake" of the shortest edit script
+# is found by searching from both ends at once, and the two halves around it are diffed on their own.
+# Before that, the common prefix and suffix are cut, and lines that appear only on one side are dropped,
+# as they can never match: files that were mostly rewritten are diffed in about the time it takes to read them.
+# Like Git's, the search gives up on an optimal result when it's too costly (many scattered changes),
+# and splits at the furthest point it reached instead: the diff is still correct, if not the shortest.
+MIN_COST_LIMIT = 256
+
+# A matching block is (start in a, start in b, length), like `difflib`'s.
+Block = Tuple[int, int, int]
+
+# Files are treated as binary if the start of their content has a NUL byte, like Git does.
+BINARY_CHECK_SIZE = 8000
+
+# Files are diffed this many lines at a time, so memory stays bounded whatever their size (see `iter_line_ops`).
+WINDOW_LINES = 20000
+READ_SIZE = 1024 * 1024
+HUNK_MEMORY_SIZE = 8 * 1024 * 1024
+CONTEXT_LINES = 3
+
+CONFLICT_START = b"<<<<<<<"
+CONFLICT_MIDDLE = b"======="
+CONFLICT_END = b">>>>>>>"
+
+
+def is_binary(data: bytes) -> bool:
+    return b"\0" in data[:BINARY_CHECK_SIZE]
+
+
+def split_lines(data: bytes) -> List[bytes]:
+    """Splits content into lines, each keeping its `\\n` (the last one may have none)."""
+    lines = [line + b"\n" for line in data.split(b"\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines if lines[-1] else lines[:-1]
+
+
+def iter_lines(f: BinaryIO, start: bytes = b"") -> Iterator[bytes]:
+    """Yields the lines of a file, reading it a chunk at a time. `start` is content that was already read from it."""
+    rest = start
+    for chunk in iter(lambda: f.read(READ_SIZE), b""):
+        lines = split_lines(rest + chunk)
+        rest = lines.pop() if lines and not lines[-1].endswith(b"\n") else b""
+        yield from lines
+    yield from split_lines(rest)
+
+
+# Diffing:
+
+def _bisect(a: Sequence[int], b: Sequence[int]) -> Optional[Tuple[int, int]]:
+    """Returns a point of the middle snake of the shortest edit script from a to b, or None if a and b share nothing.
+    a and b must not start nor end with the same line.
+    """
+    n, m = len(a), len(b)
+    max_d = (n + m + 1) // 2
+    cost_limit = max(MIN_COST_LIMIT, math.isqrt(n + m))
+    # Paths of d edits only reach the diagonals -d..d:
+    offset = min(max_d, cost_limit + 1)
+    size = 2 * offset + 2
+    forward = [-1] * size
+    backward = [-1] * size
+    forward[offset + 1] = backward[offset + 1] = 0
+    delta = n - m
+    # If the total number of lines is odd, the forward path is the one to meet the backward path:
+    check_forward = delta % 2 != 0
+    k1_start = k1_end = k2_start = k2_end = 0
+    for d in range(max_d):
+        if d > cost_limit:
+            return _get_furthest(forward, offset, d, n, m)
+        for k1 in range(-d + k1_start, d + 1 - k1_end, 2):
+            i = offset + k1
+            if k1 == -d or (k1 != d and forward[i - 1] < forward[i + 1]):
+                x1 = forward[i + 1]
+            else:
+                x1 = forward[i - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[x1] == b[y1]:
+                x1 += 1
+                y1 += 1
+            forward[i] = x1
+            if x1 > n:
+                k1_end += 2
+            elif y1 > m:
+                k1_start += 2
+            elif check_forward:
+                j = offset + delta - k1
+                if 0 <= j < size and backward[j] != -1 and x1 >= n - backward[j]:
+                    return x1, y1
+
+        for k2 in range(-d + k2_start, d + 1 - k2_end, 2):
+            i = offset + k2
+            if k2 == -d or (k2 != d and backward[i - 1] < backward[i + 1]):
+                x2 = backward[i + 1]
+            else:
+                x2 = backward[i - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[n - x2 - 1] == b[m - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            backward[i] = x2
+            if x2 > n:
+                k2_end += 2
+            elif y2 > m:
+                k2_start += 2
+            elif not check_forward:
+                j = offset + delta - k2
+                if 0 <= j < size and forward[j] != -1:
+                    x1 = forward[j]
+                    if x1 >= n - x2:
+                        return x1, x1 - (j - offset)
+    return None
+
+
+def _get_furthest(forward: List[int], offset: int, d: int, n: int, m: int) -> Optional[Tuple[int, int]]:
+    """Returns the furthest point that a forward path of d - 1 edits reached."""
+    best = None
+    for k in range(-(d - 1), d, 2):
+        x = forward[offset + k]
+        y = x - k
+        if 0 <= x <= n and 0 <= y <= m and 0 < x + y < n + m and (best is None or x + y > sum(best)):
+            best = (x, y)
+    return best
+
+
+def _diff(a: Sequence[int], b: Sequence[int]) -> List[Block]:
+    """Returns the matching blocks of a and b, in order. Halves are kept on a stack rather than diffed recursively,
+    so even the longest files never run out of stack.
+    """
+    blocks = []
+    # Each item is either a part to diff, (a, b, start in a, start in b), or a block that comes after the parts above it.
+    stack = [(a, b, 0, 0)]
+    while stack:
+        item = stack.pop()
+        if len(item) == 3:
+            blocks.append(item)
+            continue
+        a, b, a_start, b_start = item
+        prefix = 0
+        while prefix < len(a) and prefix < len(b) and a[prefix] == b[prefix]:
+            prefix += 1
+        if prefix:
+            blocks.append((a_start, b_start, prefix))
+        suffix = 0
+        while suffix < len(a) - prefix and suffix < len(b) - prefix and a[-1 - suffix] == b[-1 - suffix]:
+            suffix += 1
+        if suffix:
+            stack.append((a_start + len(a) - suffix, b_start + len(b) - suffix, suffix))
+        a_mid, b_mid = a[prefix:len(a) - suffix], b[prefix:len(b) - suffix]
+        split = _bisect(a_mid, b_mid) if a_mid and b_mid else None
+        if split is not None:
+            x, y = split
+            stack.append((a_mid[x:], b_mid[y:], a_start + prefix + x, b_start + prefix + y))
+            stack.append((a_mid[:x], b_mid[:y], a_start + prefix, b_start + prefix))
+    return blocks
+
+
+def _join_blocks(blocks: List[Block]) -> List[Block]:
+    joined = []
+    for a_start, b_start, length in blocks:
+        if joined and joined[-1][0] + joined[-1][2] == a_start and joined[-1][1] + joined[-1][2] == b_start:
+            joined[-1] = (joined[-1][0], joined[-1][1], joined[-1][2] + length)
+        else:
+            joined.append((a_start, b_start, length))
+    return joined
+
+
+def get_matching_blocks(a: Sequence[bytes], b: Sequence[bytes]) -> List[Block]:
+    """Returns the lines that a and b have in common, as a list of (start in a, start in b, length),
+    in increasing order on both sides. Everything between them was removed from a or added in b.
+    """
+    # Lines are replaced by numbers, so comparing them is cheap; lines that appear on one side only are dropped.
+    numbers: Dict[bytes, int] = {}
+    a_ids = [numbers.setdefault(line, len(numbers)) for line in a]
+    in_a = len(numbers)
+    b_ids = [numbers.setdefault(line, len(numbers)) for line in b]
+    in_b = set(b_ids)
+    a_kept = [i for i, line_id in enumerate(a_ids) if line_id in in_b]
+    b_kept = [j for j, line_id in enumerate(b_ids) if line_id < in_a]
+
+    blocks = _diff([a_ids[i] for i in a_kept], [b_ids[j] for j in b_kept])
+    # Back to the positions in the original lines; a block is split where dropped lines were between its lines.
+    matches = []
+    for a_start, b_start, length in blocks:
+        for offset in range(length):
+            i, j = a_kept[a_start + offset], b_kept[b_start + offset]
+            if matches and matches[-1][0] + matches[-1][2] == i and matches[-1][1] + matches[-1][2] == j:
+                matches[-1] = (matches[-1][0], matches[-1][1], matches[-1][2] + 1)
+            else:
+                matches.append((i, j, 1))
+    return _join_blocks(matches)
+
+
+# Merging:
+
+def _get_sync_regions(base: List[bytes], ours: List[bytes], theirs: List[bytes]) -> Iterator[Tuple[int, ...]]:
+    """Yields the regions where the base and both sides have the same lines, as
+    (base start, base end, ours start, ours end, theirs start, theirs end), ending with an empty region at the end.
+    """
+    our_blocks = get_matching_blocks(base, ours)
+    their_blocks = get_matching_blocks(base, theirs)
+    i = j = 0
+    while i < len(our_blocks) and j < len(their_blocks):
+        our_base, our_start, our_length = our_blocks[i]
+        their_base, their_start, their_length = their_blocks[j]
+        start = max(our_base, their_base)
+        end = min(our_base + our_length, their_base + their_length)
+        if start < end:
+            our_sub = our_start + start - our_base
+            their_sub = their_start + start - their_base
+            yield start, end, our_sub, our_sub + end - start, their_sub, their_sub + end - start
+        if our_base + our_length < their_base + their_length:
+            i += 1
+        else:
+            j += 1
+    yield len(base), len(base), len(ours), len(ours), len(theirs), len(theirs)
+
+
+def _ensure_newline(lines: List[bytes]) -> List[bytes]:
+    if lines and not lines[-1].endswith(b"\n"):
+        return lines[:-1] + [lines[-1] + b"\n"]
+    return lines
+
+
+def merge_lines(
+    base: List[bytes], ours: List[bytes], theirs: List[bytes], our_name: str, their_name: str
+) -> Tuple[List[bytes], int]:
+    """A three-way merge of lines: changes that only one side made to the base are taken,
+    and where both sides changed the same lines differently, both versions are written between conflict markers.
+    Returns the merged lines, and the number of conflicts.
+    """
+    merged = []
+    conflicts = 0
+    base_at = our_at = their_at = 0
+    for base_start, base_end, our_start, our_end, their_start, their_end in _get_sync_regions(base, ours, theirs):
+        base_part = base[base_at:base_start]
+        our_part = ours[our_at:our_start]
+        their_part = theirs[their_at:their_start]
+        if our_part == their_part or their_part == base_part:
+            merged.extend(our_part)
+        elif our_part == base_part:
+            merged.extend(their_part)
+        else:
+            conflicts += 1
+            merged.append(CONFLICT_START + f" {our_name}\n".encode())
+            merged.extend(_ensure_newline(our_part))
+            merged.append(CONFLICT_MIDDLE + b"\n")
+            merged.extend(_ensure_newline(their_part))
+            merged.append(CONFLICT_END + f" {their_name}\n".encode())
+        merged.extend(base[base_start:base_end])
+        base_at, our_at, their_at = base_end, our_end, their_end
+    return merged, conflicts
+
+
+# Streaming diffs:
+
+class LineOp(NamedTuple):
+    """A run of lines that are the same on both sides (equal), or that were replaced (removed from a, added in b).
+    Starts are line numbers from 0.
+    """
+    equal: bool
+    a_start: int
+    a_lines: List[bytes]
+    b_start: int
+    b_lines: List[bytes]
+
+
+def iter_line_ops(a: Iterable[bytes], b: Iterable[bytes], window: int = WINDOW_LINES) -> Iterator[LineOp]:
+    """Diffs two streams of lines, a window of lines at a time.
+    Each window is diffed up to its last matching lines, and the lines after them are carried over to the next window,
+    so a change that crosses the end of a window is still found. Files shorter than a window get an ordinary diff.
+    """
+    a, b = iter(a), iter(b)
+    a_lines, b_lines = [], []
+    a_pos = b_pos = 0
+    while True:
+        a_lines.extend(itertools.islice(a, window - len(a_lines)))
+        b_lines.extend(itertools.islice(b, window - len(b_lines)))
+        is_last = len(a_lines) < window and len(b_lines) < window
+        if not a_lines and not b_lines:
+            return
+        blocks = get_matching_blocks(a_lines, b_lines)
+        if is_last or not blocks:
+            a_end, b_end = len(a_lines), len(b_lines)
+        else:
+            a_end, b_end = blocks[-1][0] + blocks[-1][2], blocks[-1][1] + blocks[-1][2]
+
+        i = j = 0
+        for a_start, b_start, length in blocks:
+            if i < a_start or j < b_start:
+                yield LineOp(False, a_pos + i, a_lines[i:a_start], b_pos + j, b_lines[j:b_start])
+            i, j = a_start + length, b_start + length
+            yield LineOp(True, a_pos + a_start, a_lines[a_start:i], b_pos + b_start, b_lines[b_start:j])
+        if i < a_end or j < b_end:
+            yield LineOp(False, a_pos + i, a_lines[i:a_end], b_pos + j, b_lines[j:b_end])
+        del a_lines[:a_end]
+        del b_lines[:b_end]
+        a_pos += a_end
+        b_pos += b_end
+        if is_last:
+            return
+
+
+def _format_range(start: int, count: int) -> str:
+    # An empty range is given by the line before it.
+    first = start + 1 if count else start
+    return f"{first}" if count == 1 else f"{first},{count}"
+
+
+def _format_line(prefix: bytes, line: bytes) -> bytes:
+    if line.endswith(b"\n"):
+        return prefix + line
+    return prefix + line + b"\n\\ No newline at end of file\n"
+
+
+class _Hunk:
+    """The lines of a hunk are only counted as they come, and its header is written once it's complete.
+    Huge hunks (e.g. a file that was rewritten) are spooled to a temp file instead of being kept in memory.
+    """
+
+    def __init__(self, a_start: int, b_start: int):
+        self.a_start, self.b_start = a_start, b_start
+        self.a_count = self.b_count = 0
+        self.body = tempfile.SpooledTemporaryFile(max_size=HUNK_MEMORY_SIZE)
+
+    def add(self, prefix: bytes, a_lines: List[bytes], b_lines: List[bytes]) -> None:
+        self.body.writelines(_format_line(prefix, line) for line in (b_lines if prefix == b"+" else a_lines))
+        self.a_count += len(a_lines)
+        self.b_count += len(b_lines)
+
+    def format(self) -> Iterator[bytes]:
+        yield f"@@ -{_format_range(self.a_start, self.a_count)} +{_format_range(self.b_start, self.b_count)} @@\n".encode()
+        self.body.seek(0)
+        yield from iter(lambda: self.body.read(READ_SIZE), b"")
+        self.body.close()
+
+
+def iter_hunks(ops: Iterable[LineOp], context: int = CONTEXT_LINES) -> Iterator[bytes]:
+    """Formats a stream of line ops as the hunks of a unified diff, each with `context` unchanged lines around it.
+    Yields the output a piece at a time; only the unchanged lines around the current hunk are kept in memory.
+    """
+    hunk = None
+    # The unchanged lines since the last change: their count, and the first and last `context` of them.
+    equal_count, head, tail, equal_a, equal_b = 0, [], [], 0, 0
+    for op in ops:
+        if op.equal:
+            if not equal_count:
+                equal_a, equal_b = op.a_start, op.b_start
+            head = (head + op.a_lines[:context])[:context]
+            tail = (tail + op.a_lines[-context:])[-context:]
+            equal_count += len(op.a_lines)
+            continue
+
+        if hunk is not None and equal_count <= 2 * context:
+            middle = head + tail[len(tail) - (equal_count - len(head)):] if equal_count > len(head) else head
+            hunk.add(b" ", middle, middle)
+        else:
+            if hunk is not None:
+                hunk.add(b" ", head, head)
+                yield from hunk.format()
+            skipped = equal_count - len(tail)
+            hunk = _Hunk(equal_a + skipped if equal_count else op.a_start, equal_b + skipped if equal_count else op.b_start)
+            hunk.add(b" ", tail if equal_count else [], tail if equal_count else [])
+        hunk.add(b"-", op.a_lines, [])
+        hunk.add(b"+", [], op.b_lines)
+        equal_count, head, tail = 0, [], []
+    if hunk is not None:
+        hunk.add(b" ", head, head)
+        yield from hunk.format()
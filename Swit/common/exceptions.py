@@ -17,11 +17,23 @@ class CommitRequiredError(FileNotFoundError):
 
 
 class ImpossibleMergeError(Exception):
-    """The content of staging_area is not the same as the HEAD image."""
+    """The content of the index is not the same as the HEAD image."""
 
     pass
 
 
+class MergeConflictError(Exception):
+    """Some files were changed differently on both sides, and must be merged by the user."""
+
+    def __init__(self, paths):
+        self.paths = paths
+        lines = "\n".join(f"  {path}" for path in paths)
+        super().__init__(
+            f"Merge conflict in {len(paths)} file(s):\n{lines}\n"
+            "Fix them, `add` them, and `commit` to finish the merge."
+        )
+
+
 class ImpossibleCheckoutError(Exception):
     """There must be no changes to be committed, not changes not staged for commit."""
 
@@ -32,3 +44,30 @@ class BranchNameExistsError(Exception):
     """Cannot create branch, as there is another branch with the same name."""
 
     pass
+
+
+class IgnoredPathError(Exception):
+    """Cannot add a path that is ignored by a .switignore file."""
+
+    pass
+
+
+class MonitorError(Exception):
+    """The filesystem monitor could not be started or reached."""
+
+    pass
+
+
+class ServerError(Exception):
+    """The command server could not be started or reached."""
+
+    pass
+
+
+class FileOperationsError(OSError):
+    """One or more file operations failed. All failures are reported together."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        lines = "\n".join(f"  {item}: {error}" for item, error in errors)
+        super().__init__(f"{len(errors)} file operation(s) failed:\n{lines}")
@@ -1,66 +1,224 @@
 import os
-import random
+import posixpath
 import re
-import shutil
-from filecmp import cmp
+import subprocess
+import sys
+import time
 from pathlib import Path
-from typing import List, Set, Tuple, Optional
+from typing import Callable, Collection, Dict, Iterable, Iterator, List, Set, Tuple, Optional
 
+import Swit.common.commit_graph as commit_graph
+import Swit.common.ignore as ignore
+import Swit.common.index as index
+import Swit.common.objects as objects
 import Swit.common.paths as path_to
-from Swit.common.exceptions import CommitIdError, BranchNameExistsError
+from Swit.common.exceptions import CommitIdError
+from Swit.common.index import IndexEntry
+from Swit.common.workers import run_parallel
 
 
 # Paths:
 
-def get_relpaths(
-    p: Path, ignore_wit: bool = False, only_files: bool = True
-) -> Set[Path]:
+def get_tracked_dirs(tracked: Iterable[str]) -> Set[str]:
+    """Returns all parent dirs of the given relative paths."""
+    dirpaths = set()
+    for rel_path in tracked:
+        cur_path = posixpath.dirname(rel_path)
+        while cur_path and cur_path not in dirpaths:
+            dirpaths.add(cur_path)
+            cur_path = posixpath.dirname(cur_path)
+    return dirpaths
+
+
+def scan_dir(
+    root: Path, rel_dir: str = "", only_files: bool = True, tracked: Collection[str] = ()
+) -> Iterator[Tuple[str, os.DirEntry]]:
+    """Walks a directory using `os.scandir`, and yields the relative path (using forward slashes)
+    and the DirEntry of all files and dirs (default: only files). 
+    Paths are relative to `root`, and the walk may start in a dir under it (`rel_dir`).
+
+    `.swit` dirs and paths ignored by `.switignore` files are pruned before descending, 
+    so the cost of a scan depends only on the working tree, and not on the history 
+    stored under `.swit` or on ignored build outputs. Tracked paths are never ignored:
+    an ignored dir that holds tracked files is walked, but only its tracked files are yielded.
+    """
+    rules, is_rel_dir_ignored = ignore.get_rules_of(root, rel_dir)
+    tracked_dirs = get_tracked_dirs(tracked)
+    if is_rel_dir_ignored and rel_dir not in tracked_dirs:
+        return
+    start = os.path.join(root, rel_dir)
+    pending = [(f"{rel_dir}/" if rel_dir else "", start, rules, is_rel_dir_ignored)]
+    while pending:
+        prefix, dir_path, rules, is_dir_ignored = pending.pop()
+        with os.scandir(dir_path) as it:
+            dir_entries = list(it)
+        # The rules of the starting dir were loaded along with its parents'.
+        if dir_path != start and any(entry.name == ignore.IGNORE_FILE for entry in dir_entries):
+            rules += (ignore.load_rules(dir_path, prefix),)
+        for entry in dir_entries:
+            rel_path = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name == ".swit":
+                    continue
+                is_ignored = is_dir_ignored or ignore.is_ignored(rel_path, True, rules)
+                if is_ignored and rel_path not in tracked_dirs:
+                    continue
+                pending.append((rel_path + "/", entry.path, rules, is_ignored))
+                if only_files:
+                    continue
+            elif not entry.is_file():
+                continue
+            elif (is_dir_ignored or ignore.is_ignored(rel_path, False, rules)) and rel_path not in tracked:
+                continue
+            yield rel_path, entry
+
+
+def is_scanned(root: Path, rel_path: str) -> bool:
+    """Returns True if `scan_dir` would yield an untracked file, without walking the dirs around it:
+    no dir on its way is `.swit` or ignored, and the file itself isn't ignored.
+    """
+    rules = ()
+    base = ""
+    *dir_names, _ = rel_path.split("/")
+    for dir_name in dir_names:
+        rule = ignore.load_rules(os.path.join(root, base), base)
+        if rule is not None:
+            rules += (rule,)
+        base += dir_name + "/"
+        if dir_name == ".swit" or ignore.is_ignored(base[:-1], True, rules):
+            return False
+    rule = ignore.load_rules(os.path.join(root, base), base)
+    if rule is not None:
+        rules += (rule,)
+    return not ignore.is_ignored(rel_path, False, rules)
+
+
+def get_relpaths(p: Path, only_files: bool = True, tracked: Collection[str] = ()) -> Set[str]:
     """Get the relative path of all files and dirs (default: only files), 
     starting from a given directory.
-    The relative path should be identical within the repo, 
-    staging_area, and the image dir.
-    `ignore_wit` is True when used on the repository.
+    The relative path should be identical within the repo and the index.
+    """
+    return {rel_path for rel_path, _ in scan_dir(p, only_files=only_files, tracked=tracked)}
+
+
+def get_rel_path(abs_path: Path) -> str:
+    """Returns the path relative to the repository, using forward slashes.
+    The repository itself is an empty string.
     """
-    entries = set(p.rglob("*"))
-    if ignore_wit:
-        entries.remove(path_to.wit_repo)
-        entries = entries - set(p.rglob("*.swit/**/*"))
+    rel_path = abs_path.relative_to(path_to.repo).as_posix()
+    return "" if rel_path == "." else rel_path
 
-    if only_files:
-        return {x.relative_to(p) for x in entries if x.is_file()}
 
-    return {x.relative_to(p) for x in entries}
+def get_repo_paths(user_paths: List[str]) -> List[str]:
+    """Returns the given paths relative to the repository. They don't have to exist (e.g. deleted files)."""
+    rel_paths = []
+    for path in user_paths:
+        try:
+            rel_paths.append(get_rel_path(Path(os.path.abspath(path))))
+        except ValueError:
+            raise ValueError(f"'{path}' is outside the repository.")
+    # The repository itself limits nothing:
+    return [] if "" in rel_paths else rel_paths
 
 
-def get_valid_commit_path(commit_id: str, image_indicator: str) -> Tuple[str, Path]:
-    """Returns the path to the image dir, based on the user input (branch or commit id).
-    If the dir does not exist, it means the user's input is problematic, 
+def get_valid_commit_tree(commit_id: str, image_indicator: str) -> str:
+    """Returns the tree id of the image, based on the user input (branch or commit id).
+    If the image does not exist, it means the user's input is problematic, 
     and a CommitIdError is thrown.
     """
-    dir_path = path_to.images / commit_id
-    if not dir_path.exists():
+    if not get_metadata_path(commit_id).exists():
         raise CommitIdError(f"'{image_indicator}' is not a branch name, nor a commit id.")
-    return dir_path
+    return get_commit_tree(commit_id)
+
+
+# Commits:
+
+# Parsed commits kept in memory; the cache starts over once it's full.
+METADATA_CACHE_SIZE = 65536
+_metadata_cache: Dict[str, Dict[str, str]] = {}
+
+
+def get_metadata_path(commit_id: str) -> Path:
+    return path_to.images / f"{commit_id}.txt"
+
+
+def get_commit_metadata(commit_id: str) -> Dict[str, str]:
+    """Parses the metadata file of a commit.
+    The message is always last, and may span multiple lines.
+    Example: {'tree': '4b825d...', 'parent': '6462de...', 'date': '...', 'message': 'I like trains.'}
+
+    A commit never changes once it points to a tree, so it's parsed only once per process.
+    """
+    metadata_path = str(get_metadata_path(commit_id))
+    cached = _metadata_cache.get(metadata_path)
+    if cached is not None:
+        return dict(cached)
+    metadata = parse_metadata(Path(metadata_path).read_text())
+    if metadata.get("tree"):
+        if len(_metadata_cache) >= METADATA_CACHE_SIZE:
+            _metadata_cache.clear()
+        _metadata_cache[metadata_path] = metadata
+    return dict(metadata)
+
+
+def parse_metadata(content: str) -> Dict[str, str]:
+    metadata = {}
+    while content:
+        line, _, rest = content.partition("\n")
+        key, _, value = line.partition("=")
+        if key == "message":
+            metadata[key] = content.partition("=")[2]
+            break
+        metadata[key] = value
+        content = rest
+    return metadata
+
+
+def get_commit_tree(commit_id: str) -> str:
+    """Returns the id of the tree that a commit points to.
+    Images committed before the object store existed are plain dirs; 
+    their content is added to the store on the fly.
+    """
+    tree_id = get_commit_metadata(commit_id).get("tree")
+    if tree_id:
+        return tree_id
+    return objects.write_tree_from_dir(path_to.images / commit_id)
 
 
 # Commit Id:
 
-def generate_commit_id(id_length: int = 40) -> str:
-    """Creates a random string using 0-9a-f, of a certain length."""
-    chars = "1234567890abcdef"
-    return "".join(random.choice(chars) for _ in range(id_length))
+# The start of a commit id, e.g. `3fa9c1`; like Git, at least 4 digits are needed.
+ID_PREFIX = re.compile(r"[0-9a-f]{4,39}")
+
+
+def hash_commit(metadata: str) -> str:
+    """A commit's id is the hash of its metadata, the same way every object's id is the hash of its content:
+    the same snapshot, with the same parents, date and message, always gets the same id,
+    and the metadata can be checked against it.
+    """
+    return objects.hash_object("commit", metadata.encode())
 
 
 def resolve_commit_id(user_input: str) -> str:
-    """Returns a commit id, whether if the param passed was a branch name or the commit id itself."""
+    """Returns a commit id, whether if the param passed was a branch name, the commit id itself,
+    or the start of a commit id (found by a binary search over the sorted ids of the commit graph).
+    If the start of the id matches a few commits, a CommitIdError is raised.
+    """
     branch_commit_id = get_commit_id_of_branch(user_input)
-    return branch_commit_id or user_input
+    if branch_commit_id:
+        return branch_commit_id
+    if ID_PREFIX.fullmatch(user_input):
+        matches = commit_graph.find_prefix(user_input)
+        if len(matches) > 1:
+            raise CommitIdError(f"'{user_input}' is ambiguous: {len(matches)} commit ids start with it.")
+        if matches:
+            return matches[0]
+    return user_input
 
 
 def get_head_id() -> str:
     """Returns the commit id of HEAD."""
-    lines = path_to.references.read_text().split("\n")
-    name, _, head_id = lines[0].partition("=")
+    name, head_id = read_references()[0]
     return head_id
 
 
@@ -71,53 +229,66 @@ def get_parent() -> Optional[str]:
 # Files:
 
 
-def copy_changed_files(
-    path_from: Path, path_to: Path, changed_files: Set[Path], replace: bool = False
-) -> None:
-    """Copies specified files from dir1 into dir2. If the files have parent folders, the dir hierarchy will
-    be preserved. replace=True is used when the file already exists, so that the dir2 version shall
-    be deleted.
-    Doesn't support moving, renaming or deleting files, yet.
-
-    - When called from `checkout()`, replaces all of the committed files in the repository with their 
-    version in the specified commit id (untracked files remain unchanged);
-    - When called from `merge()`, replaces or adds files in staging_area with files that were either 
-    changed or added since the common base dir until the user input dir.
-    """
-    for fp in changed_files:
-        source = path_from / fp
-        dest = path_to / fp
-        hierarchy = dest.parent
-        if not hierarchy.exists():
-            hierarchy.mkdir(parents=True)
-        if replace:
-            dest.unlink()  # originally os.remove
-        shutil.copy2(source, hierarchy)
-
-
 def get_files_with_different_content(
-    path_to_dir1: Path, path_to_dir2: Path, mutual_files: Set[Path]
-) -> Set[Path]:
-    """Joins the relative path of each file and compares its content.
+    dir_path: Path, entries: Dict[str, IndexEntry], mutual_files: Set[str], refresh: bool = False
+) -> Set[str]:
+    """Joins the relative path of each file and compares it to the indexed one.
     Returns a list of filepaths with different content.
-    Mutual files are files that appear in both dirs.
+    Mutual files are files that appear both in the dir and in the index.
 
-    - When called through `status()`, gets files from the repository and from staging area, 
-    thus returning changes not staged for commit;
-    - When called through `merge()`, gets files from the branch or commit id the user has 
-    entered, and the first mutual parent of the latter and of HEAD.
+    Files whose stat info still matches the index are reported clean without being opened;
+    only the rest are hashed, on a pool of threads. If `refresh` is True, entries of files that turned out
+    to be clean get their stat info updated, so they won't be hashed next time.
+
+    - When called through `status()`, gets files from the repository, 
+    thus returning changes not staged for commit.
     """
+    index_mtime_ns = index.get_mtime_ns()
     files_with_different_content = set()
-    for fp in mutual_files:
-        p1 = path_to_dir1 / fp
-        p2 = path_to_dir2 / fp
-        if not cmp(p1, p2):
-            files_with_different_content.add(fp)
+    files_to_hash = []
+    for rel_path in mutual_files:
+        entry = entries[rel_path]
+        st = os.stat(dir_path / rel_path)
+        if index.is_stat_clean(entry, st, index_mtime_ns):
+            continue
+        if entry.mode != objects.get_file_mode(st.st_mode) or (entry.mtime_ns and entry.size != st.st_size):
+            files_with_different_content.add(rel_path)
+        else:
+            files_to_hash.append((rel_path, st))
+
+    def hash_file(item: Tuple[str, os.stat_result]) -> str:
+        return objects.hash_file(dir_path / item[0])
+
+    for (rel_path, st), object_id in run_parallel(hash_file, files_to_hash):
+        if object_id != entries[rel_path].object_id:
+            files_with_different_content.add(rel_path)
+        elif refresh:
+            entries[rel_path] = index.new_entry(rel_path, st, object_id)
     return files_with_different_content
 
 
 # Branches:
 
+_refs_cache: Dict[str, Tuple[Tuple[int, int], List[Tuple[str, str]]]] = {}
+
+
+def read_references() -> List[Tuple[str, str]]:
+    """Returns the name and commit id of every line of references.txt: HEAD first, then the branches.
+    The file is parsed again only if it changed since the last read.
+    Raises FileNotFoundError before the first commit.
+    """
+    st = os.stat(path_to.references)
+    signature = (st.st_size, st.st_mtime_ns)
+    cached = _refs_cache.get(str(path_to.references))
+    if cached and cached[0] == signature:
+        return cached[1]
+    refs = [
+        tuple(line.strip().partition("=")[::2])
+        for line in path_to.references.read_text().split("\n") if line.strip()
+    ]
+    _refs_cache[str(path_to.references)] = (signature, refs)
+    return refs
+
 
 def get_active_branch_name() -> str:
     """Returns the content of `activated.txt`."""
@@ -159,16 +330,46 @@ def get_commit_id_of_branch(user_input: str) -> str:
     else, returns an empty string (may happen if the user used a
     commit_id as a parameter).
     """
-    lines = path_to.references.read_text().split("\n")
-    for line in lines:
-        branch_name, _, commit_id = line.partition("=")
+    for branch_name, commit_id in read_references():
         if branch_name == user_input:
-            return commit_id.strip()
+            return commit_id
     return ""
 
 
+def is_reference_name(user_input: str) -> bool:
+    """Returns True if the user passed a branch name (or HEAD) rather than a commit id.
+    A branch named with hex chars may also be the start of a commit id, so the references are what tells.
+    """
+    return any(name == user_input for name, _ in read_references())
+
+
+def get_ref_names() -> Dict[str, List[str]]:
+    """Returns the names pointing at each commit id: HEAD, and branch names.
+    Example: {'123': ['HEAD -> master'], '234': ['feature']}
+    """
+    refs = read_references()
+    head_id = refs[0][1]
+    active_branch = get_active_branch_name() if path_to.active_branch.exists() else ""
+    is_on_active_branch = (active_branch, head_id) in refs
+    names = {}
+    for name, commit_id in refs:
+        if name == "HEAD" and is_on_active_branch:
+            name = f"HEAD -> {active_branch}"
+        elif name == active_branch and is_on_active_branch:
+            continue
+        names.setdefault(commit_id, []).append(name)
+    return names
+
+
 def initiate_references_file(commit_id: str) -> None:
     path_to.references.write_text(f"HEAD={commit_id}\nmaster={commit_id}\n")
+    _refs_cache.pop(str(path_to.references), None)
+
+
+def add_reference(name: str, commit_id: str) -> None:
+    with open(path_to.references, "a") as f:
+        f.write(f"{name}={commit_id}\n")
+    _refs_cache.pop(str(path_to.references), None)
 
 
 def should_change_active_branch(
@@ -221,3 +422,23 @@ def handle_references_file(commit_id: str, is_merge: bool = False) -> None:
     )
     lines = update_branches(commit_id, active_branch_index, lines, change_active_branch)
     path_to.references.write_text("".join(lines))
+    # HEAD may have moved without changing the size of the file, within the same tick of its mtime:
+    _refs_cache.pop(str(path_to.references), None)
+
+
+# Background processes:
+
+def start_in_background(command: str, is_running: Callable[[], bool], timeout: float) -> bool:
+    """Starts `Swit <command> run` as a background process in the repository, and waits until it answers.
+    Returns False if it exited, or didn't answer in time.
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-m", "Swit.Switter", command, "run"], cwd=path_to.repo, start_new_session=True,
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + timeout
+    while not is_running():
+        if process.poll() is not None or time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
@@ -0,0 +1,180 @@
+import os
+import posixpath
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Pattern, Tuple
+
+
+IGNORE_FILE = ".switignore"
+
+
+class IgnoreRules(NamedTuple):
+    """The compiled patterns of a single `.switignore` file.
+    `base` is the relative path of its dir (with a trailing slash, or empty for the repository).
+    Each regex is an alternation of all patterns, last pattern first, so that the first
+    alternative to match is the one that wins; `negations` tells if it was a `!` pattern.
+    """
+    base: str
+    file_regex: Optional[Pattern]
+    file_negations: Tuple[bool, ...]
+    dir_regex: Optional[Pattern]
+    dir_negations: Tuple[bool, ...]
+
+
+# Compiling:
+
+def _translate_bracket(pattern: str, i: int) -> Tuple[str, int]:
+    """Translates a `[...]` expression starting at index i. Returns the regex and the index after it."""
+    j = i + 1
+    if j < len(pattern) and pattern[j] in "!^":
+        j += 1
+    if j < len(pattern) and pattern[j] == "]":
+        j += 1
+    j = pattern.find("]", j)
+    if j == -1:
+        return re.escape("["), i + 1
+    content = pattern[i + 1:j].replace("\\", "\\\\")
+    if content[0] in "!^":
+        content = "^" + content[1:]
+    return f"[{content}]", j + 1
+
+
+def translate(pattern: str) -> str:
+    """Translates a single gitignore pattern (without `!` and trailing slash) into a regex,
+    which is matched against a path relative to the dir of the `.switignore` file.
+    Patterns without a slash match a name at any depth.
+    """
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/"):
+            if pattern.startswith("/", i + 2):
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if i + 2 == len(pattern):
+                out.append(".*")
+                i += 2
+                continue
+        if c == "*":
+            out.append("[^/]*")
+            while pattern.startswith("*", i + 1):
+                i += 1
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            bracket, i = _translate_bracket(pattern, i)
+            out.append(bracket)
+            continue
+        elif c == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 1
+        else:
+            out.append(re.escape(c))
+        i += 1
+    body = "".join(out)
+    return body if anchored else "(?:.*/)?" + body
+
+
+def parse_line(line: str) -> Optional[Tuple[str, bool, bool]]:
+    """Returns the regex of a line, and whether it's negated and matches only dirs.
+    Returns None for blank lines and comments.
+    """
+    if line.startswith("#"):
+        return None
+    stripped = line.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(line):
+        stripped += " "
+    if not stripped:
+        return None
+    negate = stripped.startswith("!")
+    if negate:
+        stripped = stripped[1:]
+    dir_only = stripped.endswith("/")
+    stripped = stripped.rstrip("/")
+    if not stripped:
+        return None
+    return translate(stripped), negate, dir_only
+
+
+def _combine(patterns: List[Tuple[str, bool]]) -> Tuple[Optional[Pattern], Tuple[bool, ...]]:
+    if not patterns:
+        return None, ()
+    patterns = patterns[::-1]
+    regex = re.compile("|".join(f"({p})" for p, _ in patterns), re.DOTALL)
+    return regex, tuple(negate for _, negate in patterns)
+
+
+@lru_cache(maxsize=None)
+def _compile(path: str, base: str, mtime_ns: int, size: int) -> IgnoreRules:
+    """Compiles an ignore file. Cached by its stat info, so each file is compiled once per invocation."""
+    file_patterns = []
+    dir_patterns = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f.read().splitlines():
+            parsed = parse_line(line)
+            if parsed is None:
+                continue
+            regex, negate, dir_only = parsed
+            dir_patterns.append((regex, negate))
+            if not dir_only:
+                file_patterns.append((regex, negate))
+    return IgnoreRules(base, *_combine(file_patterns), *_combine(dir_patterns))
+
+
+def load_rules(dir_path: str, base: str) -> Optional[IgnoreRules]:
+    """Returns the compiled rules of the `.switignore` file in the dir, if there is one."""
+    path = os.path.join(dir_path, IGNORE_FILE)
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return _compile(path, base, st.st_mtime_ns, st.st_size)
+
+
+# Matching:
+
+def is_ignored(rel_path: str, is_dir: bool, rules: Tuple[IgnoreRules, ...]) -> bool:
+    """Returns True if a path (relative to the repository) is ignored.
+    `rules` are ordered from the repository down, and deeper files take precedence.
+    """
+    for rule in reversed(rules):
+        regex, negations = (
+            (rule.dir_regex, rule.dir_negations) if is_dir
+            else (rule.file_regex, rule.file_negations)
+        )
+        if regex is None:
+            continue
+        match = regex.fullmatch(rel_path[len(rule.base):])
+        if match:
+            return not negations[match.lastindex - 1]
+    return False
+
+
+def get_rules_of(repo: Path, rel_dir: str) -> Tuple[Tuple[IgnoreRules, ...], bool]:
+    """Loads the rules of the repository and of every dir down to `rel_dir` (including).
+    Returns them, and whether `rel_dir` itself (or one of its parents) is ignored.
+    """
+    rules = ()
+    base = ""
+    parts = [part for part in rel_dir.split("/") if part]
+    for i in range(len(parts) + 1):
+        rule = load_rules(os.path.join(repo, base), base)
+        if rule is not None:
+            rules += (rule,)
+        if i == len(parts):
+            break
+        base = posixpath.join(base, parts[i]) + "/"
+        if is_ignored(base[:-1], True, rules):
+            return rules, True
+    return rules, False
+
+
+def is_path_ignored(repo: Path, rel_path: str, is_dir: bool) -> bool:
+    """Returns True if a single path is ignored, by itself or by one of its parent dirs."""
+    rules, is_parent_ignored = get_rules_of(repo, posixpath.dirname(rel_path))
+    return is_parent_ignored or is_ignored(rel_path, is_dir, rules)
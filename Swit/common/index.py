@@ -0,0 +1,477 @@
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, Mapping, NamedTuple, Optional, Tuple
+
+import Swit.common.objects as objects
+import Swit.common.paths as path_to
+
+
+# The index is a single binary file, sorted by path:
+#   header:  magic, version, number of entries
+#   offsets: the offset of each entry from the start of the file
+#   entries: mode, size, mtime, ctime, inode, content hash, path length, path
+#   trees:   number of trees, then the tree id, path length and path of each cached dir (version 2)
+# The offsets table allows a binary search over a memory map of the file.
+MAGIC = b"SWIX"
+VERSION = 2
+HEADER = struct.Struct(">4sII")
+OFFSET = struct.Struct(">I")
+ENTRY = struct.Struct(">IQQQQ20sH")
+TREE = struct.Struct(">20sH")
+
+_cache: Dict[str, Tuple[Tuple[int, int, int], "IndexEntries"]] = {}
+
+
+class IndexEntry(NamedTuple):
+    path: str
+    mode: str
+    size: int
+    mtime_ns: int
+    ctime_ns: int
+    ino: int
+    object_id: str
+
+
+class IndexEntries(dict):
+    """The entries of the index by path, along with the tree id of every dir whose entries didn't change
+    since its tree was last written (the "cache tree"; the repository itself is "").
+    Changing an entry drops the cached trees of the dirs that contain it, so the trees of unchanged dirs
+    are reused when writing a tree, and are equal to the trees of HEAD when nothing was staged under them.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, IndexEntry]] = None, trees: Optional[Dict[str, str]] = None):
+        super().__init__(entries or {})
+        self.trees = trees or {}
+
+    def invalidate(self, rel_path: str) -> None:
+        names = rel_path.split("/")
+        for i in range(len(names)):
+            self.trees.pop("/".join(names[:i]), None)
+
+    def __setitem__(self, rel_path: str, entry: IndexEntry) -> None:
+        old = self.get(rel_path)
+        if old is None or (old.mode, old.object_id) != (entry.mode, entry.object_id):
+            self.invalidate(rel_path)
+        super().__setitem__(rel_path, entry)
+
+    def __delitem__(self, rel_path: str) -> None:
+        super().__delitem__(rel_path)
+        self.invalidate(rel_path)
+
+    def pop(self, rel_path: str, *default):
+        if rel_path in self:
+            self.invalidate(rel_path)
+        return super().pop(rel_path, *default)
+
+    def update(self, *args, **kwargs) -> None:
+        for rel_path, entry in dict(*args, **kwargs).items():
+            self[rel_path] = entry
+
+    def clear(self) -> None:
+        super().clear()
+        self.trees.clear()
+
+
+def new_entry(rel_path: str, st: os.stat_result, object_id: str) -> IndexEntry:
+    """Creates an index entry for a file. `st` should be taken before the file was hashed,
+    so that a change made while hashing is never recorded as clean.
+    """
+    return IndexEntry(
+        rel_path, objects.get_file_mode(st.st_mode), st.st_size,
+        st.st_mtime_ns, st.st_ctime_ns, st.st_ino, object_id
+    )
+
+
+def is_stat_clean(entry: IndexEntry, st: os.stat_result, index_mtime_ns: int) -> bool:
+    """Returns True if a file is known to match its entry, without reading it.
+    A file that was modified in the same timestamp tick the index was written in
+    may have changed unnoticed ("racily clean"), so it's never trusted.
+    """
+    return (
+        entry.size == st.st_size
+        and entry.mtime_ns == st.st_mtime_ns
+        and entry.ctime_ns == st.st_ctime_ns
+        and entry.ino == st.st_ino
+        and entry.mode == objects.get_file_mode(st.st_mode)
+        and entry.mtime_ns < index_mtime_ns
+    )
+
+
+def get_mtime_ns() -> int:
+    try:
+        return os.stat(path_to.index).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def stage_file(fp: Path, rel_path: str) -> IndexEntry:
+    """Stores the content of a file, and returns its entry."""
+    st = os.stat(fp)
+    return new_entry(rel_path, st, objects.write_blob(fp))
+
+
+# Reading:
+
+def _sort_key(rel_path: str) -> bytes:
+    return rel_path.encode()
+
+
+def _unpack_entry(data, offset: int) -> IndexEntry:
+    mode, size, mtime_ns, ctime_ns, ino, digest, path_len = ENTRY.unpack_from(data, offset)
+    start = offset + ENTRY.size
+    rel_path = bytes(data[start:start + path_len]).decode()
+    return IndexEntry(rel_path, f"{mode:o}", size, mtime_ns, ctime_ns, ino, digest.hex())
+
+
+def _parse(data) -> IndexEntries:
+    magic, version, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version not in (1, VERSION):
+        raise ValueError(f"'{path_to.index}' is not a swit index file.")
+    entries = {}
+    end = HEADER.size
+    for (offset,) in struct.iter_unpack(">I", data[HEADER.size:HEADER.size + count * OFFSET.size]):
+        entry = _unpack_entry(data, offset)
+        entries[entry.path] = entry
+    if entries:
+        end = offset + ENTRY.size + ENTRY.unpack_from(data, offset)[-1]
+    # Indexes written before trees were cached have none:
+    trees = _parse_trees(data, end) if version == VERSION else {}
+    return IndexEntries(entries, trees)
+
+
+def _parse_trees(data, offset: int) -> Dict[str, str]:
+    (count,) = OFFSET.unpack_from(data, offset)
+    offset += OFFSET.size
+    trees = {}
+    for _ in range(count):
+        digest, path_len = TREE.unpack_from(data, offset)
+        start = offset + TREE.size
+        trees[bytes(data[start:start + path_len]).decode()] = digest.hex()
+        offset = start + path_len
+    return trees
+
+
+def _get_signature(st: os.stat_result) -> Tuple[int, int, int]:
+    # The index is replaced rather than changed, so a new index is a new inode.
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def _copy(entries: Dict[str, IndexEntry]) -> IndexEntries:
+    return IndexEntries(entries, dict(getattr(entries, "trees", {})))
+
+
+def read_index() -> IndexEntries:
+    """Loads all entries of the index with a single read, sorted by path, along with its cached trees.
+    An index that doesn't exist yet is empty.
+    The last index that was read or written is kept in memory (e.g. by the server, between commands),
+    and is parsed again only if the file changed; every caller gets its own copy.
+    """
+    try:
+        st = os.stat(path_to.index)
+    except FileNotFoundError:
+        if path_to.staging_area.exists():
+            return _upgrade_staging_area()
+        return IndexEntries()
+    cached = _cache.get(str(path_to.index))
+    if cached and cached[0] == _get_signature(st):
+        return _copy(cached[1])
+    entries = _parse(path_to.index.read_bytes())
+    _cache[str(path_to.index)] = (_get_signature(st), _copy(entries))
+    return entries
+
+
+def _offset_at(data, i: int) -> int:
+    return OFFSET.unpack_from(data, HEADER.size + i * OFFSET.size)[0]
+
+
+def _key_at(data, i: int) -> bytes:
+    offset = _offset_at(data, i)
+    path_len = ENTRY.unpack_from(data, offset)[-1]
+    start = offset + ENTRY.size
+    return bytes(data[start:start + path_len])
+
+
+def _bisect(data, count: int, key: bytes) -> int:
+    """Returns the position of the first entry whose path isn't lower than the key."""
+    low, high = 0, count
+    while low < high:
+        mid = (low + high) // 2
+        if _key_at(data, mid) < key:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+def find_entry(rel_path: str) -> Optional[IndexEntry]:
+    """Looks up a single path, using a binary search over a memory map of the index."""
+    if not path_to.index.exists():
+        return None
+    key = _sort_key(rel_path)
+    with open(path_to.index, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        _, _, count = HEADER.unpack_from(data)
+        i = _bisect(data, count, key)
+        if i < count and _key_at(data, i) == key:
+            return _unpack_entry(data, _offset_at(data, i))
+    return None
+
+
+class IndexFile(Mapping):
+    """A read-only view of the index, which is parsed only as far as it's needed:
+    single paths are found by a binary search over a memory map of the file, and the cached trees are read from its end.
+    All entries are parsed the first time they are all needed (e.g. to walk the repository).
+    The memory map stays open until `close` is called (or the `with` block the view was opened in ends);
+    long-running processes, like the server, must close every view they open.
+    """
+
+    def __init__(self):
+        self._data = None
+        self._count = 0
+        self._entries: Optional[IndexEntries] = None
+        self.trees = {}
+        if not path_to.index.exists():
+            # An empty index, or an older repository's staging area:
+            self._entries = read_index()
+            self._count = len(self._entries)
+            self.trees = self._entries.trees
+            return
+        with open(path_to.index, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count = HEADER.unpack_from(self._data)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f"'{path_to.index}' is not a swit index file.")
+        if version == VERSION:
+            end = HEADER.size
+            if self._count:
+                offset = _offset_at(self._data, self._count - 1)
+                end = offset + ENTRY.size + ENTRY.unpack_from(self._data, offset)[-1]
+            self.trees = _parse_trees(self._data, end)
+
+    def __enter__(self) -> "IndexFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Unmaps the file. Entries that were already loaded can still be read."""
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    def load(self) -> IndexEntries:
+        if self._entries is None:
+            self._entries = read_index()
+        return self._entries
+
+    def __getitem__(self, rel_path: str) -> IndexEntry:
+        if self._entries is not None:
+            return self._entries[rel_path]
+        key = _sort_key(rel_path)
+        i = _bisect(self._data, self._count, key)
+        if i < self._count and _key_at(self._data, i) == key:
+            return _unpack_entry(self._data, _offset_at(self._data, i))
+        raise KeyError(rel_path)
+
+    def __contains__(self, rel_path) -> bool:
+        try:
+            self[rel_path]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.load())
+
+    def __len__(self) -> int:
+        return self._count
+
+    def values(self):
+        return self.load().values()
+
+    def items(self):
+        return self.load().items()
+
+    def has_dir(self, rel_dir: str) -> bool:
+        """Returns True if a dir holds tracked files."""
+        return next(self.paths_under(rel_dir), None) is not None
+
+    def paths_under(self, rel_dir: str) -> Iterator[str]:
+        """Yields the paths of the entries under a dir, in order."""
+        prefix = _sort_key(rel_dir + "/")
+        if self._data is None:
+            yield from sorted(p for p in self.load() if _sort_key(p).startswith(prefix))
+            return
+        for i in range(_bisect(self._data, self._count, prefix), self._count):
+            key = _key_at(self._data, i)
+            if not key.startswith(prefix):
+                return
+            yield key.decode()
+
+
+# Writing:
+
+def _pack(entries: Dict[str, IndexEntry]) -> bytes:
+    sorted_entries = sorted(entries.values(), key=lambda e: _sort_key(e.path))
+    offsets = []
+    body = []
+    position = HEADER.size + len(sorted_entries) * OFFSET.size
+    for e in sorted_entries:
+        encoded_path = e.path.encode()
+        packed = ENTRY.pack(
+            int(e.mode, 8), e.size, e.mtime_ns, e.ctime_ns, e.ino,
+            bytes.fromhex(e.object_id), len(encoded_path)
+        ) + encoded_path
+        offsets.append(OFFSET.pack(position))
+        body.append(packed)
+        position += len(packed)
+
+    trees = getattr(entries, "trees", {})
+    body.append(OFFSET.pack(len(trees)))
+    for rel_dir, tree_id in sorted(trees.items()):
+        encoded_path = rel_dir.encode()
+        body.append(TREE.pack(bytes.fromhex(tree_id), len(encoded_path)) + encoded_path)
+
+    return b"".join([HEADER.pack(MAGIC, VERSION, len(sorted_entries)), *offsets, *body])
+
+
+def _smudge_racy(entries: Dict[str, IndexEntry], written_ns: int) -> Optional[IndexEntries]:
+    """Entries of files modified in the same tick the index is written in can't be trusted by their stat info:
+    the file may change again in that tick, and look clean once a later write gives the index a newer mtime.
+    Returns a copy of the entries with their mtime cleared (so they're always read again, like unstated ones),
+    or None if there are none.
+    """
+    racy = [e for e in entries.values() if e.mtime_ns >= written_ns]
+    if not racy:
+        return None
+    smudged = _copy(entries)
+    for e in racy:
+        smudged[e.path] = e._replace(mtime_ns=0)
+    return smudged
+
+
+def write_index(entries: Dict[str, IndexEntry]) -> None:
+    """Replaces the index with the given entries (and their cached trees, if they have any).
+    The file is written aside and renamed into place, so readers never see a partial index.
+    Racily clean entries are smudged (see `_smudge_racy`), and written again.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path_to.wit_repo, prefix="index_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_pack(entries))
+            f.flush()
+            smudged = _smudge_racy(entries, os.fstat(f.fileno()).st_mtime_ns)
+            if smudged is not None:
+                entries = smudged
+                f.seek(0)
+                f.write(_pack(entries))
+        os.replace(tmp, path_to.index)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    _cache[str(path_to.index)] = (_get_signature(os.stat(path_to.index)), _copy(entries))
+
+
+def entries_from_tree(tree_id: str) -> Dict[str, IndexEntry]:
+    """Creates index entries for all files of a tree, as they were just written to the repository."""
+    entries = {}
+    for rel_path, (mode, object_id) in objects.flatten_tree(tree_id).items():
+        entries[rel_path] = new_entry(rel_path, os.stat(path_to.repo / rel_path), object_id)
+    return entries
+
+
+def unstated_entry(rel_path: str, mode: str, object_id: str) -> IndexEntry:
+    """An entry for content that was never written to the repository.
+    It will never match the file in the repository by its stat info alone.
+    """
+    return IndexEntry(rel_path, mode, 0, 0, 0, 0, object_id)
+
+
+def _build_nodes(entries: Mapping[str, IndexEntry]) -> Dict:
+    """Nests the entries by dir: each dir is a dict of its files' entries and its subdirs' dicts."""
+    root = {}
+    for e in entries.values():
+        *dir_names, name = e.path.split("/")
+        node = root
+        for dir_name in dir_names:
+            node = node.setdefault(dir_name, {})
+        node[name] = e
+    return root
+
+
+def write_tree(entries: IndexEntries) -> str:
+    """Stores a tree object for every dir in the index, and returns the id of the root tree.
+    All blobs are already stored by `add`, so no file is read.
+    The trees of dirs that didn't change since they were last written are reused without being built again,
+    and the new ones are cached in `entries.trees` (they are saved by writing the index).
+    """
+    if "" in entries.trees:
+        return entries.trees[""]
+    return _write_node(_build_nodes(entries), "", entries.trees)
+
+
+def diff_tree(
+    tree_id: Optional[str], entries: Mapping[str, IndexEntry]
+) -> Dict[str, Tuple[Optional[Tuple[str, str]], Optional[Tuple[str, str]]]]:
+    """Same as `objects.diff_trees`, from a tree to the index, but nothing is stored (e.g. for a read-only status).
+    Dirs whose cached tree is the tree's subtree are skipped without being read, along with their entries.
+    """
+    trees = getattr(entries, "trees", {})
+    if tree_id is not None and trees.get("") == tree_id:
+        return {}
+    return _diff_node(_build_nodes(entries), "", tree_id, trees)
+
+
+def _diff_node(
+    node: Dict, rel_dir: str, tree_id: Optional[str], trees: Dict[str, str]
+) -> Dict[str, Tuple[Optional[Tuple[str, str]], Optional[Tuple[str, str]]]]:
+    if tree_id is not None and trees.get(rel_dir) == tree_id:
+        return {}
+    tree_entries = {e.name: e for e in objects.read_tree(tree_id)} if tree_id else {}
+    changes = {}
+    for name in node.keys() | tree_entries.keys():
+        child, tree_entry = node.get(name), tree_entries.get(name)
+        rel_path = f"{rel_dir}/{name}" if rel_dir else name
+        subtree = tree_entry.object_id if tree_entry and tree_entry.mode == objects.DIR_MODE else None
+        if isinstance(child, dict):
+            changes.update(_diff_node(child, rel_path, subtree, trees))
+        elif subtree:
+            changes.update(objects.diff_trees(subtree, None, rel_path + "/"))
+        old_file = (tree_entry.mode, tree_entry.object_id) if tree_entry and not subtree else None
+        new_file = (child.mode, child.object_id) if child is not None and not isinstance(child, dict) else None
+        if old_file != new_file:
+            changes[rel_path] = (old_file, new_file)
+    return changes
+
+
+def _write_node(node: Dict, rel_dir: str, trees: Dict[str, str]) -> str:
+    if rel_dir in trees:
+        return trees[rel_dir]
+    tree_entries = []
+    for name, child in node.items():
+        if isinstance(child, dict):
+            sub_dir = f"{rel_dir}/{name}" if rel_dir else name
+            tree_entries.append(objects.TreeEntry(objects.DIR_MODE, name, _write_node(child, sub_dir, trees)))
+        else:
+            tree_entries.append(objects.TreeEntry(child.mode, name, child.object_id))
+    trees[rel_dir] = objects.write_tree(tree_entries)
+    return trees[rel_dir]
+
+
+def _upgrade_staging_area() -> IndexEntries:
+    """Repositories created before the index existed keep a full copy of the staged files
+    under `staging_area`. Their content is moved into the store and the copy is removed.
+    """
+    entries = IndexEntries()
+    for fp in path_to.staging_area.rglob("*"):
+        if fp.is_file():
+            rel_path = fp.relative_to(path_to.staging_area).as_posix()
+            mode = objects.get_file_mode(fp.stat().st_mode)
+            entries[rel_path] = unstated_entry(rel_path, mode, objects.write_blob(fp))
+    write_index(entries)
+    shutil.rmtree(path_to.staging_area)
+    return entries
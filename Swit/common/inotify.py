@@ -0,0 +1,86 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+from typing import Iterator, NamedTuple
+
+
+# Linux's inotify, through libc. See `man 7 inotify`.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# wd, mask, cookie, length of the name that follows (padded with NULs).
+EVENT = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+
+class Event(NamedTuple):
+    wd: int
+    mask: int
+    name: str
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError(errno.ENOSYS, "inotify is only available on Linux.")
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class Inotify:
+    """A non-blocking inotify instance. Its fd can be waited on with `selectors`."""
+
+    def __init__(self):
+        self._libc = _load_libc()
+        self.fd = self._check(self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+
+    @staticmethod
+    def _check(result: int) -> int:
+        if result < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return result
+
+    def add_watch(self, path: str, mask: int) -> int:
+        return self._check(self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask))
+
+    def rm_watch(self, wd: int) -> None:
+        # The watch may already be gone along with its dir.
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> Iterator[Event]:
+        """Yields every event that is queued, without blocking."""
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_len = EVENT.unpack_from(data, offset)
+                start = offset + EVENT.size
+                name = os.fsdecode(data[start:start + name_len].rstrip(b"\0"))
+                offset = start + name_len
+                yield Event(wd, mask, name)
+
+    def close(self) -> None:
+        os.close(self.fd)
@@ -0,0 +1,177 @@
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict
+
+import Swit.common.config as config
+import Swit.common.paths as path_to
+
+
+# Ways to copy a file, fastest first. What the filesystem supports is detected once per repository,
+# and saved under the `[materialize]` section of `.swit/config`.
+METHODS = ("reflink", "copy_file_range", "sendfile")
+
+# From <linux/fs.h>: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# Errors that mean "this method can't be used here", rather than a real I/O failure.
+UNSUPPORTED = {
+    errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF,
+    errno.EOPNOTSUPP, errno.ENOTSUP, errno.ETXTBSY, errno.EPERM,
+}
+
+_capabilities: Dict[str, Dict[str, bool]] = {}
+_lock = threading.Lock()
+
+
+# Methods:
+
+def _reflink(src: BinaryIO, dest: BinaryIO, size: int) -> None:
+    """Shares the data blocks of the source (btrfs, xfs): instant, and no extra disk space."""
+    import fcntl
+    fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+
+
+def _copy_file_range(src: BinaryIO, dest: BinaryIO, size: int) -> None:
+    """Copies inside the kernel, which may offload the copy to the filesystem or the device."""
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(src.fileno(), dest.fileno(), size - copied)
+        if n == 0:
+            break
+        copied += n
+
+
+def _sendfile(src: BinaryIO, dest: BinaryIO, size: int) -> None:
+    """Copies inside the kernel, without passing the data through user space."""
+    copied = 0
+    while copied < size:
+        n = os.sendfile(dest.fileno(), src.fileno(), copied, size - copied)
+        if n == 0:
+            break
+        copied += n
+
+
+def _plain_copy(src: BinaryIO, dest: BinaryIO, size: int) -> None:
+    shutil.copyfileobj(src, dest, 1024 * 1024)
+
+
+_FUNCS = {
+    "reflink": _reflink,
+    "copy_file_range": _copy_file_range,
+    "sendfile": _sendfile,
+}
+
+
+# Detection:
+
+def _probe(method: str, dir_path: Path) -> bool:
+    if method == "reflink" and not sys.platform.startswith("linux"):
+        return False
+    if method == "copy_file_range" and not hasattr(os, "copy_file_range"):
+        return False
+    if method == "sendfile" and not hasattr(os, "sendfile"):
+        return False
+    with tempfile.TemporaryFile(dir=dir_path) as src, tempfile.TemporaryFile(dir=dir_path) as dest:
+        src.write(b"swit")
+        src.flush()
+        src.seek(0)
+        try:
+            _FUNCS[method](src, dest, 4)
+        except OSError:
+            return False
+        dest.seek(0)
+        return dest.read() == b"swit"
+
+
+def _probe_hardlink(dir_path: Path) -> bool:
+    with tempfile.TemporaryDirectory(dir=dir_path) as tmp:
+        src = Path(tmp) / "src"
+        src.write_bytes(b"swit")
+        try:
+            os.link(src, Path(tmp) / "dest")
+        except OSError:
+            return False
+        return True
+
+
+def get_capabilities() -> Dict[str, bool]:
+    """Returns which copy methods the filesystem of the repository supports.
+    Probed on first use, and saved to the config file so it's done once per repository.
+    """
+    key = str(path_to.wit_repo)
+    if key in _capabilities:
+        return _capabilities[key]
+    with _lock:
+        if key not in _capabilities:
+            _capabilities[key] = _detect_capabilities()
+    return _capabilities[key]
+
+
+def _detect_capabilities() -> Dict[str, bool]:
+    parser = config.read_config()
+    if parser.has_section("materialize"):
+        capabilities = {
+            name: parser.getboolean("materialize", name, fallback=False)
+            for name in (*METHODS, "hardlink")
+        }
+    else:
+        capabilities = {method: _probe(method, path_to.wit_repo) for method in METHODS}
+        capabilities["hardlink"] = _probe_hardlink(path_to.wit_repo)
+        for name, supported in capabilities.items():
+            config.set_value(f"materialize.{name}", str(supported).lower())
+    return capabilities
+
+
+# Copying:
+
+def copy_into(src_path: Path, dest: BinaryIO) -> None:
+    """Copies a file into an open, empty file, using the fastest supported method.
+    A method that fails for this specific pair of files (e.g. they're on different filesystems)
+    falls back to the next one; a plain copy is the last resort.
+    """
+    with open(src_path, "rb") as src:
+        copy_from(src, dest)
+
+
+def copy_from(src: BinaryIO, dest: BinaryIO) -> None:
+    """Same as `copy_into`, from a file that is already open. It's copied from its start."""
+    capabilities = get_capabilities()
+    size = os.fstat(src.fileno()).st_size
+    src.seek(0)
+    for method in METHODS:
+        if not capabilities[method]:
+            continue
+        try:
+            _FUNCS[method](src, dest, size)
+            return
+        except OSError as e:
+            if e.errno not in UNSUPPORTED:
+                raise
+            src.seek(0)
+            dest.seek(0)
+            dest.truncate()
+    _plain_copy(src, dest, size)
+
+
+def materialize(src_path: Path, dest: Path, mode: int, allow_hardlink: bool = False) -> None:
+    """Creates `dest` with the content of `src_path`, replacing it if it exists.
+    If `allow_hardlink` is True and hardlinks are enabled (`core.hardlinks`), a read-only source is linked
+    instead of copied; the file then shares its storage with the source, and stays read-only.
+    """
+    if dest.exists() or dest.is_symlink():
+        dest.unlink()
+    if allow_hardlink and config.get_bool("core.hardlinks") and get_capabilities()["hardlink"]:
+        try:
+            os.link(src_path, dest)
+            return
+        except OSError as e:
+            if e.errno not in UNSUPPORTED and e.errno != errno.EMLINK:
+                raise
+    with open(dest, "wb") as f:
+        copy_into(src_path, f)
+    os.chmod(dest, mode)
@@ -0,0 +1,286 @@
+import json
+import os
+import selectors
+import socket
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from loguru import logger
+
+import Swit.common.inotify as inotify
+import Swit.common.paths as path_to
+
+
+# The monitor is a background process that watches every dir of the repository with inotify,
+# and numbers the changes it sees. A token names a point in that sequence: `<instance>:<number>`.
+# `status` saves the token it got along with its results (`monitor-state`), and next time asks only
+# for the paths that changed since. A token of another instance (the monitor was restarted, or the
+# kernel's event queue overflowed) can't be answered, and the whole repository is scanned again.
+WATCH_MASK = (
+    inotify.IN_MODIFY | inotify.IN_ATTRIB | inotify.IN_CLOSE_WRITE | inotify.IN_CREATE | inotify.IN_DELETE
+    | inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF
+    | inotify.IN_ONLYDIR | inotify.IN_DONT_FOLLOW | inotify.IN_EXCL_UNLINK
+)
+# Seconds a client waits for the monitor, and the monitor for a client.
+TIMEOUT = 5
+
+
+class MonitorState(NamedTuple):
+    """What `status` found the last time it asked the monitor, and the token it got."""
+    token: str
+    not_staged: Set[str]
+    untracked: Set[str]
+
+
+# The monitor:
+
+class Monitor:
+    """Keeps a watch on every dir of the repository (but `.swit`), and the number of the last change
+    of every path that changed since it started. A dir that was removed or moved away is reported
+    by its own path; the files of a new dir are reported one by one.
+    """
+
+    def __init__(self, repo: Path):
+        self.repo = repo
+        self.inotify = inotify.Inotify()
+        self.running = True
+        self.reset()
+
+    @property
+    def token(self) -> str:
+        return f"{self.instance}:{self.count}"
+
+    def reset(self) -> None:
+        """Watches the repository from scratch. Tokens given before can no longer be answered."""
+        for wd in getattr(self, "dirs", {}):
+            self.inotify.rm_watch(wd)
+        self.dirs: Dict[int, str] = {}
+        self.wds: Dict[str, int] = {}
+        self.changes: Dict[str, int] = {}
+        self.count = 0
+        self.instance = f"{os.getpid()}-{time.time_ns()}"
+        self.watch_tree("", is_new=False)
+
+    def mark(self, rel_path: str) -> None:
+        self.count += 1
+        self.changes[rel_path] = self.count
+
+    def watch_tree(self, rel_dir: str, is_new: bool = True) -> None:
+        """Watches a dir and every dir under it. The watch of a dir is added before it's listed,
+        so a file created meanwhile is either listed or reported by an event.
+        If the dir is new, all of its content is marked as changed.
+        """
+        pending = [rel_dir]
+        while pending:
+            rel_dir = pending.pop()
+            dir_path = os.path.join(self.repo, rel_dir)
+            try:
+                wd = self.inotify.add_watch(dir_path, WATCH_MASK)
+                with os.scandir(dir_path) as it:
+                    dir_entries = list(it)
+            except (FileNotFoundError, NotADirectoryError):
+                # Removed since; its parent reported it.
+                continue
+            # A dir that was moved here before its old path's events were handled is already watched:
+            old_rel_dir = self.dirs.get(wd)
+            if old_rel_dir is not None and self.wds.get(old_rel_dir) == wd:
+                del self.wds[old_rel_dir]
+            self.dirs[wd] = rel_dir
+            self.wds[rel_dir] = wd
+            for entry in dir_entries:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name == ".swit":
+                        continue
+                    pending.append(rel_path)
+                if is_new:
+                    self.mark(rel_path)
+
+    def unwatch_tree(self, rel_dir: str) -> None:
+        for watched in [d for d in self.wds if d == rel_dir or d.startswith(rel_dir + "/")]:
+            wd = self.wds.pop(watched)
+            del self.dirs[wd]
+            self.inotify.rm_watch(wd)
+
+    def handle(self, event: inotify.Event) -> None:
+        if event.mask & inotify.IN_Q_OVERFLOW:
+            logger.warning(">>> Too many changes at once; watching the repository again.")
+            self.reset()
+            return
+        rel_dir = self.dirs.get(event.wd)
+        if rel_dir is None:
+            return
+        if event.mask & inotify.IN_IGNORED:
+            del self.dirs[event.wd]
+            if self.wds.get(rel_dir) == event.wd:
+                del self.wds[rel_dir]
+            return
+        if not event.name:
+            # An event of the watched dir itself; its parent reports the dir by name.
+            if rel_dir == "" and event.mask & (inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF):
+                self.running = False
+            return
+        if event.name == ".swit":
+            if rel_dir == "" and event.mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+                self.running = False
+            return
+        rel_path = f"{rel_dir}/{event.name}" if rel_dir else event.name
+        self.mark(rel_path)
+        if event.mask & inotify.IN_ISDIR:
+            if event.mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                self.watch_tree(rel_path)
+            elif event.mask & inotify.IN_MOVED_FROM:
+                self.unwatch_tree(rel_path)
+
+    def process_events(self) -> None:
+        for event in self.inotify.read_events():
+            self.handle(event)
+
+    def get_changes_since(self, token: str) -> Optional[List[str]]:
+        """Returns the paths that changed since a token was given, or None if it can't be told."""
+        instance, _, count = token.rpartition(":")
+        if instance != self.instance or not count.isdigit():
+            return None
+        since = int(count)
+        return [rel_path for rel_path, changed_at in self.changes.items() if changed_at > since]
+
+    def close(self) -> None:
+        self.inotify.close()
+
+
+def _read_request(conn: socket.socket) -> str:
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data.decode().strip()
+
+
+def _answer(monitor: Monitor, conn: socket.socket) -> None:
+    command, _, token = _read_request(conn).partition(" ")
+    if command == "query":
+        # Every change made before the request is already queued by the kernel:
+        monitor.process_events()
+        changes = monitor.get_changes_since(token)
+        kind = "full" if changes is None else "changes"
+        conn.sendall(f"{monitor.token}\n{kind}\n".encode() + b"\0".join(map(os.fsencode, changes or [])))
+    elif command == "ping":
+        conn.sendall(f"{len(monitor.dirs)} {len(monitor.changes)}\n".encode())
+    elif command == "stop":
+        monitor.running = False
+        conn.sendall(b"ok\n")
+
+
+def serve() -> None:
+    """Runs the monitor until it's stopped, or the repository is removed.
+    The socket is only created once the whole repository is watched.
+    """
+    monitor = Monitor(path_to.repo)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    path_to.monitor_socket.unlink(missing_ok=True)
+    server.bind(str(path_to.monitor_socket))
+    server.listen()
+    socket_ino = os.stat(path_to.monitor_socket).st_ino
+    logger.info(f">>> Watching {len(monitor.dirs)} dirs.")
+
+    selector = selectors.DefaultSelector()
+    selector.register(monitor.inotify.fd, selectors.EVENT_READ, "events")
+    selector.register(server, selectors.EVENT_READ, "client")
+    try:
+        while monitor.running:
+            for key, _ in selector.select():
+                if key.data == "events":
+                    monitor.process_events()
+                    continue
+                conn, _ = server.accept()
+                with conn:
+                    conn.settimeout(TIMEOUT)
+                    try:
+                        _answer(monitor, conn)
+                    except OSError:
+                        pass
+    finally:
+        selector.close()
+        server.close()
+        # A monitor that was started meanwhile may have replaced the socket.
+        try:
+            if os.stat(path_to.monitor_socket).st_ino == socket_ino:
+                path_to.monitor_socket.unlink()
+        except FileNotFoundError:
+            pass
+        monitor.close()
+
+
+# Clients:
+
+def request(message: str) -> Optional[bytes]:
+    """Sends a request to the monitor, and returns its answer; None if the monitor isn't running."""
+    if not path_to.monitor_socket.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(TIMEOUT)
+            conn.connect(str(path_to.monitor_socket))
+            conn.sendall(message.encode() + b"\n")
+            chunks = []
+            while True:
+                chunk = conn.recv(1024 * 1024)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+    except OSError:
+        return None
+
+
+def ping() -> Optional[Tuple[int, int]]:
+    """Returns the number of watched dirs and of changed paths, or None if the monitor isn't running."""
+    answer = request("ping")
+    if not answer:
+        return None
+    dirs, changes = answer.split()
+    return int(dirs), int(changes)
+
+
+def stop() -> bool:
+    return request("stop") is not None
+
+
+def query(token: str) -> Optional[Tuple[str, Optional[List[str]]]]:
+    """Returns a new token, and the paths that changed since the given one (None if everything must be scanned).
+    Returns None if the monitor isn't running.
+    """
+    answer = request(f"query {token}")
+    if not answer:
+        return None
+    new_token, kind, changes = answer.split(b"\n", 2)
+    if kind == b"full":
+        return new_token.decode(), None
+    return new_token.decode(), [os.fsdecode(rel_path) for rel_path in changes.split(b"\0")] if changes else []
+
+
+def read_state() -> Optional[MonitorState]:
+    try:
+        state = json.loads(path_to.monitor_state.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    return MonitorState(state["token"], set(state["not_staged"]), set(state["untracked"]))
+
+
+def write_state(state: MonitorState) -> None:
+    data = json.dumps({
+        "token": state.token,
+        "not_staged": sorted(state.not_staged),
+        "untracked": sorted(state.untracked),
+    })
+    fd, tmp = tempfile.mkstemp(dir=path_to.wit_repo, prefix="monitor-state_")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp, path_to.monitor_state)
+    except BaseException:
+        os.unlink(tmp)
+        raise
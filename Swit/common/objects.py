@@ -0,0 +1,398 @@
+import hashlib
+import mmap
+import os
+import posixpath
+import io
+import shutil
+import stat
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import Swit.common.compression as compression
+import Swit.common.pack as pack
+import Swit.common.paths as path_to
+from Swit.common.exceptions import FileOperationsError
+from Swit.common.materialize import copy_from, materialize
+from Swit.common.workers import count_hashed, run_parallel
+
+
+FILE_MODE = "100644"
+EXECUTABLE_MODE = "100755"
+DIR_MODE = "40000"
+
+CHUNK_SIZE = 64 * 1024
+# Files at least this big are mapped into memory to be hashed, rather than read.
+MMAP_THRESHOLD = 16 * 1024 * 1024
+MMAP_WINDOW = 8 * 1024 * 1024
+# The first bytes of a file are checked to tell if it's worth compressing.
+SAMPLE_SIZE = 16 * 1024
+
+
+class TreeEntry(NamedTuple):
+    mode: str
+    name: str
+    object_id: str
+
+
+# Hashing:
+
+def hash_object(kind: str, data: bytes) -> str:
+    """Returns the id of an object, the same way Git does:
+    sha1 of a `<kind> <size>\\0` header followed by the content.
+    """
+    h = hashlib.sha1(f"{kind} {len(data)}\0".encode())
+    h.update(data)
+    return h.hexdigest()
+
+
+def hash_file(fp: Path) -> str:
+    """Returns the blob id of a file, without loading it into memory:
+    it's read in chunks into the same buffer, or, if it's large, mapped and hashed a window at a time.
+    Either way, the memory used doesn't grow with the size of the file.
+    hashlib releases the GIL while it hashes, so files are best hashed on the pool of `run_parallel`.
+    """
+    with open(fp, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        h = hashlib.sha1(f"blob {size}\0".encode())
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data, memoryview(data) as view:
+                # Pages that were hashed are unmapped, so they don't pile up in the process:
+                for offset in range(0, size, MMAP_WINDOW):
+                    h.update(view[offset:offset + MMAP_WINDOW])
+                    if hasattr(data, "madvise"):
+                        data.madvise(mmap.MADV_DONTNEED, offset, min(MMAP_WINDOW, size - offset))
+        else:
+            buffer = bytearray(CHUNK_SIZE)
+            view = memoryview(buffer)
+            while True:
+                length = f.readinto(buffer)
+                if not length:
+                    break
+                h.update(view[:length])
+    count_hashed(size)
+    return h.hexdigest()
+
+
+def get_file_mode(st_mode: int) -> str:
+    return EXECUTABLE_MODE if st_mode & stat.S_IXUSR else FILE_MODE
+
+
+# Store:
+
+def get_object_path(object_id: str, codec: str = compression.NONE) -> Path:
+    """Objects are fanned out by the first two chars of their id, like in Git:
+    `.swit/objects/ab/cdef...`
+    Compressed objects have the suffix of their codec.
+    """
+    return path_to.objects / object_id[:2] / (object_id[2:] + compression.SUFFIXES[codec])
+
+
+def find_object(object_id: str) -> Tuple[Path, str]:
+    """Returns the path of a loose object, and the codec it's compressed with.
+    Raises FileNotFoundError for objects that are not loose (they may be in a pack).
+    """
+    configured = compression.get_codec()
+    for codec in (configured, *(c for c in compression.SUFFIXES if c != configured)):
+        path = get_object_path(object_id, codec)
+        if path.exists():
+            return path, codec
+    raise FileNotFoundError(f"Object '{object_id}' is missing from the store.")
+
+
+def has_object(object_id: str) -> bool:
+    try:
+        find_object(object_id)
+    except FileNotFoundError:
+        return pack.find_packed(object_id) is not None
+    return True
+
+
+def _move_into_store(tmp: str, object_id: str, codec: str) -> None:
+    """Renames a complete temp file to its object's path; it's removed if the object is already stored."""
+    if has_object(object_id):
+        os.unlink(tmp)
+        return
+    dest = get_object_path(object_id, codec)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.chmod(tmp, 0o444)
+    os.replace(tmp, dest)
+
+
+def _store(object_id: str, codec: str, fill) -> None:
+    """Writes an object through a temp file that is renamed into place,
+    so that a half written object is never visible under its id.
+    Objects are immutable, hence read-only.
+    """
+    if has_object(object_id):
+        return
+    dest = get_object_path(object_id, codec)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix="tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            fill(f)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, dest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_object(kind: str, data: bytes) -> str:
+    object_id = hash_object(kind, data)
+    codec = compression.get_codec()
+    _store(object_id, codec, lambda f: f.write(compression.compress(data, codec)))
+    return object_id
+
+
+def _compress_from(source: BinaryIO, sample: bytes, size: int, f: BinaryIO, codec: str) -> str:
+    """Compresses a file into `f` while it's hashed, in a single read of it. Returns its blob id.
+    Exactly the size it had when it was opened is read, so the id always matches what was written;
+    if the file shrank meanwhile, it's an error.
+    """
+    h = hashlib.sha1(f"blob {size}\0".encode())
+    remaining = size
+    with compression.compressing_writer(f, codec) as writer:
+        chunk = sample[:remaining]
+        while chunk:
+            h.update(chunk)
+            writer.write(chunk)
+            remaining -= len(chunk)
+            chunk = source.read(min(CHUNK_SIZE, remaining)) if remaining else b""
+    if remaining:
+        raise OSError(f"'{source.name}' changed while it was being stored.")
+    count_hashed(size)
+    return h.hexdigest()
+
+
+def write_blob(fp: Path) -> str:
+    """Adds the content of a file to the store, and returns its id.
+    The file is opened once, and read once: it's copied (or compressed) to a temp file while it's hashed,
+    and the temp file is renamed to the id only then, so a file that is being written to is never stored
+    under the id of other content. Content that is already stored is dropped.
+    The file is compressed in chunks, so it's never loaded into memory as a whole.
+    Content that looks already compressed is stored as is, using the fastest copy methods;
+    the copy is hashed, rather than the file, and can then be checked out the same way.
+    """
+    path_to.objects.mkdir(exist_ok=True)
+    with open(fp, "rb") as source:
+        size = os.fstat(source.fileno()).st_size
+        sample = source.read(SAMPLE_SIZE)
+        codec = compression.get_codec() if compression.is_compressible(sample) else compression.NONE
+        fd, tmp = tempfile.mkstemp(dir=path_to.objects, prefix="tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if codec == compression.NONE:
+                    copy_from(source, f)
+                else:
+                    object_id = _compress_from(source, sample, size, f, codec)
+            if codec == compression.NONE:
+                object_id = hash_file(Path(tmp))
+            _move_into_store(tmp, object_id, codec)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return object_id
+
+
+def _find_packed(object_id: str) -> Tuple[pack.PackFile, int]:
+    packed = pack.find_packed(object_id)
+    if packed is None:
+        raise FileNotFoundError(f"Object '{object_id}' is missing from the store.")
+    return packed
+
+
+def read_object(object_id: str) -> bytes:
+    try:
+        path, codec = find_object(object_id)
+    except FileNotFoundError:
+        pack_file, offset = _find_packed(object_id)
+        base_id, data = pack_file.read(offset)
+        if base_id is None:
+            return data
+        return pack.apply_delta(read_object(base_id), data)
+    return compression.decompress(path.read_bytes(), codec)
+
+
+def open_object(object_id: str) -> BinaryIO:
+    """Opens a stored object for reading its original content, in a streaming manner.
+    Deltas are small by design (see `Swit.inner.gc`), so they're rebuilt in memory.
+    """
+    try:
+        path, codec = find_object(object_id)
+    except FileNotFoundError:
+        pack_file, offset = _find_packed(object_id)
+        if pack_file.is_delta(offset):
+            return io.BytesIO(read_object(object_id))
+        return pack_file.open(offset)
+    return compression.decompressing_reader(open(path, "rb"), codec)
+
+
+# Trees:
+
+def _sort_key(entry: TreeEntry) -> str:
+    """Git sorts dirs as if their name ends with a slash."""
+    return entry.name + "/" if entry.mode == DIR_MODE else entry.name
+
+
+def write_tree(entries: List[TreeEntry]) -> str:
+    """A tree lists the mode, name and object id of each entry of a single dir.
+    Subdirs are trees of their own.
+    """
+    data = b"".join(
+        f"{e.mode} {e.name}\0".encode() + bytes.fromhex(e.object_id)
+        for e in sorted(entries, key=_sort_key)
+    )
+    return write_object("tree", data)
+
+
+def read_tree(tree_id: str) -> List[TreeEntry]:
+    data = read_object(tree_id)
+    entries = []
+    i = 0
+    while i < len(data):
+        end = data.index(b"\0", i)
+        mode, _, name = data[i:end].decode().partition(" ")
+        object_id = data[end + 1:end + 21].hex()
+        entries.append(TreeEntry(mode, name, object_id))
+        i = end + 21
+    return entries
+
+
+def _get_dir_entries(dir_path: Path) -> List[TreeEntry]:
+    entries = []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                sub_entries = _get_dir_entries(Path(entry.path))
+                if sub_entries:
+                    entries.append(TreeEntry(DIR_MODE, entry.name, write_tree(sub_entries)))
+            elif entry.is_file():
+                mode = get_file_mode(entry.stat().st_mode)
+                entries.append(TreeEntry(mode, entry.name, write_blob(Path(entry.path))))
+    return entries
+
+
+def write_tree_from_dir(dir_path: Path) -> str:
+    """Stores all files under a dir, and returns the id of its tree.
+    Empty dirs are not stored.
+    """
+    return write_tree(_get_dir_entries(dir_path))
+
+
+def flatten_tree(tree_id: str, prefix: str = "") -> Dict[str, Tuple[str, str]]:
+    """Returns the relative path (using forward slashes) of every file in a tree,
+    and the mode and object id of each one.
+    """
+    files = {}
+    for entry in read_tree(tree_id):
+        rel_path = prefix + entry.name
+        if entry.mode == DIR_MODE:
+            files.update(flatten_tree(entry.object_id, rel_path + "/"))
+        else:
+            files[rel_path] = (entry.mode, entry.object_id)
+    return files
+
+
+def get_path_id(tree_id: str, rel_path: str) -> Optional[str]:
+    """Returns the object id of a file or dir in a tree, or None if it doesn't exist.
+    Only the trees along the path are read.
+    """
+    object_id = tree_id
+    names = rel_path.split("/")
+    for i, name in enumerate(names):
+        entry = next((e for e in read_tree(object_id) if e.name == name), None)
+        if entry is None or (entry.mode != DIR_MODE and i < len(names) - 1):
+            return None
+        object_id = entry.object_id
+    return object_id
+
+
+def diff_trees(
+    old_tree_id: Optional[str], new_tree_id: Optional[str], prefix: str = ""
+) -> Dict[str, Tuple[Optional[Tuple[str, str]], Optional[Tuple[str, str]]]]:
+    """Returns every file that was added, removed or changed between two trees (None for no tree),
+    with its mode and object id before and after (None where it doesn't exist).
+    Subtrees with the same id are equal, so they are skipped without being read:
+    a change deep down a big tree only reads the trees along its path.
+    """
+    if old_tree_id == new_tree_id:
+        return {}
+    old_entries = {e.name: e for e in read_tree(old_tree_id)} if old_tree_id else {}
+    new_entries = {e.name: e for e in read_tree(new_tree_id)} if new_tree_id else {}
+    changes = {}
+    for name in old_entries.keys() | new_entries.keys():
+        old, new = old_entries.get(name), new_entries.get(name)
+        if old == new:
+            continue
+        rel_path = prefix + name
+        old_subtree = old.object_id if old and old.mode == DIR_MODE else None
+        new_subtree = new.object_id if new and new.mode == DIR_MODE else None
+        if old_subtree or new_subtree:
+            changes.update(diff_trees(old_subtree, new_subtree, rel_path + "/"))
+        old_file = (old.mode, old.object_id) if old and not old_subtree else None
+        new_file = (new.mode, new.object_id) if new and not new_subtree else None
+        if old_file or new_file:
+            changes[rel_path] = (old_file, new_file)
+    return changes
+
+
+def get_changed_paths(old_tree_id: Optional[str], new_tree_id: Optional[str]) -> Set[str]:
+    """Returns the relative path of every file that was added, removed or changed between two trees
+    (None for no tree), and of every dir that contains one.
+    """
+    changed = set()
+    for rel_path in diff_trees(old_tree_id, new_tree_id):
+        changed.add(rel_path)
+        while "/" in rel_path:
+            rel_path = rel_path.rpartition("/")[0]
+            if rel_path in changed:
+                break
+            changed.add(rel_path)
+    return changed
+
+
+# Materialization:
+
+def materialize_blob(object_id: str, mode: str, dest: Path) -> None:
+    """Writes the content of a blob into a file, replacing it if it exists.
+    Non executable files that are stored uncompressed may be hardlinked to the (read-only) object, if enabled.
+    """
+    file_mode = 0o755 if mode == EXECUTABLE_MODE else 0o644
+    try:
+        path, codec = find_object(object_id)
+    except FileNotFoundError:
+        codec = None
+    if codec == compression.NONE:
+        materialize(path, dest, file_mode, allow_hardlink=mode == FILE_MODE)
+        return
+
+    if dest.exists() or dest.is_symlink():
+        dest.unlink()
+    with open_object(object_id) as source, open(dest, "wb") as f:
+        shutil.copyfileobj(source, f, CHUNK_SIZE)
+    os.chmod(dest, file_mode)
+
+
+def materialize_files(files: Dict[str, Tuple[str, str]], dest_dir: Path) -> None:
+    """Writes the given blobs under a dir, by their relative path, using a pool of threads.
+    All parent dirs are created before any file is written. Files that are not given are left untouched.
+    Failures don't stop the other files from being written; they are raised together at the end.
+    """
+    def make_dir(rel_dir: str) -> None:
+        (dest_dir / rel_dir).mkdir(parents=True, exist_ok=True)
+
+    def write_file(item: Tuple[str, Tuple[str, str]]) -> None:
+        rel_path, (mode, object_id) = item
+        materialize_blob(object_id, mode, dest_dir / rel_path)
+
+    errors = []
+    dirs = {posixpath.dirname(rel_path) for rel_path in files} - {""}
+    for func, items in ((make_dir, dirs), (write_file, files.items())):
+        try:
+            run_parallel(func, items)
+        except FileOperationsError as e:
+            errors.extend(e.errors)
+    if errors:
+        raise FileOperationsError(errors)
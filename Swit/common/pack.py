@@ -0,0 +1,281 @@
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import Swit.common.compression as compression
+import Swit.common.paths as path_to
+
+
+# A pack holds many objects in a single file:
+#   header:  magic, version, number of entries
+#   entries: kind, size of the stored data, [base object id], zlib data
+# A delta entry stores instructions that rebuild the object from another (base) object.
+# A pack is named after the hash of the ids it holds.
+#
+# Its `.idx` file allows looking up an object without reading the pack:
+#   header:  magic, version, number of entries
+#   fanout:  for each first byte of an id, the number of ids that start with a byte <= it
+#   ids:     sorted, 20 bytes each
+#   offsets: the offset of each entry in the pack, in the order of the ids
+PACK_MAGIC = b"SWPK"
+IDX_MAGIC = b"SWPI"
+VERSION = 1
+HEADER = struct.Struct(">4sII")
+ENTRY = struct.Struct(">BQ")
+FANOUT = struct.Struct(">256I")
+OFFSET = struct.Struct(">Q")
+
+FULL = 1
+DELTA = 2
+
+# Delta instructions:
+INSERT = struct.Struct(">BI")   # 0, length, followed by the data
+COPY = struct.Struct(">BQI")    # 1, offset in the base, length
+BLOCK_SIZE = 16
+
+
+# Deltas:
+
+def _match_length(base: bytes, base_start: int, target: bytes, target_start: int) -> int:
+    """Returns the length of the common run of bytes, comparing big slices first."""
+    length = 0
+    for step in (4096, 256, 16, 1):
+        while (
+            target_start + length + step <= len(target)
+            and base_start + length + step <= len(base)
+            and target[target_start + length:target_start + length + step]
+            == base[base_start + length:base_start + length + step]
+        ):
+            length += step
+    return length
+
+
+def create_delta(base: bytes, target: bytes) -> bytes:
+    """Returns instructions that rebuild `target` from `base`:
+    copies of ranges of the base, and inserts of new data.
+    Blocks of the base are indexed by their content, and the target is scanned for them.
+    """
+    blocks = {}
+    for i in range(0, len(base) - BLOCK_SIZE + 1, BLOCK_SIZE):
+        blocks.setdefault(base[i:i + BLOCK_SIZE], i)
+
+    out = []
+    insert_start = 0
+    i = 0
+    while i <= len(target) - BLOCK_SIZE:
+        base_offset = blocks.get(target[i:i + BLOCK_SIZE])
+        if base_offset is None:
+            i += 1
+            continue
+        length = _match_length(base, base_offset, target, i)
+        # Extend the match backwards, into the data that would have been inserted:
+        while i > insert_start and base_offset > 0 and target[i - 1] == base[base_offset - 1]:
+            i -= 1
+            base_offset -= 1
+            length += 1
+        if i > insert_start:
+            out.append(INSERT.pack(0, i - insert_start) + target[insert_start:i])
+        out.append(COPY.pack(1, base_offset, length))
+        i += length
+        insert_start = i
+    if insert_start < len(target):
+        out.append(INSERT.pack(0, len(target) - insert_start) + target[insert_start:])
+    return b"".join(out)
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    out = bytearray()
+    i = 0
+    while i < len(delta):
+        if delta[i] == 0:
+            _, length = INSERT.unpack_from(delta, i)
+            i += INSERT.size
+            out += delta[i:i + length]
+            i += length
+        else:
+            _, offset, length = COPY.unpack_from(delta, i)
+            i += COPY.size
+            out += base[offset:offset + length]
+    return bytes(out)
+
+
+# Reading:
+
+class PackFile:
+    """A pack and its index. Both are memory mapped, so opening a pack costs the same
+    no matter how many objects it holds, and lookups are a binary search within a fanout range.
+    """
+
+    def __init__(self, idx_path: Path):
+        self.idx_path = idx_path
+        self.pack_path = idx_path.with_suffix(".pack")
+        with open(idx_path, "rb") as f:
+            self._idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.pack_path, "rb") as f:
+            self._pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self._idx)
+        if magic != IDX_MAGIC or version != VERSION:
+            raise ValueError(f"'{idx_path}' is not a swit pack index.")
+        self._fanout = FANOUT.unpack_from(self._idx, HEADER.size)
+        self._ids_start = HEADER.size + FANOUT.size
+        self._offsets_start = self._ids_start + self.count * 20
+
+    def _id_at(self, i: int) -> bytes:
+        start = self._ids_start + i * 20
+        return self._idx[start:start + 20]
+
+    def find(self, object_id: str) -> Optional[int]:
+        """Returns the offset of an object in the pack, or None if it's not in this pack."""
+        key = bytes.fromhex(object_id)
+        low = self._fanout[key[0] - 1] if key[0] else 0
+        high = self._fanout[key[0]]
+        while low < high:
+            mid = (low + high) // 2
+            mid_id = self._id_at(mid)
+            if mid_id == key:
+                return OFFSET.unpack_from(self._idx, self._offsets_start + mid * OFFSET.size)[0]
+            if mid_id < key:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    def object_ids(self) -> Iterable[str]:
+        for i in range(self.count):
+            yield self._id_at(i).hex()
+
+    def _entry(self, offset: int) -> Tuple[int, int, Optional[str], int]:
+        """Returns the kind, stored size, base id and data offset of an entry."""
+        kind, stored_size = ENTRY.unpack_from(self._pack, offset)
+        offset += ENTRY.size
+        base_id = None
+        if kind == DELTA:
+            base_id = self._pack[offset:offset + 20].hex()
+            offset += 20
+        return kind, stored_size, base_id, offset
+
+    def is_delta(self, offset: int) -> bool:
+        return self._pack[offset] == DELTA
+
+    def read(self, offset: int) -> Tuple[Optional[str], bytes]:
+        """Returns the base id and the delta of a delta entry, or None and the data of a full entry."""
+        kind, stored_size, base_id, data_offset = self._entry(offset)
+        return base_id, zlib.decompress(self._pack[data_offset:data_offset + stored_size])
+
+    def open(self, offset: int) -> BinaryIO:
+        """Opens a full entry for reading, decompressing it chunk by chunk."""
+        kind, stored_size, base_id, data_offset = self._entry(offset)
+        f = open(self.pack_path, "rb")
+        f.seek(data_offset)
+        return compression.decompressing_reader(f, compression.ZLIB, stored_size)
+
+
+_packs: Dict[str, Tuple[int, List[PackFile]]] = {}
+
+
+def get_packs() -> List[PackFile]:
+    """Returns all packs of the repository. Reopened only when the pack dir changed."""
+    pack_dir = path_to.objects / "pack"
+    try:
+        signature = os.stat(pack_dir).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    cached = _packs.get(str(pack_dir))
+    if cached and cached[0] == signature:
+        return cached[1]
+    # Packs that were replaced are not closed: other threads may still be reading them.
+    packs = [PackFile(idx_path) for idx_path in sorted(pack_dir.glob("pack-*.idx"))]
+    _packs[str(pack_dir)] = (signature, packs)
+    return packs
+
+
+def find_packed(object_id: str) -> Optional[Tuple[PackFile, int]]:
+    for pack in get_packs():
+        offset = pack.find(object_id)
+        if offset is not None:
+            return pack, offset
+    return None
+
+
+# Writing:
+
+class PackEntry(NamedTuple):
+    """An object to write into a pack: either a delta against `base_id`,
+    or (if `base_id` is None) a file to read the whole content from.
+    """
+    object_id: str
+    base_id: Optional[str]
+    data: Union[bytes, BinaryIO]
+
+
+def _write_entry(f: BinaryIO, entry: PackEntry) -> None:
+    """Writes an entry at the current position of the pack.
+    Full content is compressed in chunks; the size in the header is filled in afterwards.
+    """
+    start = f.tell()
+    header = ENTRY.pack(DELTA if entry.base_id else FULL, 0)
+    f.write(header + (bytes.fromhex(entry.base_id) if entry.base_id else b""))
+    data_start = f.tell()
+    compressor = zlib.compressobj(compression.get_level(compression.ZLIB))
+    if entry.base_id:
+        f.write(compressor.compress(entry.data))
+    else:
+        with entry.data as source:
+            for chunk in iter(lambda: source.read(compression.CHUNK_SIZE), b""):
+                f.write(compressor.compress(chunk))
+    f.write(compressor.flush())
+    end = f.tell()
+    f.seek(start)
+    f.write(ENTRY.pack(DELTA if entry.base_id else FULL, end - data_start))
+    f.seek(end)
+
+
+def _write_idx(path: Path, offsets: Dict[str, int]) -> None:
+    sorted_ids = sorted(bytes.fromhex(object_id) for object_id in offsets)
+    fanout = [0] * 256
+    for object_id in sorted_ids:
+        fanout[object_id[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(IDX_MAGIC, VERSION, len(sorted_ids)))
+        f.write(FANOUT.pack(*fanout))
+        f.writelines(sorted_ids)
+        f.writelines(OFFSET.pack(offsets[object_id.hex()]) for object_id in sorted_ids)
+
+
+def write_pack(entries: Iterable[PackEntry]) -> Path:
+    """Writes a pack and its index, and returns the path of the pack.
+    Both are written aside and renamed into place, the index last, so a pack is never visible before it's complete.
+    """
+    pack_dir = path_to.objects / "pack"
+    pack_dir.mkdir(parents=True, exist_ok=True)
+    offsets = {}
+    fd, tmp_pack = tempfile.mkstemp(dir=pack_dir, prefix="tmp_")
+    tmp_idx = tmp_pack + ".idx"
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(PACK_MAGIC, VERSION, 0))
+            for entry in entries:
+                offsets[entry.object_id] = f.tell()
+                _write_entry(f, entry)
+            # The number of entries is only known at the end:
+            f.seek(0)
+            f.write(HEADER.pack(PACK_MAGIC, VERSION, len(offsets)))
+        _write_idx(Path(tmp_idx), offsets)
+
+        name = "pack-" + hashlib.sha1(b"".join(sorted(bytes.fromhex(i) for i in offsets))).hexdigest()
+        pack_path = pack_dir / f"{name}.pack"
+        os.replace(tmp_pack, pack_path)
+        os.replace(tmp_idx, pack_path.with_suffix(".idx"))
+    except BaseException:
+        for tmp in (tmp_pack, tmp_idx):
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        raise
+    return pack_path
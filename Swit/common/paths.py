@@ -1,17 +1,16 @@
 import os
-from glob import glob
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from sys import argv, exit
-
-from loguru import logger
+from typing import Dict, Iterator, Optional
 
 from Swit.common.exceptions import WitDirectoryNotFoundError
 
 
-def is_init() -> bool:  # TODO: is there a better way?
-    if len(argv) == 2:
-        return argv[1] == "init"
-    return False
+# The paths of a repository are read as attributes of this module, e.g. `path_to.index`.
+# They belong to the repository that is in use (see `use_repo`); every `Repository` method,
+# and every command of the CLI, runs inside one. Outside of it, they belong to the repository
+# that contains the current working directory. Nothing is looked up when the module is imported.
 
 
 def get_uppermost_dir(cwd: Path) -> Path:
@@ -31,36 +30,98 @@ def get_repo_path(cwd: Path) -> Path:
     """
     uppermost_dir = get_uppermost_dir(cwd)
     while cwd != uppermost_dir:
-        for dir_name in cwd.glob("*.swit"):
-            if dir_name:
-                return cwd
+        if (cwd / ".swit").is_dir():
+            return cwd
         cwd = cwd.parent
     raise WitDirectoryNotFoundError(
         "No `.swit` directory found. Please make sure you're set to the correct cwd, or create a repository using the `init()` method."
     )
 
 
-cwd = Path(os.getcwd())
+class RepoPaths:
+    """The paths of a repository, and of the files under its `.swit` dir."""
 
-# Program will fail if repo not found, in any command except for `init`.
-if not is_init():
-    try:
-        repo = get_repo_path(cwd)
-    except WitDirectoryNotFoundError as e:
-        logger.error(e)
-        exit()
+    def __init__(self, repo: Path):
+        self.repo = repo
+
+        self.wit_repo = repo / ".swit"
+
+        self.index = self.wit_repo / "index"
+
+        # Replaced by `index`; only read to upgrade older repositories.
+        self.staging_area = self.wit_repo / "staging_area"
+
+        self.references = self.wit_repo / "references.txt"
+
+        self.images = self.wit_repo / "images"
+
+        self.objects = self.wit_repo / "objects"
+
+        self.parents = self.wit_repo / "parents.txt"
+
+        self.commit_graph = self.wit_repo / "commit-graph"
+
+        self.commit_ids = self.wit_repo / "commit-graph-ids"
+
+        self.bloom_index = self.wit_repo / "commit-graph-bloom.idx"
 
+        self.bloom_data = self.wit_repo / "commit-graph-bloom.dat"
 
-    wit_repo = repo / ".swit"
+        # No longer kept; removed by the next commit.
+        self.changes_to_be_committed = self.wit_repo / "changes_to_be_committed.txt"
 
-    staging_area = wit_repo / "staging_area"
+        self.merge_head = self.wit_repo / "MERGE_HEAD"
 
-    references = wit_repo / "references.txt"
+        self.merge_message = self.wit_repo / "MERGE_MSG"
 
-    images = wit_repo / "images"
+        self.monitor_socket = self.wit_repo / "monitor.sock"
 
-    parents = wit_repo / "parents.txt"
+        self.server_socket = self.wit_repo / "server.sock"
 
-    changes_to_be_committed = wit_repo / "changes_to_be_committed.txt"
+        self.monitor_state = self.wit_repo / "monitor-state"
 
-    active_branch = wit_repo / "activated.txt"
+        self.active_branch = self.wit_repo / "activated.txt"
+
+        self.config = self.wit_repo / "config"
+
+
+_current: ContextVar[Optional[RepoPaths]] = ContextVar("current_repo", default=None)
+_paths: Dict[Path, RepoPaths] = {}
+_found: Dict[str, Path] = {}
+
+
+def get_paths(repo: Path) -> RepoPaths:
+    if repo not in _paths:
+        _paths[repo] = RepoPaths(repo)
+    return _paths[repo]
+
+
+@contextmanager
+def use_repo(repo: Path) -> Iterator[RepoPaths]:
+    """Makes the paths of this module belong to the given repository, until the block ends.
+    Blocks may be nested, and each thread (or asyncio task) has its own repository in use.
+    """
+    token = _current.set(get_paths(repo))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def current() -> RepoPaths:
+    """Returns the paths of the repository in use, or of the one that contains the current working directory.
+    If there's neither, WitDirectoryNotFoundError is raised.
+    """
+    paths = _current.get()
+    if paths is not None:
+        return paths
+    cwd = os.getcwd()
+    if cwd not in _found:
+        _found[cwd] = get_repo_path(Path(cwd))
+    return get_paths(_found[cwd])
+
+
+def __getattr__(name: str):
+    if name.startswith("__"):
+        raise AttributeError(name)
+    return getattr(current(), name)
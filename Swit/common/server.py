@@ -0,0 +1,136 @@
+import io
+import json
+import os
+import socket
+import sys
+import traceback
+
+from loguru import logger
+
+import Swit.common.paths as path_to
+from Swit.common.client import FRAME, iter_frames, send_request
+from Swit.Switter import WIT_COMMANDS, load_command, run
+
+
+# Seconds between checks that the repository still exists, while no command is running.
+IDLE_CHECK_SECONDS = 5
+
+
+class FrameWriter(io.RawIOBase):
+    """Sends everything written to it to the client, as frames of a channel."""
+
+    def __init__(self, conn: socket.socket, channel: bytes):
+        self.conn = conn
+        self.channel = channel
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.conn.sendall(FRAME.pack(self.channel, len(data)) + data)
+        return len(data)
+
+
+def _open_stream(conn: socket.socket, channel: bytes) -> io.TextIOWrapper:
+    return io.TextIOWrapper(io.BufferedWriter(FrameWriter(conn, channel)), encoding="utf-8", errors="replace")
+
+
+def _log_sink(message: str) -> None:
+    # Output that was printed before the message comes first:
+    sys.stdout.flush()
+    sys.stderr.write(message)
+    sys.stderr.flush()
+
+
+def send_exit_code(conn: socket.socket, exit_code: int) -> None:
+    payload = str(exit_code).encode()
+    conn.sendall(FRAME.pack(b"x", len(payload)) + payload)
+
+
+def run_request(conn: socket.socket, request: dict) -> None:
+    """Runs a command the way `Swit` would, in the client's working dir, with its output sent to the client."""
+    stdout, stderr = _open_stream(conn, b"o"), _open_stream(conn, b"e")
+    sys.stdout, sys.stderr = stdout, stderr
+    exit_code = 0
+    try:
+        os.chdir(request["cwd"])
+        run(request["argv"])
+    except SystemExit as e:
+        if isinstance(e.code, str):
+            stderr.write(e.code + "\n")
+        exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        os.chdir(path_to.repo)
+    stdout.flush()
+    stderr.flush()
+    send_exit_code(conn, exit_code)
+
+
+def serve() -> None:
+    """Runs commands for clients, one at a time, until it's stopped or the repository is removed.
+    Everything that was loaded stays in memory between commands: the imported modules,
+    and the index, commit graph, changed-path filters, config and ignore rules (each is read again only if its file changed).
+    """
+    for command in WIT_COMMANDS:
+        load_command(command)
+    logger.remove()
+    logger.add(_log_sink)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    path_to.server_socket.unlink(missing_ok=True)
+    server.bind(str(path_to.server_socket))
+    server.listen()
+    server.settimeout(IDLE_CHECK_SECONDS)
+    socket_ino = os.stat(path_to.server_socket).st_ino
+    try:
+        while path_to.wit_repo.exists():
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            with conn:
+                conn.settimeout(None)
+                try:
+                    line = conn.makefile("rb").readline()
+                    request = json.loads(line)
+                    if request.get("type") == "stop":
+                        send_exit_code(conn, 0)
+                        return
+                    if request.get("type") == "ping":
+                        send_exit_code(conn, 0)
+                        continue
+                    run_request(conn, request)
+                except (OSError, ValueError, KeyError):
+                    # The client went away, or didn't send a request.
+                    continue
+    finally:
+        server.close()
+        try:
+            if os.stat(path_to.server_socket).st_ino == socket_ino:
+                path_to.server_socket.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Clients:
+
+def request(message_type: str) -> bool:
+    """Sends a request without arguments to the server. Returns False if the server isn't running."""
+    conn = send_request({"type": message_type}, str(path_to.repo))
+    if conn is None:
+        return False
+    with conn:
+        return any(channel == b"x" for channel, _ in iter_frames(conn))
+
+
+def ping() -> bool:
+    return request("ping")
+
+
+def stop() -> bool:
+    return request("stop")
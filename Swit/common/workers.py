@@ -0,0 +1,121 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+import Swit.common.config as config
+from Swit.common.exceptions import FileOperationsError
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Tasks submitted ahead of the running ones, per worker.
+QUEUE_DEPTH = 4
+
+
+def get_worker_count() -> int:
+    """The number of threads used for file I/O. Set with `Swit config core.workers <n>`."""
+    return max(1, config.get_int("core.workers"))
+
+
+def run_parallel(
+    func: Callable[[T], R], items: Iterable[T], workers: Optional[int] = None
+) -> List[Tuple[T, R]]:
+    """Runs `func` on every item using a bounded pool of threads, and returns (item, result) pairs.
+    File I/O and hashing release the GIL, so threads keep the disk busy.
+    Only a few tasks per worker are queued at a time, so the pool doesn't hold the whole input.
+    A failure doesn't stop the other items; all failures are raised together once every item was handled.
+    """
+    workers = workers or get_worker_count()
+    results = []
+    errors = []
+
+    if workers == 1:
+        for item in items:
+            try:
+                results.append((item, func(item)))
+            except OSError as e:
+                errors.append((item, e))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+
+            def collect(done) -> None:
+                for future in done:
+                    item = pending.pop(future)
+                    try:
+                        results.append((item, future.result()))
+                    except OSError as e:
+                        errors.append((item, e))
+
+            for item in items:
+                if len(pending) >= workers * QUEUE_DEPTH:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                # Threads don't inherit the caller's context, where the repository in use is kept:
+                pending[executor.submit(copy_context().run, func, item)] = item
+            collect(wait(pending).done)
+
+    if errors:
+        raise FileOperationsError(errors)
+    return results
+
+
+# Throughput:
+
+class Throughput:
+    """Counts the files and bytes that were hashed while it's measured, to tell how fast the workers went.
+    Compare the reports of a few values of `core.workers` to tune it for a disk.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.files = 0
+        self.size = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, size: int) -> None:
+        with self._lock:
+            self.files += 1
+            self.size += size
+
+    def stop(self) -> None:
+        self.seconds = time.perf_counter() - self.started
+
+    def __str__(self) -> str:
+        mib = self.size / (1024 * 1024)
+        seconds = max(self.seconds, 1e-9)
+        return (
+            f"Hashed {self.files} files ({mib:.1f} MiB) in {self.seconds:.2f}s using {self.workers} workers: "
+            f"{mib / seconds:.1f} MiB/s, {self.files / seconds:.0f} files/s."
+        )
+
+
+_throughput: ContextVar[Optional[Throughput]] = ContextVar("throughput", default=None)
+
+
+@contextmanager
+def measure_throughput() -> Iterator[Throughput]:
+    """Counts every file hashed in the block (by any worker), e.g.
+        with measure_throughput() as throughput:
+            inner_add(backup_paths)
+        logger.info(f">>> {throughput}")
+    """
+    throughput = Throughput(get_worker_count())
+    token = _throughput.set(throughput)
+    try:
+        yield throughput
+    finally:
+        throughput.stop()
+        _throughput.reset(token)
+
+
+def count_hashed(size: int) -> None:
+    throughput = _throughput.get()
+    if throughput is not None:
+        throughput.count(size)
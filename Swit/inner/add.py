@@ -1,76 +1,134 @@
-import shutil
-from os.path import abspath, relpath
+import os
+from bisect import bisect_left
+from os.path import abspath
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, Iterator, List, Tuple
 
 from loguru import logger
 
+import Swit.common.ignore as ignore
+import Swit.common.index as index
 import Swit.common.paths as paths
+from Swit.common.exceptions import FileOperationsError, IgnoredPathError
+from Swit.common.helper_funcs import get_rel_path, scan_dir
+from Swit.common.index import IndexEntry
+from Swit.common.workers import measure_throughput, run_parallel
 
 
-def get_abs_path(path: str) -> Path:
-    """Returns an absolute Path.
-    If the path doesn't exist, FileNotFoundError is raised.
+def get_tracked_under(tracked: List[str], rel_path: str) -> List[str]:
+    """Returns the tracked paths a path stands for: itself, or every tracked path under it if it's a dir.
+    `tracked` is sorted; the repository itself (an empty string) stands for all of them.
     """
-    abs_path = Path(abspath(path))
-    if not abs_path.exists():
-        raise FileNotFoundError(
-            f"The path '{abs_path}' does not exist. Please make sure you're set to the correct working directory."
+    if not rel_path:
+        return tracked
+    i = bisect_left(tracked, rel_path)
+    found = [rel_path] if i < len(tracked) and tracked[i] == rel_path else []
+    prefix = rel_path + "/"
+    for i in range(bisect_left(tracked, prefix), len(tracked)):
+        if not tracked[i].startswith(prefix):
+            break
+        found.append(tracked[i])
+    return found
+
+
+def check_not_ignored(rel_path: str, is_dir: bool, tracked: List[str]) -> None:
+    """Ignored paths can't be added, unless they are already tracked (or are dirs that hold tracked files).
+    `tracked` is sorted.
+    """
+    if get_tracked_under(tracked, rel_path):
+        return
+    if ignore.is_path_ignored(paths.repo, rel_path, is_dir):
+        raise IgnoredPathError(
+            f"The path '{rel_path}' is ignored by a {ignore.IGNORE_FILE} file."
         )
-    return abs_path
 
 
-def add_file(original_filepath: Path, path_from_repo: Path) -> None:
-    """Copies the file from the repository to staging area.
-    All parent folders will be created, albeit empty.
+def iter_files(rel_path: str, entries: Dict[str, IndexEntry]) -> Iterator[str]:
+    """Yields the files a path stands for: the file itself, or all files under the dir.
+    `.swit` and ignored files are never yielded (unless they are tracked).
     """
-    hierarchy = paths.staging_area / path_from_repo
-    if not hierarchy.exists():
-        hierarchy.mkdir(parents=True)
-    shutil.copy2(original_filepath, hierarchy)
-
+    abs_path = paths.repo / rel_path
+    if abs_path.is_file():
+        yield rel_path
+    elif abs_path.is_dir():
+        for file_path, _ in scan_dir(paths.repo, rel_path, tracked=entries):
+            yield file_path
 
-def add_dir(
-    backup_path: Path, rel_from_repo_to_backup: Path
-) -> None:
-    """Copies the dir from the repository to staging area.
-    All parent folders will be created, albeit empty.
-    """
-    dir_hierarchy_from_staging_area = paths.staging_area / rel_from_repo_to_backup
-    if not dir_hierarchy_from_staging_area.exists():
-        dir_hierarchy_from_staging_area.mkdir(parents=True)
-    shutil.copytree(backup_path, dir_hierarchy_from_staging_area, dirs_exist_ok=True)
 
+def stage_paths(rel_paths: List[str], entries: Dict[str, IndexEntry], tracked: List[str]) -> Tuple[int, int]:
+    """Records the current state of the given files and dirs in the index entries,
+    and returns the number of entries that were staged and removed. `tracked` is the sorted paths of the entries.
 
-def update_changes_to_be_committed(rel_from_repo_to_backup: Path) -> None:
-    """Adds a relative filepath to the file that stores all changes to be committed.
-    The File will be cleared out every time a commit is performed.
+    Only new files, and files whose stat info changed since they were staged, are read: they are hashed
+    and stored on a pool of threads, while the dirs are still being walked. Nothing is copied
+    if the same content is already stored. Tracked files that are gone are removed from the entries.
     """
-    with open(paths.changes_to_be_committed, "a") as f:
-        f.write(f"{rel_from_repo_to_backup}\n")
-
-
-def inner_add(backup_path: Path) -> None:
-    """Copies a file or dir from the repository to staging area;
-    Updates changes to be committed file.
+    index_mtime_ns = index.get_mtime_ns()
+    seen = set()
+
+    def iter_changed() -> Iterator[str]:
+        for rel_path in rel_paths:
+            for file_path in iter_files(rel_path, entries):
+                if file_path in seen:
+                    continue
+                seen.add(file_path)
+                entry = entries.get(file_path)
+                if entry is None or not index.is_stat_clean(entry, os.stat(paths.repo / file_path), index_mtime_ns):
+                    yield file_path
+
+    def stage(rel_path: str) -> IndexEntry:
+        return index.stage_file(paths.repo / rel_path, rel_path)
+
+    staged = run_parallel(stage, iter_changed())
+    for rel_path, entry in staged:
+        entries[rel_path] = entry
+
+    removed = {
+        tracked_path for rel_path in rel_paths
+        for tracked_path in get_tracked_under(tracked, rel_path) if tracked_path not in seen
+    }
+    for rel_path in removed:
+        del entries[rel_path]
+    return len(staged), len(removed)
+
+
+def inner_add(backup_paths: List[Path]) -> Tuple[int, int]:
+    """Stages files and dirs of the repository: their content is stored, and recorded in the index,
+    which is written once for all of them (and only if something changed).
+    A path that no longer exists stages the removal of the files that were tracked there.
+    Returns the number of files that were staged and removed.
     """
-    rel_from_repo_to_backup = backup_path.relative_to(paths.repo)
-    if backup_path.is_file():
-        rel_from_repo_to_dir = rel_from_repo_to_backup.parent
-        add_file(backup_path, rel_from_repo_to_dir)
-    elif backup_path.is_dir():
-        add_dir(backup_path, rel_from_repo_to_backup)
-
-    update_changes_to_be_committed(rel_from_repo_to_backup)
-
-
-def add(path: str) -> bool:
+    entries = index.read_index()
+    tracked = sorted(entries)
+    rel_paths = []
+    for backup_path in backup_paths:
+        try:
+            rel_path = get_rel_path(backup_path)
+        except ValueError:
+            raise ValueError(f"'{backup_path}' is outside the repository.")
+        if backup_path.exists():
+            check_not_ignored(rel_path, backup_path.is_dir(), tracked)
+        elif not get_tracked_under(tracked, rel_path):
+            raise FileNotFoundError(
+                f"The path '{backup_path}' does not exist. Please make sure you're set to the correct working directory."
+            )
+        rel_paths.append(rel_path)
+
+    staged, removed = stage_paths(rel_paths, entries, tracked)
+    if staged or removed:
+        index.write_index(entries)
+    return staged, removed
+
+
+def add(pathspecs: List[str], stats: bool = False) -> bool:
     try:
-        backup_path = get_abs_path(path)
-    except FileNotFoundError as e:
+        with measure_throughput() as throughput:
+            inner_add([Path(abspath(path)) for path in pathspecs])
+    except (FileNotFoundError, ValueError, IgnoredPathError, FileOperationsError) as e:
         logger.warning(e)
         return False
 
-    inner_add(backup_path)
     logger.info(">>> Backup created.")
+    if stats:
+        logger.info(f">>> {throughput}")
     return True
@@ -1,16 +1,13 @@
+import Swit.common.paths as path_to
 from Swit.common.exceptions import BranchNameExistsError, CommitRequiredError
+from Swit.common.helper_funcs import add_reference, get_head_id, read_references
 
 from loguru import logger
 
 
 def does_branch_exist(branch_name: str) -> bool:
     """Returns True if there's already a branch with the given name."""
-    lines = path_to.references.read_text().split("\n")
-    for line in lines:
-        name, _, branch_id = line.partition("=")
-        if name == branch_name:
-            return True
-    return False
+    return any(name == branch_name for name, _ in read_references())
 
 
 def add_branch_name_to_references(
@@ -31,9 +28,7 @@ def add_branch_name_to_references(
             f"There is already a branch named {branch_name}."
         )
 
-    head_id = get_head_id()
-    with open(path_to.references, "a") as f:
-        f.write(f"{branch_name}={head_id}\n")
+    add_reference(branch_name, get_head_id())
 
 
 def branch(name: str) -> bool:
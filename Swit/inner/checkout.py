@@ -1,102 +1,120 @@
-import shutil
-from pathlib import Path
-from typing import List, Set, Tuple, Dict
+import os
+from typing import Dict, Mapping, Set, Tuple
 
+import Swit.common.index as index
+import Swit.common.objects as objects
 import Swit.common.paths as path_to
-from Swit.common.exceptions import CommitIdError, ImpossibleCheckoutError
+from Swit.common.exceptions import CommitIdError, CommitRequiredError, FileOperationsError, ImpossibleCheckoutError
 from Swit.common.helper_funcs import (
-    get_head_id, get_relpaths, handle_references_file
+    get_commit_tree, get_head_id, get_tracked_dirs, get_valid_commit_tree, handle_references_file,
+    is_reference_name, resolve_commit_id
 )
 from loguru import logger
 
 import Swit.inner.status as status
-from Swit.common.helper_funcs import get_head_id, resolve_commit_id, get_valid_commit_path
 
 
 def is_checkout_possible(
-    image_dir_path: Path, to_be_committed: Set[Path], not_staged_for_commit: Set[Path]
+    to_be_committed: Set[str], not_staged_for_commit: Set[str]
 ) -> bool:
-    """The checkout command will not run if the commit_id is wrong;
-    if there are any files that are to be committed;
+    """The checkout command will not run if there are any files that are to be committed;
     or any files that are not staged for commit.
     """
-    if not image_dir_path.exists():
-        raise FileNotFoundError(
-            f"The path '{image_dir_path}' does not exist. You may have entered the wrong branch name / commit id."
-        )
     return not any((to_be_committed, not_staged_for_commit))
 
 
 def handle_impossible_checkout(
-    head_id: str, image_dir_path: Path, 
-    to_be_committed: Tuple[str, Set[Path]],
-    not_staged: Tuple[str, Set[Path]]
+    head_id: str,
+    to_be_committed: Tuple[str, Set[str]],
+    not_staged: Tuple[str, Set[str]]
 ) -> None:
-    """If checkout is impossible to perform, an error is raised and the relevant status info is printed."""
-    if not is_checkout_possible(
-        image_dir_path, to_be_committed[1], not_staged[1]
-    ):
-        logger.warning(
-            "Please make sure that 'Changes to Be Committed' and 'Changes Not Staged for Commit' are empty:"
-            )
-        status.print_section(*to_be_committed)
-        status.print_section(*not_staged)
-        raise ImpossibleCheckoutError
-
-
-def get_dirpaths_to_ignore(untracked_files: Set[Path]) -> Set[Path]:
-    """Returns all parent dirs of the untracked files, 
-    so that they will not be removed.
-    """
-    dirpaths = set()
-    for fp in untracked_files:
-        cur_path = fp.parent
-        parent = cur_path.parent
-        while cur_path != parent:
-            dirpaths.add(cur_path)
-            cur_path, parent = cur_path.parent, parent.parent
-    return dirpaths
-
-
-def remove_except(untracked_files: Set[Path]) -> None:
-    """Removes all dirs and files in the repository, 
-    except for `.swit` and untracked files (including parents).
-    This is used before the content of `staging_area` is copied.
+    """If checkout is impossible to perform, an error is raised, that tells which files are in the way."""
+    if not is_checkout_possible(to_be_committed[1], not_staged[1]):
+        sections = "".join(
+            f"\n{section_name}:" + "".join(f"\n  {fp}" for fp in sorted(filepaths))
+            for section_name, filepaths in (to_be_committed, not_staged) if filepaths
+        )
+        raise ImpossibleCheckoutError(
+            "Please make sure that 'Changes to Be Committed' and 'Changes Not Staged for Commit' are empty."
+            + sections
+        )
+
+
+def get_tree_changes(
+    head_tree_id: str, image_tree_id: str
+) -> Tuple[Set[str], Dict[str, Tuple[str, str]]]:
+    """Returns the files that exist in HEAD but not in the chosen image, 
+    and the files that were added or modified in the image (with their mode and object id).
+    Dirs that are the same in both are skipped without being read.
     """
-    entries = get_relpaths(path_to.repo, ignore_wit=True, only_files=False)
-    dirs_to_ignore = get_dirpaths_to_ignore(untracked_files)
-    remove = entries - untracked_files - dirs_to_ignore
-    for entry in remove:
-        if entry.is_dir():
-            shutil.rmtree(entry)
-            # shutil is used because the dir doesn't have to be empty (compared to pathlib\os).
-        if entry.is_file():
-            entry.unlink()
-
-
-def update_repo(untracked_files: Set[Path], image_path: Path) -> None:
-    """Replaces the content of the repository with the content of the chosen commit.
-    Removes all content except for .swit dir and untracked files;
-    then copies the content of the image.
+    changes = objects.diff_trees(head_tree_id, image_tree_id)
+    removed_files = {fp for fp, (_, new) in changes.items() if not new}
+    files_to_write = {fp: new for fp, (_, new) in changes.items() if new}
+    return removed_files, files_to_write
+
+
+def get_missing_files(entries: Mapping[str, index.IndexEntry]) -> Dict[str, Tuple[str, str]]:
+    """Returns the tracked files that were deleted from the repository, with their indexed mode and object id.
+    Status doesn't tell them apart from unchanged files, and the tree diff doesn't see them,
+    so they're written again like the files that changed.
     """
-    remove_except(untracked_files)
-    shutil.copytree(image_path, path_to.repo, dirs_exist_ok=True)
+    return {
+        rel_path: (entry.mode, entry.object_id)
+        for rel_path, entry in entries.items() if not os.path.lexists(path_to.repo / rel_path)
+    }
 
 
-def update_staging_area(image_path: Path) -> None:
-    """Replaces the content of staging area with the content of the chosen commit.
-    Removes all content; then copies the content of the image.
+def remove_files(removed_files: Set[str]) -> None:
+    """Removes files from the repository, along with dirs that were left empty.
+    Dirs that still hold untracked files are kept.
+    """
+    for rel_path in removed_files:
+        (path_to.repo / rel_path).unlink(missing_ok=True)
+    # Deepest dirs first, so a parent is only checked after its children were removed:
+    for rel_dir in sorted(get_tracked_dirs(removed_files), key=len, reverse=True):
+        try:
+            (path_to.repo / rel_dir).rmdir()
+        except OSError:
+            pass
+
+
+def update_repo(head_tree_id: str, image_tree_id: str) -> Tuple[Set[str], Dict[str, Tuple[str, str]]]:
+    """Updates the repository to the content of the chosen commit, 
+    by removing, adding and replacing only the files that differ from HEAD,
+    and restoring tracked files that are missing.
+    Unchanged files are not touched, so they keep their mtime.
+    Returns the removed and the written files.
+    """
+    removed_files, files_to_write = get_tree_changes(head_tree_id, image_tree_id)
+    # The index matches HEAD (checkout is refused otherwise), so a missing file that the image didn't change
+    # is restored from its entry:
+    missing_files = get_missing_files(index.read_index())
+    files_to_write = {
+        **{fp: version for fp, version in missing_files.items() if fp not in removed_files}, **files_to_write
+    }
+    remove_files(removed_files)
+    objects.materialize_files(files_to_write, path_to.repo)
+    return removed_files, files_to_write
+
+
+def update_index(removed_files: Set[str], written_files: Dict[str, Tuple[str, str]]) -> None:
+    """Updates the index to the content of the chosen commit.
+    Must run after the repository was updated, so the stat info of the written files is recorded.
+    Entries of unchanged files keep their stat info.
     """
-    shutil.rmtree(path_to.staging_area)
-    shutil.copytree(image_path, path_to.staging_area)
+    entries = index.read_index()
+    for rel_path in removed_files:
+        entries.pop(rel_path, None)
+    for rel_path, (mode, object_id) in written_files.items():
+        entries[rel_path] = index.new_entry(rel_path, os.stat(path_to.repo / rel_path), object_id)
+    index.write_index(entries)
 
 
 def handle_activated_file(image_commit_id: str, original_user_input: str) -> None:
     """If the user passed a branch name, it will appear under activated.txt;
     else, there will be no active branch and the file will be empty.
     """
-    # Checks if the user passed a branch name or a commit id
-    if original_user_input != image_commit_id:
+    if is_reference_name(original_user_input):
         content = original_user_input
     else: 
         content = ""
@@ -104,36 +122,42 @@ def handle_activated_file(image_commit_id: str, original_user_input: str) -> Non
     path_to.active_branch.write_text(content)
 
 
-def inner_checkout(user_input: str, image_commit_id: str, image_dir_path: Path) -> None:
-    """Updates files in the repository and in staging area to match the version 
+def inner_checkout(user_input: str, image_commit_id: str, image_tree_id: str) -> None:
+    """Updates files in the repository and in the index to match the version 
     in the specified image.
     Updates the activated file and references files.
     """
+    if path_to.merge_head.exists():
+        raise ImpossibleCheckoutError("A merge is in progress. Resolve the conflicts, `add` the files, and `commit` it first.")
     head_id = get_head_id()
     status_info = status.get_status_info(head_id)
     to_be_committed, not_staged, untracked = status_info.items()
-    handle_impossible_checkout(head_id, image_dir_path, to_be_committed, not_staged)
-    update_repo(untracked[1], image_dir_path)
-    update_staging_area(image_dir_path)
+    handle_impossible_checkout(head_id, to_be_committed, not_staged)
+    changes = update_repo(get_commit_tree(head_id), image_tree_id)
+    update_index(*changes)
     # Note: Updating activated.txt should remain before references.txt
     handle_activated_file(image_commit_id, user_input)
     handle_references_file(image_commit_id)
 
 
+def get_checkout_image(indicator: str) -> Tuple[str, str]:
+    """Returns the commit id and the tree id of the image to check out (a branch name or a commit id)."""
+    if not path_to.references.exists():
+        raise CommitRequiredError("Must commit at least once before executing checkout.")
+    image_commit_id = resolve_commit_id(indicator)
+    return image_commit_id, get_valid_commit_tree(image_commit_id, indicator)
+
+
 def checkout(indicator: str) -> bool:
     try:
-        image_commit_id = resolve_commit_id(indicator)
-        image_dir_path = get_valid_commit_path(image_commit_id, indicator)
-    except CommitIdError as e:
+        image_commit_id, image_tree_id = get_checkout_image(indicator)
+    except (CommitIdError, CommitRequiredError) as e:
         logger.warning(e)
         return False
 
     try:
-        inner_checkout(indicator, image_commit_id, image_dir_path)
-    except ImpossibleCheckoutError:
-        # The error is handled within `inner_checkout`.
-        return False
-    except FileNotFoundError as e:
+        inner_checkout(indicator, image_commit_id, image_tree_id)
+    except (ImpossibleCheckoutError, FileNotFoundError, FileOperationsError) as e:
         logger.warning(e)
         return False
 
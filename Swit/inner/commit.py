@@ -1,20 +1,17 @@
-import shutil
 from datetime import datetime
-from pathlib import Path
-from typing import List, Optional
+from typing import Optional, Tuple
 
 from loguru import logger
 
+import Swit.common.bloom as bloom
+import Swit.common.commit_graph as commit_graph
+import Swit.common.index as index
 import Swit.common.paths as path_to
 from Swit.common.helper_funcs import (
-    generate_commit_id, get_parent, handle_references_file
+    get_metadata_path, get_parent, handle_references_file, hash_commit
 )
 
 
-def get_image_file(commit_id: str) -> Path:
-    return path_to.images / f"{commit_id}.txt"
-
-
 def get_cur_date_and_timezone() -> str:
     """Returns the current date and a timezone stamp. 
     Example: Fri Jan 29 04:35:12 2021 +02:00
@@ -25,15 +22,24 @@ def get_cur_date_and_timezone() -> str:
     return f"{date} +{timezone}"
 
 
-def create_metadata_file(path_to_metadata_file: Path, message: str, parent: Optional[str]) -> None:
-    """Metadata file is called by the name of the commit id, and contains parent, date, and user message. 
+def create_metadata_file(tree_id: str, message: str, parent: Optional[str]) -> Tuple[str, bool]:
+    """Metadata file is called by the name of the commit id, and contains tree, parent, date, and user message. 
     Example:
+    tree=4b825dc642cb6eb9a060e54bf8d69288fbee4904
     parent=6462de3e3cf99d94e38afd18d11d5251483e320c
     date=Wed Jan 13 23:04:29 2021 +02:00
     message=I like trains.
+    The commit id is the hash of this content. Returns it, and whether the commit is new
+    (the exact same commit may already exist, if it was made in the same second).
     """
     date = get_cur_date_and_timezone()
-    path_to_metadata_file.write_text(f"parent={parent}\ndate={date}\nmessage={message}")
+    metadata = f"tree={tree_id}\nparent={parent}\ndate={date}\nmessage={message}"
+    commit_id = hash_commit(metadata)
+    path_to_metadata_file = get_metadata_path(commit_id)
+    if path_to_metadata_file.exists():
+        return commit_id, False
+    path_to_metadata_file.write_text(metadata)
+    return commit_id, True
 
 
 def add_to_parents_file(commit_id: str, parents: str) -> None:
@@ -42,30 +48,34 @@ def add_to_parents_file(commit_id: str, parents: str) -> None:
         f.write(f"{commit_id}={parents}\n")
 
 
-def clear_changes_to_be_committed() -> None:
-    """Every time an `add` command is performed, the filepath is added to this file;
-    Every time a commit is performed, this file will be cleared out.
-    """
-    path_to.changes_to_be_committed.write_text("")
-
-
-def inner_commit(user_message: str, commit_id: str = generate_commit_id(), parents: Optional[str] = None, is_merge: bool = False) -> None:
-    """Creates a snapshot of the staging area.
-    Creates the image dir and the metadata file; copies the content of staging area into the image dir;
-    updates references, parents, and chenges to be committed files.
+def inner_commit(user_message: str, parents: Optional[str] = None, is_merge: bool = False) -> str:
+    """Creates a snapshot of the index, and returns its commit id.
+    Stores a tree for every dir in the index, and creates the metadata file pointing at the root tree;
+    updates references and parents files.
+    All file content was already stored by `add`, so no file is read or copied.
     """
+    if parents is None and path_to.merge_head.exists():
+        # Finishes a merge that stopped on conflicts:
+        parents = f"{get_parent()},{path_to.merge_head.read_text().strip()}"
+        user_message = user_message or path_to.merge_message.read_text()
+        is_merge = True
     parents = parents or get_parent()
-    metadata_path = get_image_file(commit_id)
-    image_dir_path = path_to.images / commit_id
-    # Create the image dir and file:
-    image_dir_path.mkdir()
-    create_metadata_file(metadata_path, user_message, parents)
-    # Copy the content of staging_area into the new image dir:
-    shutil.copytree(path_to.staging_area, image_dir_path, dirs_exist_ok=True)
-    # Update references.txt, parents.txt, and changes_to_be_committed.txt
+    entries = index.read_index()
+    tree_id = index.write_tree(entries)
+    commit_id, is_new = create_metadata_file(tree_id, user_message, parents)
+    # Update references.txt, parents.txt, the commit graph and its changed-path filters
     handle_references_file(commit_id, is_merge)
-    add_to_parents_file(commit_id, parents)
-    clear_changes_to_be_committed()
+    if is_new:
+        add_to_parents_file(commit_id, parents)
+        commit_graph.add_commit(commit_id, parents)
+        bloom.add_commit(commit_id)
+    # Kept by older versions; what's staged is told by comparing the index to HEAD.
+    path_to.changes_to_be_committed.unlink(missing_ok=True)
+    # Saves the trees that were written, so the next commit only writes the trees of dirs that changed:
+    index.write_index(entries)
+    path_to.merge_head.unlink(missing_ok=True)
+    path_to.merge_message.unlink(missing_ok=True)
+    return commit_id
 
 
 def commit(message: str) -> bool:
@@ -0,0 +1,33 @@
+from loguru import logger
+
+import Swit.common.bloom as bloom
+import Swit.common.commit_graph as history
+import Swit.common.paths as path_to
+from Swit.common.exceptions import CommitRequiredError
+
+
+def inner_commit_graph(changed_paths: bool) -> None:
+    """Rewrites the commit graph from `parents.txt`.
+    With changed_paths, a changed-path filter is also created for every commit that has none
+    (e.g. commits made before filters were kept), so `log -- <path>` can skip them.
+    """
+    if not path_to.references.exists():
+        raise CommitRequiredError("Must commit at least once before writing the commit graph.")
+    had_filters = path_to.bloom_index.exists()
+    # Filters are kept by position in the graph, which may change; they're carried over by commit id:
+    known = bloom.get_filters_by_id()
+    history.write_graph()
+    bloom.remove_filters()
+    logger.info(f">>> Wrote the commit graph ({len(history.read_graph())} commits).")
+    if changed_paths or had_filters:
+        created = bloom.write_filters(known)
+        logger.info(f">>> Wrote changed-path filters ({created} commits).")
+
+
+def commit_graph(changed_paths: bool = False) -> bool:
+    try:
+        inner_commit_graph(changed_paths)
+    except CommitRequiredError as e:
+        logger.warning(e)
+        return False
+    return True
@@ -0,0 +1,23 @@
+from typing import Optional
+
+from loguru import logger
+
+import Swit.common.config as settings
+
+
+def inner_config(name: str, value: Optional[str]) -> None:
+    """Prints the value of a setting; if a value is given, sets it instead."""
+    if value is None:
+        print(settings.get(name))
+    else:
+        settings.set_value(name, value)
+        logger.info(f">>> {name} was set to {value}.")
+
+
+def config(name: str, value: Optional[str]) -> bool:
+    try:
+        inner_config(name, value)
+    except ValueError as e:
+        logger.warning(e)
+        return False
+    return True
@@ -0,0 +1,253 @@
+import os
+import sys
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+import Swit.common.diff as line_diff
+import Swit.common.index as index
+import Swit.common.objects as objects
+import Swit.common.paths as path_to
+from Swit.common.exceptions import CommitIdError, CommitRequiredError
+from Swit.common.helper_funcs import get_head_id, get_repo_paths, get_valid_commit_tree, resolve_commit_id
+from Swit.common.workers import run_parallel
+
+
+# A file's (mode, object id), or None where it doesn't exist.
+FileVersion = Optional[Tuple[str, str]]
+
+NO_ID = "0" * 40
+# The width of the bars of `--stat`.
+STAT_WIDTH = 50
+
+
+class FileChange(NamedTuple):
+    rel_path: str
+    old: FileVersion
+    new: FileVersion
+    # The new version is the file in the repository, rather than a stored object:
+    is_new_in_repo: bool = False
+
+
+# Finding changes:
+
+def get_repo_changes(
+    entries: index.IndexEntries, rel_paths: List[str]
+) -> Dict[str, Tuple[FileVersion, FileVersion]]:
+    """Returns the tracked files whose content in the repository differs from the index
+    (only under the given paths, if there are any).
+    Files whose stat info matches the index are not read; the others are hashed on a pool of threads,
+    so no content is loaded.
+    """
+    index_mtime_ns = index.get_mtime_ns()
+    changes = {}
+    files_to_hash = []
+    for rel_path, entry in entries.items():
+        if rel_paths and not is_under(rel_path, rel_paths):
+            continue
+        try:
+            st = os.stat(path_to.repo / rel_path)
+        except FileNotFoundError:
+            changes[rel_path] = ((entry.mode, entry.object_id), None)
+            continue
+        if not index.is_stat_clean(entry, st, index_mtime_ns):
+            files_to_hash.append((rel_path, objects.get_file_mode(st.st_mode)))
+
+    def hash_file(item: Tuple[str, str]) -> str:
+        return objects.hash_file(path_to.repo / item[0])
+
+    for (rel_path, mode), object_id in run_parallel(hash_file, files_to_hash):
+        entry = entries[rel_path]
+        if (mode, object_id) != (entry.mode, entry.object_id):
+            changes[rel_path] = ((entry.mode, entry.object_id), (mode, object_id))
+    return changes
+
+
+def get_commit_tree_of(indicator: str) -> str:
+    return get_valid_commit_tree(resolve_commit_id(indicator), indicator)
+
+
+def get_changes(commits: List[str], cached: bool, rel_paths: List[str]) -> List[FileChange]:
+    """Returns what changed from the old version to the new one, sorted by path:
+    - no commits: from the index to the repository.
+    - `cached`: from HEAD (or the given commit) to the index.
+    - one commit: from the commit to the repository.
+    - two commits: from the first to the second.
+    Trees are compared by the ids of their subtrees, so dirs that didn't change are skipped;
+    the repository is only checked under `rel_paths`, if there are any.
+    """
+    if len(commits) == 2:
+        tree_changes = objects.diff_trees(get_commit_tree_of(commits[0]), get_commit_tree_of(commits[1]))
+        return [FileChange(rel_path, old, new) for rel_path, (old, new) in sorted(tree_changes.items())]
+
+    entries = index.read_index()
+    if cached or commits:
+        if not commits and not path_to.references.exists():
+            raise CommitRequiredError("Must commit at least once before comparing to HEAD.")
+        tree_id = get_commit_tree_of(commits[0]) if commits else get_valid_commit_tree(get_head_id(), "HEAD")
+        tree_changes = index.diff_tree(tree_id, entries)
+    else:
+        tree_changes = {}
+    if cached:
+        return [FileChange(rel_path, old, new) for rel_path, (old, new) in sorted(tree_changes.items())]
+
+    # The repository's version replaces the index's, and the commit's (or the index's) version is the old one:
+    repo_changes = get_repo_changes(entries, rel_paths)
+    changes = []
+    for rel_path in sorted(tree_changes.keys() | repo_changes.keys()):
+        old = tree_changes[rel_path][0] if rel_path in tree_changes else repo_changes[rel_path][0]
+        new = repo_changes[rel_path][1] if rel_path in repo_changes else tree_changes[rel_path][1]
+        if old != new:
+            changes.append(FileChange(rel_path, old, new, rel_path in repo_changes and new is not None))
+    return changes
+
+
+def is_under(rel_path: str, rel_paths: List[str]) -> bool:
+    return any(rel_path == p or rel_path.startswith(p + "/") for p in rel_paths)
+
+
+# Reading content:
+
+def open_version(change: FileChange, is_new: bool) -> BinaryIO:
+    version = change.new if is_new else change.old
+    if is_new and change.is_new_in_repo:
+        return open(path_to.repo / change.rel_path, "rb")
+    return objects.open_object(version[1])
+
+
+def iter_ops(change: FileChange) -> Optional[Iterator[line_diff.LineOp]]:
+    """Streams the line ops of a changed file, reading both versions a chunk at a time.
+    Returns None for binary files, which are recognized by the start of their content and never read any further.
+    """
+    files = [open_version(change, is_new) if version else None for is_new, version in ((False, change.old), (True, change.new))]
+    starts = [f.read(line_diff.BINARY_CHECK_SIZE) if f else b"" for f in files]
+    if any(line_diff.is_binary(start) for start in starts):
+        for f in files:
+            if f:
+                f.close()
+        return None
+
+    def lines(f: Optional[BinaryIO], start: bytes) -> Iterator[bytes]:
+        if f is None:
+            return
+        with f:
+            yield from line_diff.iter_lines(f, start)
+
+    return line_diff.iter_line_ops(lines(files[0], starts[0]), lines(files[1], starts[1]))
+
+
+# Output:
+
+def format_header(change: FileChange) -> List[str]:
+    rel_path = change.rel_path
+    lines = [f"diff --git a/{rel_path} b/{rel_path}"]
+    old_mode, old_id = change.old or (None, NO_ID)
+    new_mode, new_id = change.new or (None, NO_ID)
+    if change.old is None:
+        lines.append(f"new file mode {new_mode}")
+    elif change.new is None:
+        lines.append(f"deleted file mode {old_mode}")
+    elif old_mode != new_mode:
+        lines += [f"old mode {old_mode}", f"new mode {new_mode}"]
+    if old_id != new_id:
+        mode = f" {old_mode}" if old_mode == new_mode else ""
+        lines.append(f"index {old_id[:7]}..{new_id[:7]}{mode}")
+    return lines
+
+
+def iter_patch(change: FileChange) -> Iterator[bytes]:
+    yield ("\n".join(format_header(change)) + "\n").encode()
+    if change.old and change.new and change.old[1] == change.new[1]:
+        # Only the mode changed.
+        return
+    old_name = f"a/{change.rel_path}" if change.old else "/dev/null"
+    new_name = f"b/{change.rel_path}" if change.new else "/dev/null"
+    ops = iter_ops(change)
+    if ops is None:
+        yield f"Binary files {old_name} and {new_name} differ\n".encode()
+        return
+    yield f"--- {old_name}\n+++ {new_name}\n".encode()
+    yield from line_diff.iter_hunks(ops)
+
+
+def count_lines(change: FileChange) -> Optional[Tuple[int, int]]:
+    """Returns the number of added and removed lines of a file, or None if it's binary."""
+    if change.old and change.new and change.old[1] == change.new[1]:
+        return 0, 0
+    ops = iter_ops(change)
+    if ops is None:
+        return None
+    added = removed = 0
+    for op in ops:
+        if not op.equal:
+            added += len(op.b_lines)
+            removed += len(op.a_lines)
+    return added, removed
+
+
+def print_stat(changes: List[FileChange]) -> None:
+    counts = [count_lines(change) for change in changes]
+    name_width = max(len(change.rel_path) for change in changes)
+    most = max((added + removed for added, removed in filter(None, counts)), default=0)
+    count_width = len(str(most))
+    scale = min(1, STAT_WIDTH / most) if most else 1
+    total_added = total_removed = 0
+    for change, count in zip(changes, counts):
+        if count is None:
+            print(f" {change.rel_path:<{name_width}} | {'Bin':>{count_width}}")
+            continue
+        added, removed = count
+        total_added += added
+        total_removed += removed
+        # Every change gets at least one sign, however small it is next to the others.
+        bar = "+" * max(added and 1, round(added * scale)) + "-" * max(removed and 1, round(removed * scale))
+        print(f" {change.rel_path:<{name_width}} | {added + removed:>{count_width}} {bar}".rstrip())
+    print(
+        f" {len(changes)} file{'s' if len(changes) != 1 else ''} changed, "
+        f"{total_added} insertion{'s' if total_added != 1 else ''}(+), "
+        f"{total_removed} deletion{'s' if total_removed != 1 else ''}(-)"
+    )
+
+
+def inner_diff(
+    commits: List[str], cached: bool = False, stat: bool = False, name_only: bool = False,
+    paths: Optional[List[str]] = None
+) -> None:
+    """Shows the changes between the index and the repository, HEAD (or a commit) and the index (`cached`),
+    a commit and the repository, or two commits, as a unified diff.
+    Files with the same object id are known to be equal without being read, and the others are diffed
+    a window of lines at a time, so even huge files are diffed in bounded memory.
+    """
+    if len(commits) > 2:
+        raise ValueError("Give at most two commits to compare.")
+    if cached and len(commits) > 1:
+        raise ValueError("`--cached` compares the index to a single commit.")
+    rel_paths = get_repo_paths(paths or [])
+    changes = get_changes(commits, cached, rel_paths)
+    if rel_paths:
+        changes = [change for change in changes if is_under(change.rel_path, rel_paths)]
+
+    if name_only:
+        for change in changes:
+            print(change.rel_path)
+    elif stat:
+        if changes:
+            print_stat(changes)
+    else:
+        sys.stdout.flush()
+        out = sys.stdout.buffer
+        for change in changes:
+            out.writelines(iter_patch(change))
+        out.flush()
+
+
+def diff(
+    commits: List[str], cached: bool = False, stat: bool = False, name_only: bool = False,
+    paths: Optional[List[str]] = None
+) -> bool:
+    try:
+        inner_diff(commits, cached, stat, name_only, paths)
+    except (CommitRequiredError, CommitIdError, ValueError) as e:
+        logger.warning(e)
+        return False
+    return True
@@ -0,0 +1,245 @@
+import os
+import shutil
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Set, Tuple
+
+from loguru import logger
+
+import Swit.common.bloom as bloom
+import Swit.common.commit_graph as commit_graph
+import Swit.common.compression as compression
+import Swit.common.config as config
+import Swit.common.index as index
+import Swit.common.objects as objects
+import Swit.common.pack as pack
+import Swit.common.paths as path_to
+from Swit.common.exceptions import CommitRequiredError
+from Swit.common.helper_funcs import get_commit_metadata, get_metadata_path, read_references
+
+
+# Blobs bigger than this are always stored whole: finding a delta for them would take too long.
+DELTA_MAX_SIZE = 1024 * 1024
+# Unreachable loose objects younger than this may belong to a commit that is being created.
+PRUNE_GRACE_SECONDS = 60 * 60
+
+
+# Reachability:
+
+def get_reachable_commits() -> List[str]:
+    """Returns the ids of all commits that HEAD, a branch, or a merge in progress lead to, newest first."""
+    refs = [commit_id for _, commit_id in read_references()]
+    if path_to.merge_head.exists():
+        refs.append(path_to.merge_head.read_text().strip())
+    reachable = []
+    seen = set()
+    pending = deque(refs)
+    while pending:
+        commit_id = pending.popleft()
+        if commit_id in seen or commit_id == "None":
+            continue
+        seen.add(commit_id)
+        reachable.append(commit_id)
+        pending.extend(get_commit_metadata(commit_id).get("parent", "None").split(","))
+    return reachable
+
+
+def upgrade_legacy_image(commit_id: str) -> str:
+    """Images committed before the object store existed are plain dirs.
+    Their content is stored, and the id of its tree is written to the metadata file, so the dir can be removed.
+    """
+    metadata = get_commit_metadata(commit_id)
+    if metadata.get("tree"):
+        return metadata["tree"]
+    tree_id = objects.write_tree_from_dir(path_to.images / commit_id)
+    metadata_path = get_metadata_path(commit_id)
+    metadata_path.write_text(f"tree={tree_id}\n" + metadata_path.read_text())
+    return tree_id
+
+
+def get_reachable_objects(commit_ids: List[str]) -> Tuple[Set[str], Dict[str, List[str]]]:
+    """Returns the ids of all trees and blobs of the given commits and of the index.
+    Blobs are also grouped by the path they were first seen at, newest version first,
+    as different versions of the same file are the most likely to be similar.
+    """
+    reachable = set()
+    versions = {}
+
+    def add_blob(rel_path: str, object_id: str) -> None:
+        if object_id not in reachable:
+            reachable.add(object_id)
+            versions.setdefault(rel_path, []).append(object_id)
+
+    def walk(tree_id: str, prefix: str) -> None:
+        reachable.add(tree_id)
+        for entry in objects.read_tree(tree_id):
+            if entry.mode != objects.DIR_MODE:
+                add_blob(prefix + entry.name, entry.object_id)
+            elif entry.object_id not in reachable:
+                walk(entry.object_id, f"{prefix}{entry.name}/")
+
+    entries = index.read_index()
+    for entry in entries.values():
+        add_blob(entry.path, entry.object_id)
+    for commit_id in commit_ids:
+        tree_id = upgrade_legacy_image(commit_id)
+        if tree_id not in reachable:
+            walk(tree_id, "")
+    # Trees cached by the index may not be committed yet:
+    for rel_dir, tree_id in entries.trees.items():
+        if tree_id not in reachable and objects.has_object(tree_id):
+            walk(tree_id, f"{rel_dir}/" if rel_dir else "")
+    return reachable, versions
+
+
+# Packing:
+
+def is_kept_loose(object_id: str) -> bool:
+    """Content that was stored uncompressed because it's already compressed gains nothing from a pack,
+    and stays loose so it can still be checked out using reflinks and hardlinks.
+    """
+    path = objects.get_object_path(object_id)
+    if not path.exists():
+        return False
+    with open(path, "rb") as f:
+        return not compression.is_compressible(f.read(objects.SAMPLE_SIZE))
+
+
+def find_deltas(versions: Dict[str, List[str]], packed: Set[str]) -> Dict[str, Tuple[str, bytes]]:
+    """Returns a delta and the id of its base for every blob that is much smaller stored as a delta.
+    Each version of a file is compared to the few newer versions before it (`pack.window`),
+    so the newest version is stored whole and older ones are rebuilt from it.
+    A delta is never based on a blob that is already `pack.depth` deltas deep.
+    """
+    window_size = config.get_int("pack.window")
+    max_depth = config.get_int("pack.depth")
+    deltas = {}
+    depths = {}
+    for object_ids in versions.values():
+        window = deque(maxlen=window_size)
+        for object_id in object_ids:
+            if object_id not in packed:
+                continue
+            with objects.open_object(object_id) as f:
+                data = f.read(DELTA_MAX_SIZE + 1)
+            if len(data) > DELTA_MAX_SIZE:
+                continue
+            best = None
+            for base_id, base_data in window:
+                if depths.get(base_id, 0) >= max_depth:
+                    continue
+                delta = pack.create_delta(base_data, data)
+                if len(delta) < len(data) // 2 and (best is None or len(delta) < len(best[1])):
+                    best = (base_id, delta)
+            if best:
+                deltas[object_id] = best
+                depths[object_id] = depths.get(best[0], 0) + 1
+            window.appendleft((object_id, data))
+    return deltas
+
+
+def get_pack_entries(packed: Set[str], deltas: Dict[str, Tuple[str, bytes]]) -> Iterator[pack.PackEntry]:
+    for object_id in sorted(packed):
+        if object_id in deltas:
+            base_id, delta = deltas[object_id]
+            yield pack.PackEntry(object_id, base_id, delta)
+        else:
+            yield pack.PackEntry(object_id, None, objects.open_object(object_id))
+
+
+# Pruning:
+
+def get_loose_objects() -> Iterator[Tuple[str, str]]:
+    """Yields the id and path of every loose object."""
+    for dir_entry in os.scandir(path_to.objects):
+        if len(dir_entry.name) != 2 or not dir_entry.is_dir():
+            continue
+        for entry in os.scandir(dir_entry.path):
+            if not entry.name.startswith("tmp_"):
+                yield dir_entry.name + entry.name.partition(".")[0], entry.path
+
+
+def prune_objects(reachable: Set[str], packed: Set[str]) -> int:
+    """Removes loose objects that were packed, and unreachable loose objects. Returns how many were removed."""
+    removed = 0
+    expiry = time.time() - PRUNE_GRACE_SECONDS
+    for object_id, path in get_loose_objects():
+        if object_id in packed or (object_id not in reachable and os.stat(path).st_mtime < expiry):
+            os.unlink(path)
+            removed += 1
+    for dir_entry in os.scandir(path_to.objects):
+        if len(dir_entry.name) == 2 and not os.listdir(dir_entry.path):
+            os.rmdir(dir_entry.path)
+    return removed
+
+
+def prune_images(reachable_commits: Set[str]) -> int:
+    """Removes the metadata of unreachable commits, and the dirs of images created before the object store.
+    Returns the number of commits that were removed; the commit graph must then be rewritten.
+    """
+    removed = 0
+    for path in path_to.images.iterdir():
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.stem not in reachable_commits:
+            path.unlink()
+            removed += 1
+    if path_to.parents.exists():
+        lines = path_to.parents.read_text().splitlines(keepends=True)
+        path_to.parents.write_text("".join(
+            line for line in lines if line.partition("=")[0] in reachable_commits
+        ))
+    return removed
+
+
+def get_disk_usage() -> int:
+    return sum(
+        os.path.getsize(os.path.join(dir_path, name))
+        for dir_path, _, names in os.walk(path_to.wit_repo) for name in names
+    )
+
+
+def inner_gc() -> None:
+    """Packs every reachable object into a single pack, storing similar blobs as deltas,
+    and removes everything that is no longer needed: loose objects that were packed, older packs,
+    unreachable objects and commits, and the dirs of legacy images.
+    """
+    if not path_to.references.exists():
+        raise CommitRequiredError("Must commit at least once before running `gc`.")
+    size_before = get_disk_usage()
+    commit_ids = get_reachable_commits()
+    reachable, versions = get_reachable_objects(commit_ids)
+    packed = {object_id for object_id in reachable if not is_kept_loose(object_id)}
+    deltas = find_deltas(versions, packed)
+
+    old_packs = [(p.pack_path, p.idx_path) for p in pack.get_packs()]
+    new_pack = pack.write_pack(get_pack_entries(packed, deltas)) if packed else None
+    for pack_path, idx_path in old_packs:
+        if pack_path != new_pack:
+            idx_path.unlink()
+            pack_path.unlink()
+    pruned_objects = prune_objects(reachable, packed)
+    pruned_commits = prune_images(set(commit_ids))
+    if pruned_commits:
+        # Changed-path filters are kept by position in the graph, so they are written again (by commit id):
+        had_filters = path_to.bloom_index.exists()
+        known = bloom.get_filters_by_id()
+        commit_graph.write_graph()
+        bloom.remove_filters()
+        if had_filters:
+            bloom.write_filters(known)
+
+    logger.info(
+        f">>> Packed {len(packed)} objects ({len(deltas)} as deltas); "
+        f"removed {pruned_objects} loose objects and {pruned_commits} unreachable commits."
+    )
+    logger.info(f">>> `.swit` size: {size_before / 1024:.1f} KiB -> {get_disk_usage() / 1024:.1f} KiB.")
+
+
+def gc() -> bool:
+    try:
+        inner_gc()
+    except CommitRequiredError as e:
+        logger.warning(e)
+        return False
+    return True
@@ -1,65 +1,118 @@
-from collections import defaultdict
-from pathlib import Path
-from typing import Dict, List, Tuple
+import heapq
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
 
-import Swit.common.paths as path_to
-import networkx as nx
-from Swit.common.helper_funcs import get_head_id
-from matplotlib import pyplot as plt
+from loguru import logger
 
+import Swit.common.paths as path_to
+from Swit.common.commit_graph import CommitGraph, read_graph_with
+from Swit.common.exceptions import CommitRequiredError
+from Swit.common.helper_funcs import get_commit_metadata, get_head_id, get_ref_names
 
-def get_parent_file_content() -> List[str]:
-    return path_to.parents.read_text().split("\n")
 
+# Walking:
 
-def get_parents_by_image() -> Dict[str, List[str]]:
-    """Returns a defaultdict representing each commit id, and the commit id of it's parent(s).
-    Example: {'123': ['234'], '234': ['345', '678']}
+def walk_topological(history: CommitGraph, is_all: bool, since: int = 0) -> Iterator[int]:
+    """Yields the positions of commits, every commit before its parents, starting from HEAD.
+    If is_all is True, every commit is yielded (the newest first).
+    Commits are yielded as they are found, keeping only the commits waiting to be visited in memory:
+    a commit never has a higher generation than its children, so the highest generation is always safe to yield.
+    Commits made before `since` (seconds since the epoch) are not visited, nor are their parents.
+    """
+    if is_all:
+        for position in range(len(history) - 1, -1, -1):
+            if history.times[position] >= since:
+                yield position
+        return
+
+    head = history.find(get_head_id())
+    queue = [(-history.generations[head], -head)]
+    seen = {head}
+    while queue:
+        _, position = heapq.heappop(queue)
+        position = -position
+        if history.times[position] < since:
+            continue
+        yield position
+        for parent in history.parents_of(position):
+            if parent not in seen:
+                seen.add(parent)
+                heapq.heappush(queue, (-history.generations[parent], -parent))
+
+
+def get_shown_parents(history: CommitGraph, position: int, since: int) -> List[int]:
+    return [parent for parent in history.parents_of(position) if history.times[parent] >= since]
+
+
+# Drawing:
+
+def draw_transition(moves: List[Tuple[int, int]]) -> Iterator[str]:
+    """Draws the lines going from one row of lanes to the next. Each move is a (from, to) pair of lane numbers.
+    Every line moves by at most one lane per row, so a long move takes a few rows:
+    `\\` moves right, `/` moves left, and `|` stays.
     """
-    parent_file_content = get_parent_file_content()
-
-    batman_commit_id, _, no_parents = parent_file_content[0].partition("=")
-    image_and_parents = defaultdict(list, {batman_commit_id: []})
-
-    for line in parent_file_content[1:]:
-        image, _, parents = line.strip().partition("=")
-        parents = parents.split(",")
-        image_and_parents[image].extend(parent for parent in parents)
-
-    return image_and_parents
-
-
-def edgenerator(
-    image_and_parents: Dict[str, List[str]]
-) -> List[Tuple[str, str]]:
-    """Iterates over the parents_by_image dict, and returns a list of tuples -
-    each tuple represents the child and parent nodes. If a node has more than one
-    parent, it shall be represented with multiple tuples.
-    For a list ['a', 'b', 'c'], will return [('a', 'b'), ('b', 'c')]."""
-    return [
-        (node, parent)
-        for node, parents in image_and_parents.items()
-        for parent in parents
-    ]
-
-
-def get_parent_edges_of(
-    image_and_parents: Dict[str, List[str]], image_id: str
-) -> List[Tuple[str, str]]:
-    """Starting from a certain id (HEAD in this case), returns all parents until the first commit."""
-    edges = []
-    awaiting = [image_id]
-    i = 0
-    for i in range(len(awaiting)):
-        cur_image = awaiting[i]
-        parents = image_and_parents[cur_image]
-        for parent in parents:
-            edges.append((cur_image, parent))
-            awaiting.append(parent)
-    return edges
+    moves = [list(move) for move in moves]
+    while any(start != end for start, end in moves):
+        width = 2 * max(max(start, end) for start, end in moves) + 2
+        row = [" "] * width
+        for move in moves:
+            start, end = move
+            if start < end:
+                row[2 * start + 1] = "\\"
+                move[0] += 1
+            elif start > end:
+                row[2 * start - 1] = "/"
+                move[0] -= 1
+            else:
+                row[2 * start] = "|"
+        yield "".join(row).rstrip()
+
+
+def draw_commit(lanes: List[int], column: int, text: str) -> str:
+    row = " ".join("*" if i == column else "|" for i in range(len(lanes)))
+    return f"{row} {text}"
+
+
+def render_graph(
+    history: CommitGraph, positions: Iterator[int], since: int, describe
+) -> Iterator[str]:
+    """Yields the rows of a `git log --graph` style drawing, as the commits are given (children first).
+    Each lane holds the commit it's waiting for; only the current lanes are kept in memory.
+    """
+    lanes = []
+    for position in positions:
+        # Lanes waiting for this commit join into the leftmost one:
+        columns = [i for i, waiting_for in enumerate(lanes) if waiting_for == position]
+        if not columns:
+            lanes.append(position)
+            columns = [len(lanes) - 1]
+        column = columns[0]
+        if len(columns) > 1:
+            joined = [waiting_for for i, waiting_for in enumerate(lanes) if i not in columns[1:]]
+            yield from draw_transition([
+                (i, column if i in columns else joined.index(waiting_for))
+                for i, waiting_for in enumerate(lanes)
+            ])
+            lanes = joined
+
+        yield draw_commit(lanes, column, describe(position))
+
+        # This commit's lane now waits for its first parent; other parents get lanes next to it.
+        # Parents that other lanes already wait for are joined into those.
+        parents = get_shown_parents(history, position, since)
+        new_parents = [parent for parent in parents if parent not in lanes]
+        new_lanes = lanes[:column] + new_parents + lanes[column + 1:]
+        moves = [(i, new_lanes.index(waiting_for)) for i, waiting_for in enumerate(lanes) if i != column]
+        moves += [(column, new_lanes.index(parent)) for parent in parents]
+        yield from draw_transition(moves)
+        lanes = new_lanes
 
 
 def plot_graph(edges: List[Tuple[str, str]]) -> None:
+    # Heavy, needs a display, and only used with `--plot`.
+    import networkx as nx
+    from matplotlib import pyplot as plt
+
     g = nx.DiGraph()
     g.add_edges_from(edges)
     plt.tight_layout()
@@ -67,25 +120,63 @@ def plot_graph(edges: List[Tuple[str, str]]) -> None:
     plt.show()
 
 
-def inner_graph(is_all: bool, show_entire_id: bool) -> None:
-    """Shows a graph of all parental hierarchy, starting from HEAD.
+def parse_since(since: Optional[str]) -> int:
+    """`--since` takes an ISO date, e.g. `2021-01-29` or `2021-01-29T04:35`."""
+    if not since:
+        return 0
+    try:
+        return int(datetime.fromisoformat(since).timestamp())
+    except ValueError:
+        raise ValueError(f"'{since}' is not a valid date. Use an ISO date, e.g. `2021-01-29`.")
+
+
+def inner_graph(
+    is_all: bool, show_entire_id: bool, max_count: Optional[int] = None,
+    since: Optional[str] = None, plot: bool = False
+) -> None:
+    """Shows a graph of all parental hierarchy, starting from HEAD, in the terminal.
     If is_all is True, the graph will show ALL commits and the relations between them.
     If is_entire is True, it will show the entire id of each entry.
+    Rows are printed as the history is walked, so the first rows appear right away, whatever the size of the history.
+    If plot is True, the graph is drawn in a window instead (requires networkx and matplotlib).
     """
-    parents_by_image = get_parents_by_image()
-
-    if is_all:
-        edges = edgenerator(parents_by_image)
-    else:
-        head_id = get_head_id()
-        edges = get_parent_edges_of(parents_by_image, head_id)
-
-    if not show_entire_id:
-        edges = [(x[:6], y[:6]) for x, y in edges]
-
-    plot_graph(edges)
-
-
-def graph(full: bool, entire: bool) -> bool:
-    inner_graph(full, entire)
-    return True
\ No newline at end of file
+    if not path_to.references.exists():
+        raise CommitRequiredError("Must commit at least once before showing the graph.")
+    history = read_graph_with(get_head_id())
+    since_time = parse_since(since)
+    id_length = 40 if show_entire_id else 6
+    positions = walk_topological(history, is_all, since_time)
+    if max_count is not None:
+        positions = (position for _, position in zip(range(max_count), positions))
+
+    if plot:
+        edges = [
+            (history.id_at(position)[:id_length], history.id_at(parent)[:id_length])
+            for position in positions
+            for parent in get_shown_parents(history, position, since_time)
+        ]
+        plot_graph(edges)
+        return
+
+    ref_names = get_ref_names()
+
+    def describe(position: int) -> str:
+        commit_id = history.id_at(position)
+        message = get_commit_metadata(commit_id).get("message", "").partition("\n")[0]
+        names = ref_names.get(commit_id)
+        decoration = f" ({', '.join(names)})" if names else ""
+        return f"{commit_id[:id_length]}{decoration} {message}"
+
+    for row in render_graph(history, positions, since_time, describe):
+        print(row)
+
+
+def graph(
+    full: bool, entire: bool, max_count: Optional[int] = None, since: Optional[str] = None, plot: bool = False
+) -> bool:
+    try:
+        inner_graph(full, entire, max_count, since, plot)
+    except (CommitRequiredError, ValueError) as e:
+        logger.warning(e)
+        return False
+    return True
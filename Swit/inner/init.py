@@ -3,12 +3,10 @@ from typing import Tuple
 
 from loguru import logger
 
-from Swit.common.paths import cwd
 
-
-def create_init_files(repo_path: Path, sub_directory_names: Tuple[str, str]) -> None:
+def create_init_files(repo_path: Path, sub_directory_names: Tuple[str, ...]) -> None:
     """Creates a `.swit` directory in the current working directory; 
-    under it, creates empty dirs `images` and `staging_area`.
+    under it, creates empty dirs `images` and `objects`.
     """
     pathz = [repo_path]
     pathz.extend((repo_path / name) for name in sub_directory_names)
@@ -24,16 +22,18 @@ def create_activated_file(
     activated_path.write_text(content)
 
 
-def inner_init(main_directory_name: str, sub_directory_names: Tuple[str, str]) -> None:
-    """Creates a swit repository, containing `staging_area`, `images`, and `activated.txt`. """
-    repo_path = cwd / main_directory_name
+def inner_init(root: Path, main_directory_name: str, sub_directory_names: Tuple[str, ...]) -> None:
+    """Creates a swit repository in the given dir, containing `images`, `objects`, and `activated.txt`. 
+    The index is created by the first `add`.
+    """
+    repo_path = root / main_directory_name
     create_init_files(repo_path, sub_directory_names)
     create_activated_file(repo_path)
 
 
 def init() -> bool:
     try:
-        inner_init(".swit", ("images", "staging_area"))
+        inner_init(Path.cwd(), ".swit", ("images", "objects"))
     except FileExistsError:
         logger.warning("Cannot initiate a repository inside of another repository.")
         return False
@@ -0,0 +1,180 @@
+import heapq
+import itertools
+import re
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+import Swit.common.bloom as bloom
+import Swit.common.objects as objects
+import Swit.common.paths as path_to
+from Swit.common.commit_graph import DATE_FORMAT, CommitGraph, parse_parents, read_graph_with
+from Swit.common.exceptions import CommitIdError, CommitRequiredError
+from Swit.common.helper_funcs import (
+    get_commit_metadata, get_commit_tree, get_head_id, get_metadata_path, get_ref_names, get_repo_paths,
+    resolve_commit_id
+)
+
+
+# Placeholders of `--format`, the same as Git's.
+PLACEHOLDER = re.compile(r"%(ad|[HhPpTtsbdn%])")
+
+
+class LogEntry(NamedTuple):
+    commit_id: str
+    parents: List[str]
+    metadata: Dict[str, str]
+    time: datetime
+
+
+def read_entry(commit_id: str) -> LogEntry:
+    metadata = get_commit_metadata(commit_id)
+    time = datetime.strptime(metadata["date"], DATE_FORMAT)
+    return LogEntry(commit_id, parse_parents(metadata.get("parent")), metadata, time)
+
+
+def iter_history(start_id: str) -> Iterator[LogEntry]:
+    """Lazily walks the history from a commit, newest first.
+    Only the commits that are yielded, and the few that are waiting to be (their parents), are read,
+    so the first commits come out right away, whatever the length of the history.
+    """
+    counter = itertools.count()
+    start = read_entry(start_id)
+    queue = [(-start.time.timestamp(), next(counter), start)]
+    seen = {start_id}
+    while queue:
+        _, _, entry = heapq.heappop(queue)
+        yield entry
+        for parent_id in entry.parents:
+            if parent_id not in seen:
+                seen.add(parent_id)
+                parent = read_entry(parent_id)
+                heapq.heappush(queue, (-parent.time.timestamp(), next(counter), parent))
+
+
+def get_path_ids(commit_id: str, rel_paths: List[str]) -> Tuple[Optional[str], ...]:
+    tree_id = get_commit_tree(commit_id)
+    return tuple(objects.get_path_id(tree_id, rel_path) for rel_path in rel_paths)
+
+
+def is_path_changed(history: CommitGraph, position: int, rel_paths: List[str]) -> bool:
+    """A commit changed the paths if they differ from every one of its parents (like Git's default history simplification:
+    a merge that took the paths from one of its parents as they were didn't change them).
+    """
+    path_ids = get_path_ids(history.id_at(position), rel_paths)
+    parents = history.parents_of(position)
+    if not parents:
+        return any(path_ids)
+    return all(get_path_ids(history.id_at(parent), rel_paths) != path_ids for parent in parents)
+
+
+def iter_path_history(start_id: str, rel_paths: List[str]) -> Iterator[LogEntry]:
+    """Lazily walks the history from a commit, newest first, yielding only the commits that changed the given paths.
+    The walk goes over the commit graph, so no metadata is read for the commits that are skipped.
+    A commit's changed-path Bloom filter tells for sure that it didn't change the paths (compared to its first parent),
+    so such a commit is skipped without reading any tree; only the commits that might have changed them are checked.
+    """
+    history = read_graph_with(start_id)
+    filters = bloom.read_filters()
+    hashes = [bloom.get_hashes(rel_path) for rel_path in rel_paths]
+    start = history.find(start_id)
+    queue = [(-history.times[start], -start)]
+    seen = {start}
+    while queue:
+        _, position = heapq.heappop(queue)
+        position = -position
+        for parent in history.parents_of(position):
+            if parent not in seen:
+                seen.add(parent)
+                heapq.heappush(queue, (-history.times[parent], -parent))
+
+        commit_filter = filters.get(position) if filters else None
+        if commit_filter is not None and not any(bloom.might_contain(commit_filter, h) for h in hashes):
+            continue
+        if is_path_changed(history, position, rel_paths):
+            yield read_entry(history.id_at(position))
+
+
+# Formatting:
+
+def format_entry(entry: LogEntry, fmt: str, ref_names: Dict[str, List[str]]) -> str:
+    """Fills the placeholders of a format string, e.g. `%h %s`:
+    %H/%h commit id (full/short), %P/%p parent ids, %T/%t tree id, %s subject, %b body,
+    %ad date, %d ref names, %n new line, %% a percent sign.
+    """
+    subject, _, body = entry.metadata.get("message", "").partition("\n")
+    tree_id = entry.metadata.get("tree", "")
+    names = ref_names.get(entry.commit_id)
+    values = {
+        "H": entry.commit_id,
+        "h": entry.commit_id[:6],
+        "P": " ".join(entry.parents),
+        "p": " ".join(parent[:6] for parent in entry.parents),
+        "T": tree_id,
+        "t": tree_id[:6],
+        "s": subject,
+        "b": body,
+        "ad": entry.metadata["date"],
+        "d": f" ({', '.join(names)})" if names else "",
+        "n": "\n",
+        "%": "%",
+    }
+    return PLACEHOLDER.sub(lambda match: values.get(match.group(1), match.group(0)), fmt)
+
+
+def format_medium(entry: LogEntry, ref_names: Dict[str, List[str]]) -> str:
+    lines = [format_entry(entry, "commit %H%d", ref_names)]
+    if len(entry.parents) > 1:
+        lines.append(format_entry(entry, "Merge: %p", ref_names))
+    lines.append(format_entry(entry, "Date:   %ad", ref_names))
+    lines.append("")
+    lines.extend(f"    {line}" for line in entry.metadata.get("message", "").split("\n"))
+    lines.append("")
+    return "\n".join(lines)
+
+
+def get_history(indicator: Optional[str] = None, paths: Optional[List[str]] = None) -> Iterator[LogEntry]:
+    """Returns a lazy walk of the history, starting from HEAD, or from a branch or a commit.
+    If paths are given, only the commits that changed them are yielded.
+    """
+    if not path_to.references.exists():
+        raise CommitRequiredError("Must commit at least once before showing the log.")
+    start_id = resolve_commit_id(indicator) if indicator else get_head_id()
+    if not get_metadata_path(start_id).exists():
+        raise CommitIdError(f"'{indicator}' is not a branch name, nor a commit id.")
+
+    rel_paths = get_repo_paths(paths or [])
+    return iter_path_history(start_id, rel_paths) if rel_paths else iter_history(start_id)
+
+
+def inner_log(
+    indicator: Optional[str] = None, max_count: Optional[int] = None, skip: int = 0,
+    oneline: bool = False, fmt: Optional[str] = None, paths: Optional[List[str]] = None
+) -> None:
+    """Prints the history, starting from HEAD, or from a branch or a commit.
+    Commits are printed as they are read, so the first page shows up right away.
+    If paths are given, only the commits that changed them are printed.
+    """
+    history = get_history(indicator, paths)
+    ref_names = get_ref_names()
+    stop = None if max_count is None else skip + max_count
+    for entry in itertools.islice(history, skip, stop):
+        if fmt is not None:
+            print(format_entry(entry, fmt, ref_names))
+        elif oneline:
+            print(format_entry(entry, "%h%d %s", ref_names))
+        else:
+            print(format_medium(entry, ref_names))
+
+
+def log(
+    indicator: Optional[str] = None, max_count: Optional[int] = None, skip: int = 0,
+    oneline: bool = False, format: Optional[str] = None, paths: Optional[List[str]] = None
+) -> bool:
+    try:
+        inner_log(indicator, max_count, skip, oneline, format, paths)
+    except (CommitRequiredError, CommitIdError, ValueError) as e:
+        logger.warning(e)
+        return False
+    return True
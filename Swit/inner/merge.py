@@ -1,95 +1,123 @@
-import shutil
-from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Dict, Optional, Set, Tuple
 
 from loguru import logger
 
+import Swit.common.commit_graph as commit_graph
+import Swit.common.diff as diff
 import Swit.common.helper_funcs as helper
+import Swit.common.index as index
+import Swit.common.objects as objects
 import Swit.common.paths as path_to
-from Swit.common.exceptions import CommitIdError, ImpossibleMergeError
+import Swit.inner.checkout as checkout
+from Swit.common.exceptions import CommitIdError, ImpossibleMergeError, MergeConflictError
 from Swit.inner.commit import inner_commit
-from Swit.inner.graph import get_parent_file_content, get_parents_by_image
 
 
-def is_merge_possible(head_dir_path: Path) -> bool:
-    """`merge()` will fail to execute if the content of staging_area 
+def is_merge_possible(head_tree_id: str) -> bool:
+    """`merge()` will fail to execute if the content of the index 
     is different from the content of HEAD.
-    Returns a boolean value of if files were either added or changed.
     """
-    head_files = helper.get_relpaths(head_dir_path)
-    staging_area_files = helper.get_relpaths(path_to.staging_area)
+    with index.IndexFile() as entries:
+        return not index.diff_tree(head_tree_id, entries)
 
-    return not (
-        head_files.symmetric_difference(staging_area_files)
-        or any(get_changed_files(head_dir_path, path_to.staging_area))
+
+def get_merge_base(head_commit_id: str, user_commit_id: str) -> str:
+    """Returns the commit id of the merge base of HEAD and the chosen image:
+    the nearest commit that both of them descend from.
+    """
+    base_id = commit_graph.get_merge_base(head_commit_id, user_commit_id)
+    if base_id is None:
+        raise ImpossibleMergeError("HEAD and the chosen image share no history.")
+    return base_id
+
+
+# A file's (mode, object id), or None where it doesn't exist.
+FileVersion = Optional[Tuple[str, str]]
+
+
+def merge_file(
+    base: FileVersion, ours: FileVersion, theirs: FileVersion, their_name: str
+) -> Tuple[FileVersion, Optional[bytes]]:
+    """Merges a file that was changed differently on both sides since the merge base.
+    Returns its merged version, or None and the content to leave in the repository for the user to resolve
+    (None to leave the file as it is in HEAD).
+    """
+    if ours is None or theirs is None:
+        # Changed on one side, and removed on the other: the changed version is left for the user.
+        return None, objects.read_object(theirs[1]) if theirs else None
+    # A side that only changed the mode takes the mode of the other side:
+    mode = theirs[0] if ours[0] == (base or ours)[0] else ours[0]
+    if ours[1] == theirs[1]:
+        return (mode, ours[1]), None
+
+    base_data = objects.read_object(base[1]) if base else b""
+    our_data = objects.read_object(ours[1])
+    their_data = objects.read_object(theirs[1])
+    if any(diff.is_binary(data) for data in (base_data, our_data, their_data)):
+        return None, None
+    lines, conflicts = diff.merge_lines(
+        diff.split_lines(base_data), diff.split_lines(our_data), diff.split_lines(their_data), "HEAD", their_name
     )
+    if conflicts:
+        return None, b"".join(lines)
+    return (mode, objects.write_object("blob", b"".join(lines))), None
 
 
-def get_commit_ids(user_input: str) -> Tuple[str, str, str]:
-    """Returns the commit id of HEAD, of the chosen image, and common parent image."""
-    head_commit_id = helper.get_head_id()
-    user_commit_id = helper.resolve_commit_id(user_input)
-    common_base_id = get_first_mutual_parent(head_commit_id, user_commit_id)
-    return head_commit_id, user_commit_id, common_base_id
-
-
-def get_parents_of(image_and_parents: Dict[str, List[str]], commit_id: str) -> Set[str]:
-    """Returns a set of all parents of a given commit id."""
-    parents = None
-    parents_list = [commit_id]
-    i = 0
-    while i < len(parents_list):
-        cur_image = parents_list[i]
-        parents = image_and_parents[cur_image]
-        for parent in parents:
-            parents_list.append(parent)
-        i += 1
-    return set(parents_list)
-
-
-def get_first_mutual_parent(head_commit_id: str, user_commit_id: str) -> str:
-    """Returns the the commit id of the first mutual parent of HEAD and the chosen image."""
-    parent_file_content = get_parent_file_content()
-    parents_dict = get_parents_by_image()
-
-    head_parents = get_parents_of(parents_dict, head_commit_id)
-    input_parents = get_parents_of(parents_dict, user_commit_id)
-    mutual_parents = head_parents & input_parents
-
-    # Beginning from the end, 
-    # checks the parent list to see if the commit id is included in the mutual parents.
-    reversed_content = parent_file_content[::-1]
-    for line in reversed_content:
-        commit_id = line.split("=")[0]
-        if commit_id in mutual_parents:
-            return commit_id
-
-
-def get_changed_files(since_dir: Path, until_dir: Path) -> Tuple[Set[Path], Set[Path]]:
-    """Returns files that were added and files that were changed, between dir a and dir b.
-    When called through `merge()`, the returned files are since the first mutual parent,
-    until the chosen image to merge.
+def merge_trees(
+    base_tree_id: str, head_tree_id: str, user_tree_id: str, their_name: str
+) -> Tuple[Dict[str, FileVersion], Dict[str, Optional[bytes]]]:
+    """A three-way merge of HEAD and the chosen image, from their merge base.
+    Returns the merged version of every file that should change in HEAD (None to remove it),
+    and the files that conflict (with the content to leave in the repository for the user to resolve).
+
+    Only the dirs that changed since the merge base are compared, and a file that changed on a single side
+    takes that side's version without being read: only files changed on both sides are merged line by line.
     """
-    since_dir_files = helper.get_relpaths(since_dir)
-    until_dir_files = helper.get_relpaths(until_dir)
-    added_files = until_dir_files - since_dir_files
-    mutual_files = until_dir_files & since_dir_files
-    changed_files = helper.get_files_with_different_content(since_dir, until_dir, mutual_files)
-    return added_files, changed_files
+    our_changes = objects.diff_trees(base_tree_id, head_tree_id)
+    their_changes = objects.diff_trees(base_tree_id, user_tree_id)
+    merged = {}
+    conflicts = {}
+    for rel_path, (base, theirs) in their_changes.items():
+        if rel_path not in our_changes:
+            merged[rel_path] = theirs
+            continue
+        ours = our_changes[rel_path][1]
+        if ours == theirs:
+            continue
+        version, conflict = merge_file(base, ours, theirs, their_name)
+        if version is not None:
+            merged[rel_path] = version
+        else:
+            conflicts[rel_path] = conflict
+    return merged, conflicts
+
+
+def check_files_unchanged(rel_paths: Set[str]) -> None:
+    """The merge writes files in the repository, so it must not overwrite changes that were not committed."""
+    entries = index.read_index()
+    existing = {rel_path for rel_path in rel_paths if (path_to.repo / rel_path).is_file()}
+    untracked = existing - entries.keys()
+    changed = helper.get_files_with_different_content(path_to.repo, entries, existing & entries.keys())
+    if untracked or changed:
+        raise ImpossibleMergeError(
+            f"The merge would overwrite changes to: {', '.join(sorted(untracked | changed))}. Commit them first."
+        )
 
 
-def update_staging_area(
-    path_to_user_dir: Path, added_files: Set[Path], changed_files: Set[Path]
-) -> None:
-    """Added files are the files that exist in the chosen image to merge, and do not exist in the
-    mutual parent dir. Those files shall be added to staging_area;
-    Mutual files are files that exist it both versions, but the content has changed. Those files
-    shall be replaced to their newer version (merge conflicts are not handled).
+def update_repo_and_index(merged: Dict[str, FileVersion], conflicts: Dict[str, Optional[bytes]]) -> None:
+    """Writes the merged files to the repository and the index.
+    Conflicting files are written with conflict markers to the repository only; the index keeps HEAD's version.
     """
-    helper.copy_changed_files(path_to_user_dir, path_to.staging_area, added_files)
-    helper.copy_changed_files(
-        path_to_user_dir, path_to.staging_area, changed_files, replace=True
-    )
+    removed_files = {rel_path for rel_path, version in merged.items() if version is None}
+    written_files = {rel_path: version for rel_path, version in merged.items() if version is not None}
+    checkout.remove_files(removed_files)
+    objects.materialize_files(written_files, path_to.repo)
+    checkout.update_index(removed_files, written_files)
+    for rel_path, content in conflicts.items():
+        if content is not None:
+            fp = path_to.repo / rel_path
+            fp.parent.mkdir(parents=True, exist_ok=True)
+            fp.write_bytes(content)
 
 
 def get_commit_merge_message(
@@ -100,17 +128,15 @@ def get_commit_merge_message(
     Example: `Merged 123456 (HEAD) with 654321 (<branch_name>)`.
     """
     shortened_head_id = head_commit_id[:6]
-    is_id = user_input == user_commit_id
     merged_with = (
-        user_commit_id[:6] if is_id else f"{user_commit_id[:6]} ({user_input})"
+        f"{user_commit_id[:6]} ({user_input})" if helper.is_reference_name(user_input) else user_commit_id[:6]
     )
     commit_message = f"Merged {shortened_head_id} (HEAD) with {merged_with}."
     return commit_message
 
 
 def commit_merge(
-    new_commit_id: str, head_commit_id: str, user_commit_id: str, 
-    user_input: str
+    head_commit_id: str, user_commit_id: str, user_input: str
 ) -> None:
     """A commit is performed automatically after merging.
 
@@ -124,27 +150,27 @@ def commit_merge(
         head_commit_id, user_commit_id, user_input
     )
     parents = f"{head_commit_id},{user_commit_id}"
-    inner_commit(commit_message, new_commit_id, parents, is_merge=True)
+    inner_commit(commit_message, parents, is_merge=True)
 
 
-def get_merge_paths(user_input: str):
-    """Returns the commit id and image path of the user image, HEAD, and their first mutual parent."""
+def get_merge_trees(user_input: str):
+    """Returns the commit id of the user image and HEAD, and the tree id of both and of their merge base."""
     # Head:
     head_commit_id = helper.get_head_id()
-    head_dir_path = path_to.images / head_commit_id
+    head_tree_id = helper.get_commit_tree(head_commit_id)
     # User Image:
     user_commit_id = helper.resolve_commit_id(user_input)
-    user_dir_path = helper.get_valid_commit_path(user_commit_id, user_input)
-    # Common Base Image:
-    common_base_id = get_first_mutual_parent(head_commit_id, user_commit_id)
-    common_base_dir_path = path_to.images / common_base_id
+    user_tree_id = helper.get_valid_commit_tree(user_commit_id, user_input)
+    # Merge Base Image:
+    common_base_id = get_merge_base(head_commit_id, user_commit_id)
+    common_base_tree_id = helper.get_commit_tree(common_base_id)
 
     return (
         head_commit_id,
         user_commit_id,
-        head_dir_path,
-        user_dir_path,
-        common_base_dir_path
+        head_tree_id,
+        user_tree_id,
+        common_base_tree_id
     )
 
 
@@ -152,39 +178,44 @@ def inner_merge(
     user_input: str,
     head_commit_id: str,
     user_commit_id: str,
-    head_dir: Path,
-    user_dir: Path,
-    common_base_dir: Path,
+    head_tree_id: str,
+    user_tree_id: str,
+    common_base_tree_id: str,
 ) -> None:
-    """Integrates HEAD and another chosen commit (by branch name or commit id).
-    staging_area will be updated to the integrated version, and commit normally.
-    The content of the repository will not change.
+    """Integrates HEAD and another chosen commit (by branch name or commit id), with a three-way merge.
+    The repository and the index are updated to the merged version, and committed.
+    If some files conflict, the others are merged, and the conflicting ones are left with conflict markers;
+    the merge is committed by `commit`, after the user resolved and added them.
     """
-    if not is_merge_possible(head_dir):
+    if path_to.merge_head.exists():
+        raise ImpossibleMergeError("A merge is in progress. Resolve the conflicts, `add` the files, and `commit` it first.")
+    if not is_merge_possible(head_tree_id):
         raise ImpossibleMergeError(
             "Seems like you are not working on the most up to date version. To do so, please execute `checkout HEAD`."
         )
-    # Get added\changed files, replace content of staging area:
-    changed_files = get_changed_files(common_base_dir, user_dir)
-    update_staging_area(user_dir, *changed_files)
-    # Commit:
-    new_commit_id = helper.generate_commit_id()
-    commit_merge(new_commit_id, head_commit_id, user_commit_id, user_input)
+    merged, conflicts = merge_trees(common_base_tree_id, head_tree_id, user_tree_id, user_input)
+    check_files_unchanged(merged.keys() | conflicts.keys())
+    update_repo_and_index(merged, conflicts)
+    commit_message = get_commit_merge_message(head_commit_id, user_commit_id, user_input)
+    if conflicts:
+        path_to.merge_head.write_text(user_commit_id)
+        path_to.merge_message.write_text(commit_message)
+        raise MergeConflictError(sorted(conflicts))
+    commit_merge(head_commit_id, user_commit_id, user_input)
 
 
 def merge(indicator: str) -> bool:
     try:
-        paths = get_merge_paths(indicator)
-    except CommitIdError as e:
+        trees = get_merge_trees(indicator)
+    except (CommitIdError, ImpossibleMergeError) as e:
         logger.warning(e)
         return False
 
     try:
-        inner_merge(indicator, *paths)
-    except ImpossibleMergeError as e:
+        inner_merge(indicator, *trees)
+    except (ImpossibleMergeError, MergeConflictError) as e:
         logger.warning(e)
         return False
 
     logger.info(">>> Merge was executed successfully.")
     return True
-    
\ No newline at end of file
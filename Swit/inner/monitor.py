@@ -0,0 +1,62 @@
+import errno
+
+from loguru import logger
+
+import Swit.common.inotify as inotify
+import Swit.common.monitor as fs_monitor
+from Swit.common.exceptions import MonitorError
+from Swit.common.helper_funcs import start_in_background
+
+
+# Seconds to wait for a new monitor to watch the whole repository.
+START_TIMEOUT = 60
+
+
+def start_monitor() -> None:
+    """Starts the monitor as a background process, and waits until it watches the whole repository."""
+    if fs_monitor.ping() is not None:
+        logger.info(">>> The monitor is already running.")
+        return
+    try:
+        inotify.Inotify().close()
+    except OSError as e:
+        raise MonitorError(f"Can't watch the repository: {e}")
+    if not start_in_background("monitor", lambda: fs_monitor.ping() is not None, START_TIMEOUT):
+        raise MonitorError("The monitor failed to start. Run `Swit monitor run` to see why.")
+    logger.info(">>> The monitor is running; `status` now checks only the files that changed.")
+
+
+def inner_monitor(action: str) -> None:
+    """Starts, stops or runs (in the foreground) the filesystem monitor, or tells if it's running."""
+    if action == "start":
+        start_monitor()
+    elif action == "stop":
+        if not fs_monitor.stop():
+            raise MonitorError("The monitor is not running.")
+        logger.info(">>> The monitor was stopped.")
+    elif action == "run":
+        try:
+            fs_monitor.serve()
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise MonitorError(
+                    "Can't watch every dir of the repository; raise the limit with `sysctl fs.inotify.max_user_watches=<n>`."
+                )
+            raise MonitorError(f"Can't watch the repository: {e}")
+        except KeyboardInterrupt:
+            pass
+    else:
+        info = fs_monitor.ping()
+        if info is None:
+            print("The monitor is not running.")
+        else:
+            print(f"The monitor is running: watching {info[0]} dirs, {info[1]} paths changed since it started.")
+
+
+def monitor(action: str = "status") -> bool:
+    try:
+        inner_monitor(action)
+    except MonitorError as e:
+        logger.warning(e)
+        return False
+    return True
@@ -0,0 +1,43 @@
+from loguru import logger
+
+import Swit.common.server as command_server
+from Swit.common.exceptions import ServerError
+from Swit.common.helper_funcs import start_in_background
+
+
+# Seconds to wait for a new server to load.
+START_TIMEOUT = 30
+
+
+def inner_server(action: str) -> None:
+    """Starts, stops or runs (in the foreground) the server of the repository, or tells if it's running.
+    While it runs, every `Swit` command in the repository is sent to it, and runs without starting Python,
+    importing Swit or reading the repository from scratch. Without it, commands run in their own process, as usual.
+    """
+    if action == "start":
+        if command_server.ping():
+            logger.info(">>> The server is already running.")
+            return
+        if not start_in_background("server", command_server.ping, START_TIMEOUT):
+            raise ServerError("The server failed to start. Run `Swit server run` to see why.")
+        logger.info(">>> The server is running; commands in this repository now run on it.")
+    elif action == "stop":
+        if not command_server.stop():
+            raise ServerError("The server is not running.")
+        logger.info(">>> The server was stopped.")
+    elif action == "run":
+        try:
+            command_server.serve()
+        except KeyboardInterrupt:
+            pass
+    else:
+        print("The server is running." if command_server.ping() else "The server is not running.")
+
+
+def server(action: str = "status") -> bool:
+    try:
+        inner_server(action)
+    except ServerError as e:
+        logger.warning(e)
+        return False
+    return True
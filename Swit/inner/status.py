@@ -1,31 +1,89 @@
 import os
-import re
-import shutil
-from pathlib import Path
-from typing import Dict, List, Set, Tuple, Union
+import posixpath
+from typing import Dict, Mapping, Set, Tuple
 
+import Swit.common.ignore as ignore
+import Swit.common.index as index
+import Swit.common.monitor as monitor
+import Swit.common.objects as objects
 import Swit.common.paths as path_to
 from Swit.common.exceptions import CommitRequiredError
 from Swit.common.helper_funcs import (
-    get_files_with_different_content, get_head_id, get_relpaths
+    get_commit_tree, get_files_with_different_content, get_head_id, get_relpaths, is_scanned
 )
+from Swit.common.workers import measure_throughput
 from loguru import logger
 
 
-def get_changes_to_be_committed() -> Set[Path]:
-    """After every time `add` is performed, the filepath is added to this text file."""
-    return {Path(path) for path in path_to.changes_to_be_committed.read_text().split("\n") if path}
+def get_changes_to_be_committed(head_id: str, entries: Mapping[str, index.IndexEntry]) -> Set[str]:
+    """Returns the files that differ between HEAD and the index. Nothing is stored.
+    The cached trees of dirs that nothing was added under are equal to HEAD's,
+    so only the dirs that changed are compared.
+    """
+    return set(index.diff_tree(get_commit_tree(head_id), entries))
 
 
-def get_status_info(head_id: str) -> Dict[str, Set[Path]]:
-    """Returns a dict item of all status sections."""
-    original_files = get_relpaths(path_to.repo, ignore_wit=True)
-    added_files = get_relpaths(path_to.staging_area)    
+def scan_repo(entries: Mapping[str, index.IndexEntry], refresh: bool) -> Tuple[Set[str], Set[str]]:
+    """Walks the whole repository. Returns the tracked files whose content differs from the index,
+    and the untracked files.
+    """
+    original_files = get_relpaths(path_to.repo, tracked=entries)
+    added_files = set(entries)
     not_staged = get_files_with_different_content(
-        path_to.repo, path_to.staging_area, original_files & added_files
+        path_to.repo, entries, original_files & added_files, refresh
     )
-    to_be_committed = get_changes_to_be_committed()
-    untracked = original_files - added_files
+    return not_staged, original_files - added_files
+
+
+def scan_paths(rel_paths: Set[str], index_file: index.IndexFile) -> Tuple[Set[str], Set[str]]:
+    """Same as `scan_repo`, but only for the given paths; the index is searched for each of them."""
+    files = {rel_path for rel_path in rel_paths if os.path.isfile(path_to.repo / rel_path)}
+    tracked = {rel_path for rel_path in files if rel_path in index_file}
+    untracked = {rel_path for rel_path in files - tracked if is_scanned(path_to.repo, rel_path)}
+    entries = {rel_path: index_file[rel_path] for rel_path in tracked}
+    return get_files_with_different_content(path_to.repo, entries, tracked), untracked
+
+
+def get_repo_changes(entries: Mapping[str, index.IndexEntry], refresh: bool) -> Tuple[Set[str], Set[str]]:
+    """Returns the tracked files whose content differs from the index, and the untracked files.
+    If the monitor is running (`Swit monitor start`), only the paths it saw change since the last time are checked,
+    along with the ones that were reported then; every other file is known to be as it was.
+    The repository is walked only when the monitor can't tell what changed, or to `refresh` every entry.
+    """
+    state = monitor.read_state()
+    answer = monitor.query(state.token if state else "")
+    if answer is None:
+        return scan_repo(entries, refresh)
+    token, changes = answer
+    if (
+        refresh or state is None or changes is None
+        or any(posixpath.basename(rel_path) == ignore.IGNORE_FILE for rel_path in changes)
+    ):
+        not_staged, untracked = scan_repo(entries, refresh)
+    else:
+        # Entries under a dir that was removed or moved away are only reported by the dir:
+        rel_paths = set(changes) | state.not_staged | state.untracked
+        for rel_path in changes:
+            rel_paths.update(entries.paths_under(rel_path))
+        not_staged, untracked = scan_paths(rel_paths, entries)
+    monitor.write_state(monitor.MonitorState(token, not_staged, untracked))
+    return not_staged, untracked
+
+
+def get_status_info(head_id: str, refresh: bool = False) -> Dict[str, Set[str]]:
+    """Returns a dict item of all status sections.
+    If `refresh` is True, the stat info of unchanged files (and the trees of unchanged dirs)
+    is rewritten to the index after the scan. Otherwise, the index is only parsed as far as needed.
+    """
+    if refresh:
+        entries = index.read_index()
+        not_staged, untracked = get_repo_changes(entries, refresh)
+        to_be_committed = get_changes_to_be_committed(head_id, entries)
+        index.write_index(entries)
+    else:
+        with index.IndexFile() as entries:
+            not_staged, untracked = get_repo_changes(entries, refresh)
+            to_be_committed = get_changes_to_be_committed(head_id, entries)
 
     return {
         "Changes to Be Committed": to_be_committed,
@@ -34,7 +92,7 @@ def get_status_info(head_id: str) -> Dict[str, Set[Path]]:
     }
 
 
-def print_section(section_name: str, filepaths: Union[Set[Path], Set[str]]) -> None:
+def print_section(section_name: str, filepaths: Set[str]) -> None:
     print(f"\n>>> {section_name}:")
     if filepaths:
         for i, fp in enumerate(filepaths, 1):
@@ -44,7 +102,7 @@ def print_section(section_name: str, filepaths: Union[Set[Path], Set[str]]) -> N
 
 
 def print_status(
-    HEAD: str, status_info: Dict[str, Set[Path]]  #: Dict[Set[Path]]
+    HEAD: str, status_info: Dict[str, Set[str]]
 ) -> None:
     print("-" * 60)
     print(f"\n>>> HEAD: {HEAD}")
@@ -53,7 +111,16 @@ def print_status(
     print("\n" + "-" * 60)
 
 
-def inner_status() -> None:
+def get_status_head_id() -> str:
+    try:
+        return get_head_id()
+    except FileNotFoundError:
+        raise CommitRequiredError(
+            "Must commit at least once before executing status."
+        )
+
+
+def inner_status(refresh: bool, stats: bool = False) -> None:
     """Prints a message to the user, including:
     - Changes to Be Committed:
         Files that have been added, but not committed yet.
@@ -61,20 +128,19 @@ def inner_status() -> None:
         Files that have a different content from the indexed file.
     - Untracked Files:
         Files that were neither added nor committed.
+    If `stats` is True, tells how fast the files that had to be read were hashed.
     """
-    try:
-        head_id = get_head_id()
-    except FileNotFoundError:
-        raise CommitRequiredError(
-            "Must commit at least once before executing status."
-        )
-    info = get_status_info(head_id)
+    head_id = get_status_head_id()
+    with measure_throughput() as throughput:
+        info = get_status_info(head_id, refresh)
     print_status(head_id, info)
+    if stats:
+        logger.info(f">>> {throughput}")
 
 
-def status() -> bool:
+def status(refresh: bool, stats: bool = False) -> bool:
     try:
-        inner_status()
+        inner_status(refresh, stats)
     except CommitRequiredError as e:
         logger.warning(e)
         return False
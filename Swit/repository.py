@@ -0,0 +1,158 @@
+import itertools
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Set, Union
+
+import Swit.common.paths as path_to
+
+if TYPE_CHECKING:
+    from Swit.inner.log import LogEntry
+
+
+# Like the CLI, the modules of each command are only imported when one of their methods is first called.
+
+PathLike = Union[str, os.PathLike]
+
+
+class Repository:
+    """A swit repository, to use from Python rather than from the command line:
+
+        repo = Repository("path/to/project")
+        repo.add("src")
+        commit_id = repo.commit("Add src")
+        for entry in repo.log(max_count=10):
+            print(entry.commit_id, entry.metadata["message"])
+
+    The repository is the one that contains the given path. Paths passed to methods are relative to it
+    (not to the working directory, which is never changed). Any number of repositories can be used
+    in one process, from any number of threads.
+    What was read is kept between calls (the index, references, commits, commit graph and config),
+    and read again only once its file changed. Errors are raised, as the exceptions of `Swit.common.exceptions`.
+    """
+
+    def __init__(self, path: PathLike = "."):
+        self.path = path_to.get_repo_path(Path(os.path.abspath(path)))
+
+    def __repr__(self) -> str:
+        return f"Repository('{self.path}')"
+
+    @classmethod
+    def init(cls, path: PathLike = ".") -> "Repository":
+        """Creates a repository in the given dir, and returns it.
+        FileExistsError is raised if the dir is already a repository.
+        """
+        from Swit.inner.init import inner_init
+
+        inner_init(Path(os.path.abspath(path)), ".swit", ("images", "objects"))
+        return cls(path)
+
+    @contextmanager
+    def use(self) -> Iterator["Repository"]:
+        """Makes every swit function called in the block work on this repository."""
+        with path_to.use_repo(self.path):
+            yield self
+
+    def _abs_path(self, path: PathLike) -> str:
+        return os.path.join(self.path, path)
+
+    # References:
+
+    @property
+    def head(self) -> Optional[str]:
+        """The commit id of HEAD; None before the first commit."""
+        from Swit.common.helper_funcs import get_parent
+
+        with self.use():
+            return get_parent()
+
+    @property
+    def active_branch(self) -> str:
+        """The name of the active branch; empty if HEAD is not on a branch."""
+        from Swit.common.helper_funcs import get_active_branch_name
+
+        with self.use():
+            return get_active_branch_name()
+
+    @property
+    def branches(self) -> Dict[str, str]:
+        """The commit id of every branch, by name."""
+        from Swit.common.helper_funcs import read_references
+
+        with self.use():
+            if not path_to.references.exists():
+                return {}
+            return dict(read_references()[1:])
+
+    def resolve(self, indicator: str) -> str:
+        """Returns the commit id of a branch name, a commit id, or the start of one."""
+        from Swit.common.exceptions import CommitIdError
+        from Swit.common.helper_funcs import get_metadata_path, resolve_commit_id
+
+        with self.use():
+            commit_id = resolve_commit_id(indicator) if path_to.references.exists() else indicator
+            if not get_metadata_path(commit_id).exists():
+                raise CommitIdError(f"'{indicator}' is not a branch name, nor a commit id.")
+            return commit_id
+
+    # Commands:
+
+    def add(self, *paths: PathLike) -> None:
+        """Stages files or dirs (or the removal of files that were deleted), with one write of the index."""
+        from Swit.inner.add import inner_add
+
+        with self.use():
+            inner_add([Path(os.path.abspath(self._abs_path(path))) for path in paths])
+
+    def commit(self, message: str) -> str:
+        """Creates a snapshot of the index, and returns its commit id."""
+        from Swit.inner.commit import inner_commit
+
+        with self.use():
+            return inner_commit(message)
+
+    def status(self, refresh: bool = False) -> Dict[str, Set[str]]:
+        """Returns the paths of the changes to be committed, the changes not staged for commit, and the untracked files."""
+        from Swit.inner.status import get_status_head_id, get_status_info
+
+        with self.use():
+            return get_status_info(get_status_head_id(), refresh)
+
+    def checkout(self, indicator: str) -> None:
+        """Updates the files of the repository and the index to a branch or a commit, and moves HEAD to it."""
+        from Swit.inner.checkout import get_checkout_image, inner_checkout
+
+        with self.use():
+            inner_checkout(indicator, *get_checkout_image(indicator))
+
+    def branch(self, name: str) -> None:
+        """Adds a branch at HEAD."""
+        from Swit.inner.branch import add_branch_name_to_references
+
+        with self.use():
+            add_branch_name_to_references(name)
+
+    def merge(self, indicator: str) -> str:
+        """Merges a branch or a commit into HEAD, and returns the id of the merge commit.
+        If some files conflict, MergeConflictError is raised; resolve them, `add` them, and `commit`.
+        """
+        from Swit.common.helper_funcs import get_head_id
+        from Swit.inner.merge import get_merge_trees, inner_merge
+
+        with self.use():
+            inner_merge(indicator, *get_merge_trees(indicator))
+            return get_head_id()
+
+    def log(
+        self, indicator: Optional[str] = None, paths: Optional[List[PathLike]] = None,
+        max_count: Optional[int] = None, skip: int = 0
+    ) -> List["LogEntry"]:
+        """Returns the history, newest first, starting from HEAD, or from a branch or a commit.
+        If paths are given, only the commits that changed them are returned.
+        """
+        from Swit.inner.log import get_history
+
+        with self.use():
+            abs_paths = [self._abs_path(path) for path in paths] if paths else None
+            stop = None if max_count is None else skip + max_count
+            return list(itertools.islice(get_history(indicator, abs_paths), skip, stop))
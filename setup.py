@@ -20,6 +20,9 @@ setup(
         'networkx',
         'matplotlib',
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Intended Audience :: Developers',
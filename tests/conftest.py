@@ -0,0 +1,25 @@
+import os
+import time
+
+import pytest
+
+from Swit import Repository
+
+
+@pytest.fixture
+def repo(tmp_path) -> Repository:
+    return Repository.init(tmp_path)
+
+
+@pytest.fixture
+def write(repo):
+    """Writes a file of the repository. It's dated in the past, so the index can trust its stat info
+    (a file modified in the same tick the index was written in is always read again).
+    """
+    def write(rel_path: str, content: str, age: int = 60) -> None:
+        path = repo.path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+    return write
@@ -0,0 +1,58 @@
+import pytest
+
+import Swit.common.index as index
+import Swit.common.objects as objects
+from Swit.common.workers import measure_throughput
+
+
+def test_add_reads_only_new_and_changed_files(repo, write):
+    for name in ("a", "b", "c"):
+        write(f"d/{name}", name)
+    with repo.use(), measure_throughput() as throughput:
+        repo.add("d")
+    assert throughput.files == 3
+
+    write("d/b", "changed", age=30)
+    write("d/new", "new")
+    with repo.use(), measure_throughput() as throughput:
+        repo.add("d")
+    assert throughput.files == 2
+    with repo.use():
+        entries = index.read_index()
+        assert sorted(entries) == ["d/a", "d/b", "d/c", "d/new"]
+        assert entries["d/b"].object_id == objects.hash_file(repo.path / "d/b")
+
+
+def test_add_stages_removals(repo, write):
+    for name in ("a", "b", "c"):
+        write(f"d/{name}", name)
+    repo.add("d")
+    repo.commit("first")
+
+    (repo.path / "d/a").unlink()
+    repo.add("d")
+    (repo.path / "d/b").unlink()
+    repo.add("d/b")
+
+    with repo.use():
+        assert sorted(index.read_index()) == ["d/c"]
+    assert repo.status()["Changes to Be Committed"] == {"d/a", "d/b"}
+
+
+def test_add_writes_the_index_once(repo, write, monkeypatch):
+    write("x", "x")
+    write("y/z", "z")
+    writes = []
+    original = index.write_index
+    monkeypatch.setattr(index, "write_index", lambda entries: writes.append(1) or original(entries))
+
+    repo.add("x", "y")
+    assert len(writes) == 1
+    # Nothing changed since:
+    repo.add("x", "y")
+    assert len(writes) == 1
+
+
+def test_add_missing_path(repo):
+    with pytest.raises(FileNotFoundError):
+        repo.add("missing")
@@ -0,0 +1,83 @@
+import random
+
+import Swit.common.bloom as bloom
+import Swit.common.commit_graph as commit_graph
+from Swit.inner.commit_graph import inner_commit_graph
+
+
+def test_filters_have_no_false_negatives():
+    rel_paths = {f"dir{i % 7}/file{i}" for i in range(200)}
+    bloom_filter = bloom.make_filter(rel_paths)
+    assert all(bloom.might_contain(bloom_filter, bloom.get_hashes(p)) for p in rel_paths)
+    # About 1% false positives with 10 bits and 7 hashes per path:
+    others = [f"other{i}" for i in range(2000)]
+    false_positives = sum(bloom.might_contain(bloom_filter, bloom.get_hashes(p)) for p in others)
+    assert false_positives < 100
+
+
+def test_commits_with_too_many_paths_match_every_path():
+    bloom_filter = bloom.make_filter({str(i) for i in range(bloom.MAX_PATHS + 1)})
+    assert bloom_filter == b""
+    assert bloom.might_contain(bloom_filter, bloom.get_hashes("anything"))
+
+
+def make_history(repo, write):
+    """Makes commits that each change a few files, and returns the paths each commit changed
+    (files, and the dirs that contain them), newest first.
+    """
+    rng = random.Random(0)
+    names = ["a", "d/b", "d/e/c", "x"]
+    history = []
+    for i in range(12):
+        changed = rng.sample(names, rng.randrange(1, 3)) if i else names
+        for rel_path in changed:
+            write(rel_path, f"{rel_path} {i}", age=100 - i)
+        repo.add(*changed)
+        commit_id = repo.commit(f"commit {i}")
+        paths = set(changed)
+        for rel_path in changed:
+            while "/" in rel_path:
+                rel_path = rel_path.rpartition("/")[0]
+                paths.add(rel_path)
+        history.insert(0, (commit_id, paths))
+    return history
+
+
+def check_path_logs(repo, history):
+    for rel_path in ("a", "d", "d/b", "d/e", "d/e/c", "x", "missing"):
+        expected = [commit_id for commit_id, paths in history if rel_path in paths]
+        assert [entry.commit_id for entry in repo.log(paths=[rel_path])] == expected
+
+
+def test_path_logs_with_and_without_filters(repo, write):
+    history = make_history(repo, write)
+    with repo.use():
+        filters = bloom.read_filters()
+        graph = commit_graph.read_graph()
+        assert len(filters) == len(graph) == 12
+        # Every path a commit changed is in its filter:
+        for commit_id, paths in history:
+            bloom_filter = filters.get(graph.find(commit_id))
+            assert all(bloom.might_contain(bloom_filter, bloom.get_hashes(p)) for p in paths)
+    check_path_logs(repo, history)
+
+    with repo.use():
+        bloom.remove_filters()
+    check_path_logs(repo, history)
+
+
+def test_filters_are_kept_when_the_graph_is_rewritten(repo, write):
+    history = make_history(repo, write)
+    with repo.use():
+        before = bloom.get_filters_by_id()
+        inner_commit_graph(changed_paths=True)
+        assert bloom.get_filters_by_id() == before
+        assert bloom.write_filters() == 0
+
+        # Commits made before filters were kept get one from `commit-graph --changed-paths`:
+        bloom.remove_filters()
+        inner_commit_graph(changed_paths=False)
+        assert bloom.read_filters() is None
+        inner_commit_graph(changed_paths=True)
+        assert bloom.get_filters_by_id() == before
+    check_path_logs(repo, history)
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+import Swit.common.index as index
+from Swit.common.exceptions import CommitRequiredError, ImpossibleCheckoutError
+
+
+def commit_files(repo, write, files, age):
+    for rel_path, content in files.items():
+        write(rel_path, content, age=age)
+    repo.add(*files)
+    return repo.commit(f"{age}")
+
+
+def test_checkout_writes_only_changed_files(repo, write):
+    first_id = commit_files(repo, write, {"f": "1", "g": "1", "d/h": "1"}, 60)
+    commit_files(repo, write, {"f": "2", "d/new": "2"}, 50)
+    g_mtime = os.stat(repo.path / "g").st_mtime_ns
+
+    repo.checkout(first_id)
+    assert (repo.path / "f").read_text() == "1"
+    assert not (repo.path / "d/new").exists()
+    assert os.stat(repo.path / "g").st_mtime_ns == g_mtime
+    with repo.use():
+        assert sorted(index.read_index()) == ["d/h", "f", "g"]
+    assert not any(repo.status().values())
+
+
+def test_checkout_restores_missing_tracked_files(repo, write):
+    first_id = commit_files(repo, write, {"f": "1", "g": "1", "gone": "1"}, 60)
+    commit_files(repo, write, {"f": "2"}, 50)
+    (repo.path / "g").unlink()
+    (repo.path / "f").unlink()
+
+    repo.checkout(first_id)
+    assert (repo.path / "g").read_text() == "1"
+    assert (repo.path / "f").read_text() == "1"
+    with repo.use():
+        assert sorted(index.read_index()) == ["f", "g", "gone"]
+    assert not any(repo.status().values())
+
+
+def test_checkout_refuses_modified_files(repo, write):
+    first_id = commit_files(repo, write, {"f": "1"}, 60)
+    commit_files(repo, write, {"f": "2"}, 50)
+    write("f", "changed", age=40)
+
+    with pytest.raises(ImpossibleCheckoutError) as e:
+        repo.checkout(first_id)
+    assert "\n  f" in str(e.value)
+    assert (repo.path / "f").read_text() == "changed"
+
+
+def test_checkout_before_the_first_commit(repo):
+    with pytest.raises(CommitRequiredError):
+        repo.checkout("master")
@@ -0,0 +1,79 @@
+import pytest
+
+import Swit.common.commit_graph as commit_graph
+from Swit.common.exceptions import MergeConflictError
+
+
+def make_commits(repo, write, count, start=0):
+    commit_ids = []
+    for i in range(start, start + count):
+        write("f", str(i), age=100 - i)
+        repo.add("f")
+        commit_ids.append(repo.commit(f"commit {i}"))
+    return commit_ids
+
+
+def test_find_searches_the_id_index_and_the_commits_after_it(repo, write, monkeypatch):
+    monkeypatch.setattr(commit_graph, "MAX_UNSORTED", 2)
+    commit_ids = make_commits(repo, write, 6)
+    with repo.use():
+        graph = commit_graph.read_graph()
+        assert 0 < graph.ids.count < len(graph) == 6
+        assert [graph.find(commit_id) for commit_id in commit_ids] == list(range(6))
+        assert graph.find("ab" * 20) is None
+        for commit_id in commit_ids:
+            assert commit_graph.find_prefix(commit_id[:8]) == [commit_id]
+
+
+def test_find_with_an_id_index_of_another_graph(repo, write):
+    commit_ids = make_commits(repo, write, 3)
+    with repo.use():
+        # An id index that lists the commits at other positions:
+        graph = commit_graph.read_graph()
+        commit_graph.write_id_index(commit_graph.CommitGraph(
+            graph._data[:commit_graph.HEADER.size]
+            + graph._data[commit_graph.HEADER.size + commit_graph.RECORD.size:]
+        ))
+        graph = commit_graph.CommitGraph(graph._data)
+        assert [graph.find(commit_id) for commit_id in commit_ids] == [0, 1, 2]
+
+
+def test_generations_and_merge_bases(repo, write):
+    #   base - m1 ------- merge
+    #        \          /
+    #         s1 - s2 -
+    base_id = make_commits(repo, write, 1)[0]
+    repo.branch("side")
+    m1_id = make_commits(repo, write, 1, start=1)[0]
+    repo.checkout("side")
+    s1_id, s2_id = make_commits(repo, write, 2, start=2)
+    repo.checkout("master")
+    with pytest.raises(MergeConflictError):
+        repo.merge("side")
+    write("f", "merged", age=10)
+    repo.add("f")
+    merge_id = repo.commit("")
+
+    with repo.use():
+        graph = commit_graph.read_graph()
+        generations = {
+            commit_id: graph.generations[graph.find(commit_id)]
+            for commit_id in (base_id, m1_id, s1_id, s2_id, merge_id)
+        }
+        assert generations == {base_id: 1, m1_id: 2, s1_id: 2, s2_id: 3, merge_id: 4}
+        assert graph.parents_of(graph.find(merge_id)) == (graph.find(m1_id), graph.find(s2_id))
+
+        assert commit_graph.get_merge_base(m1_id, s2_id) == base_id
+        assert commit_graph.get_merge_base(s2_id, m1_id) == base_id
+        assert commit_graph.get_merge_base(merge_id, s1_id) == s1_id
+        assert commit_graph.get_merge_base(base_id, merge_id) == base_id
+        assert commit_graph.get_merge_base(s2_id, s2_id) == s2_id
+
+
+def test_commits_outside_the_graph_are_added_by_rewriting_it(repo, write):
+    commit_ids = make_commits(repo, write, 3)
+    (repo.path / ".swit" / "commit-graph").unlink()
+    with repo.use():
+        commit_graph._cache.clear()
+        assert commit_graph.get_merge_base(commit_ids[2], commit_ids[1]) == commit_ids[1]
+        assert len(commit_graph.read_graph()) == 3
@@ -0,0 +1,37 @@
+import pytest
+
+import Swit.common.config as config
+from Swit.inner.config import config as config_command
+
+
+def test_set_value_is_read_back_at_once(repo):
+    with repo.use():
+        config.set_value("core.workers", "4")
+        assert config.get_int("core.workers") == 4
+        config.set_value("core.workers", "5")
+        assert config.get_int("core.workers") == 5
+
+
+@pytest.mark.parametrize("name, value", [
+    ("core.workers", "abc"),
+    ("core.workers", "0"),
+    ("core.hardlinks", "maybe"),
+    ("compression.codec", "foo"),
+    ("compression.level", "high"),
+    ("pack.depth", "-1"),
+])
+def test_invalid_values_are_not_saved(repo, name, value):
+    with repo.use():
+        before = config.get(name)
+        with pytest.raises(ValueError):
+            config.set_value(name, value)
+        assert not config_command(name, value)
+        assert config.get(name) == before
+
+
+def test_unknown_settings_are_saved_as_they_are(repo):
+    with repo.use():
+        config.set_value("user.name", "anything")
+        assert config.get("user.name") == "anything"
+        config.set_value("compression.level", "")
+        assert config.get("compression.level") == ""
@@ -0,0 +1,173 @@
+import random
+
+import pytest
+
+import Swit.common.diff as line_diff
+
+
+def lcs_length(a, b):
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        current = [0]
+        for j, y in enumerate(b):
+            current.append(previous[j] + 1 if x == y else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1]
+
+
+def check_blocks(a, b, blocks):
+    a_at = b_at = 0
+    for a_start, b_start, length in blocks:
+        assert a_start >= a_at and b_start >= b_at and length > 0
+        assert a[a_start:a_start + length] == b[b_start:b_start + length]
+        a_at, b_at = a_start + length, b_start + length
+
+
+def lines(text):
+    return [f"{c}\n".encode() for c in text]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_matching_blocks_are_a_longest_common_subsequence(seed):
+    rng = random.Random(seed)
+    a = lines(rng.choices("abcdef", k=rng.randrange(60)))
+    b = lines(rng.choices("abcdefg", k=rng.randrange(60)))
+    blocks = line_diff.get_matching_blocks(a, b)
+    check_blocks(a, b, blocks)
+    assert sum(length for _, _, length in blocks) == lcs_length(a, b)
+
+
+def test_matching_blocks_of_edge_cases():
+    assert line_diff.get_matching_blocks([], []) == []
+    assert line_diff.get_matching_blocks(lines("abc"), []) == []
+    assert line_diff.get_matching_blocks(lines("abc"), lines("abc")) == [(0, 0, 3)]
+    assert line_diff.get_matching_blocks(lines("abc"), lines("xyz")) == []
+    assert line_diff.get_matching_blocks(lines("abxcd"), lines("abcd")) == [(0, 0, 2), (3, 2, 2)]
+
+
+def test_costly_diffs_are_still_correct():
+    rng = random.Random(0)
+    a = lines(rng.choices("abcdefghij", k=3000))
+    b = lines(rng.choices("abcdefghij", k=3000))
+    check_blocks(a, b, line_diff.get_matching_blocks(a, b))
+
+
+def merge(base, ours, theirs):
+    merged, conflicts = line_diff.merge_lines(lines(base), lines(ours), lines(theirs), "ours", "theirs")
+    return b"".join(merged).decode().replace("\n", ""), conflicts
+
+
+def test_merge_takes_the_changes_of_each_side():
+    assert merge("abcdef", "aXcdef", "abcdeY") == ("aXcdeY", 0)
+    assert merge("abcdef", "abcdef", "aZZf") == ("aZZf", 0)
+    assert merge("abc", "abc", "abc") == ("abc", 0)
+    # The same change on both sides:
+    assert merge("abcdef", "aXcdef", "aXcdeY") == ("aXcdeY", 0)
+    # Additions at both ends:
+    assert merge("abc", "Sabc", "abcE") == ("SabcE", 0)
+
+
+def test_merge_conflicts():
+    merged, conflicts = line_diff.merge_lines(lines("abc"), lines("aXc"), lines("aYc"), "HEAD", "feature")
+    assert conflicts == 1
+    assert merged == [b"a\n", b"<<<<<<< HEAD\n", b"X\n", b"=======\n", b"Y\n", b">>>>>>> feature\n", b"c\n"]
+    assert merge("abcdef", "aXcdeZ", "aYcdeW")[1] == 2
+    # A side that removed lines the other changed:
+    assert merge("abc", "ac", "aXc")[1] == 1
+
+
+def test_conflicting_last_lines_get_a_newline_before_the_markers():
+    merged, conflicts = line_diff.merge_lines([b"a\n", b"b\n"], [b"a\n", b"X"], [b"a\n", b"Y"], "ours", "theirs")
+    assert conflicts == 1
+    assert merged == [b"a\n", b"<<<<<<< ours\n", b"X\n", b"=======\n", b"Y\n", b">>>>>>> theirs\n"]
+
+
+def apply_hunks(a, patch):
+    """Applies the hunks of a unified diff to the lines of a, checking their context and counts."""
+    result, at = [], 0
+    patch_lines = patch.splitlines(keepends=True)
+    i = 0
+    while i < len(patch_lines):
+        header = patch_lines[i].decode()
+        assert header.startswith("@@ -")
+        old_range, new_range = header.split(" ")[1:3]
+        old_start, _, old_count = old_range[1:].partition(",")
+        old_count = int(old_count or 1)
+        new_count = int(new_range[1:].partition(",")[2] or 1)
+        start = int(old_start) - (1 if old_count else 0)
+        result.extend(a[at:start])
+        at = start
+        i += 1
+        seen_old = seen_new = 0
+        while seen_old < old_count or seen_new < new_count:
+            prefix, line = patch_lines[i][:1], patch_lines[i][1:]
+            i += 1
+            if i < len(patch_lines) and patch_lines[i].startswith(b"\\ No newline"):
+                line = line[:-1]
+                i += 1
+            if prefix in (b" ", b"-"):
+                assert a[at] == line
+                at += 1
+                seen_old += 1
+            if prefix in (b" ", b"+"):
+                result.append(line)
+                seen_new += 1
+    return result + a[at:]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_windowed_diffs_and_their_hunks(seed):
+    rng = random.Random(seed)
+    a = lines(rng.choices("abcdefgh", k=rng.randrange(200)))
+    b = list(a)
+    for _ in range(rng.randrange(6)):
+        at = rng.randrange(len(b) + 1)
+        b[at:at + rng.randrange(4)] = lines(rng.choices("xyz", k=rng.randrange(4)))
+    if b and rng.random() < 0.3:
+        b[-1] = b[-1].rstrip(b"\n")
+
+    for window in (7, 50, line_diff.WINDOW_LINES):
+        ops = list(line_diff.iter_line_ops(a, b, window))
+        assert [line for op in ops for line in op.a_lines] == a
+        assert [line for op in ops for line in op.b_lines] == b
+        assert all(op.a_lines == op.b_lines for op in ops if op.equal)
+        patch = b"".join(line_diff.iter_hunks(ops))
+        assert apply_hunks(a, patch) == b
+    assert (patch == b"") == (a == b)
+
+
+def test_hunks_keep_three_lines_of_context():
+    a = lines("abcdefghijklmnop")
+    b = lines("abcdefgXijklmnoY")
+    patch = b"".join(line_diff.iter_hunks(line_diff.iter_line_ops(a, b)))
+    assert patch == (
+        b"@@ -5,7 +5,7 @@\n e\n f\n g\n-h\n+X\n i\n j\n k\n"
+        b"@@ -13,4 +13,4 @@\n m\n n\n o\n-p\n+Y\n"
+    )
+
+
+def test_diff_command(repo, write, monkeypatch, capsys):
+    from Swit.inner.diff import inner_diff
+
+    write("a", "1\n2\n")
+    write("d/b", "b\n")
+    repo.add(".")
+    first_id = repo.commit("first")
+    write("a", "1\n3\n", age=30)
+    repo.add("a")
+    write("d/b", "changed\n", age=30)
+    monkeypatch.chdir(repo.path)
+
+    with repo.use():
+        inner_diff([], name_only=True)
+        assert capsys.readouterr().out == "d/b\n"
+        inner_diff([], cached=True, name_only=True)
+        assert capsys.readouterr().out == "a\n"
+        inner_diff([first_id], name_only=True)
+        assert capsys.readouterr().out == "a\nd/b\n"
+        inner_diff([first_id], paths=["d"], name_only=True)
+        assert capsys.readouterr().out == "d/b\n"
+        inner_diff([], cached=True)
+        out = capsys.readouterr().out
+    assert out.startswith("diff --git a/a b/a\n")
+    assert out.endswith("@@ -1,2 +1,2 @@\n 1\n-2\n+3\n")
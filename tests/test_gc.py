@@ -0,0 +1,47 @@
+import pytest
+
+from Swit.common.exceptions import MergeConflictError
+from Swit.inner.gc import inner_gc
+
+
+def image_exists(repo, commit_id: str) -> bool:
+    return (repo.path / ".swit" / "images" / f"{commit_id}.txt").exists()
+
+
+def commit_file(repo, write, content: str, age: int) -> str:
+    write("f", content, age=age)
+    repo.add("f")
+    return repo.commit(content)
+
+
+def test_gc_removes_unreachable_commits(repo, write):
+    first_id = commit_file(repo, write, "first", 60)
+    second_id = commit_file(repo, write, "second", 50)
+    repo.checkout(first_id)
+    detached_id = commit_file(repo, write, "detached", 40)
+    repo.checkout("master")
+
+    with repo.use():
+        inner_gc()
+    assert image_exists(repo, first_id) and image_exists(repo, second_id)
+    assert not image_exists(repo, detached_id)
+    assert [entry.commit_id for entry in repo.log()] == [second_id, first_id]
+
+
+def test_gc_keeps_the_commit_of_a_merge_in_progress(repo, write):
+    base_id = commit_file(repo, write, "base\n", 60)
+    commit_file(repo, write, "master\n", 50)
+    repo.checkout(base_id)
+    side_id = commit_file(repo, write, "side\n", 40)
+    repo.checkout("master")
+    with pytest.raises(MergeConflictError):
+        repo.merge(side_id)
+
+    with repo.use():
+        inner_gc()
+    assert image_exists(repo, side_id)
+
+    write("f", "resolved\n", age=30)
+    repo.add("f")
+    repo.commit("")
+    assert side_id in [entry.commit_id for entry in repo.log()]
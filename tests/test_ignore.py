@@ -0,0 +1,86 @@
+import pytest
+
+import Swit.common.ignore as ignore
+from Swit.common.exceptions import IgnoredPathError
+from Swit.common.helper_funcs import get_relpaths, is_scanned
+
+
+@pytest.mark.parametrize("pattern, rel_path, is_dir, expected", [
+    ("*.log", "a.log", False, True),
+    ("*.log", "deep/down/a.log", False, True),
+    ("*.log", "a.log.txt", False, False),
+    ("build/", "build", True, True),
+    ("build/", "build", False, False),
+    ("/root.txt", "root.txt", False, True),
+    ("/root.txt", "sub/root.txt", False, False),
+    ("doc/*.md", "doc/a.md", False, True),
+    ("doc/*.md", "doc/sub/a.md", False, False),
+    ("doc/**/*.md", "doc/sub/deeper/a.md", False, True),
+    ("**/cache", "a/b/cache", True, True),
+    ("file?.txt", "file1.txt", False, True),
+    ("file?.txt", "file10.txt", False, False),
+    ("[ab].txt", "b.txt", False, True),
+    ("[!ab].txt", "b.txt", False, False),
+    ("\\#hash", "#hash", False, True),
+    ("# comment", "# comment", False, False),
+])
+def test_patterns(tmp_path, pattern, rel_path, is_dir, expected):
+    (tmp_path / ignore.IGNORE_FILE).write_text(pattern + "\n")
+    assert ignore.is_path_ignored(tmp_path, rel_path, is_dir) is expected
+
+
+def test_later_patterns_and_deeper_files_win(tmp_path):
+    (tmp_path / ignore.IGNORE_FILE).write_text("*.txt\n!keep.txt\n")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / ignore.IGNORE_FILE).write_text("!*.txt\nkeep.txt\n")
+    assert ignore.is_path_ignored(tmp_path, "a.txt", False)
+    assert not ignore.is_path_ignored(tmp_path, "keep.txt", False)
+    assert not ignore.is_path_ignored(tmp_path, "sub/a.txt", False)
+    assert ignore.is_path_ignored(tmp_path, "sub/keep.txt", False)
+
+
+def test_files_under_an_ignored_dir_cant_be_included_again(tmp_path):
+    (tmp_path / ignore.IGNORE_FILE).write_text("out/\n!out/keep\n")
+    assert ignore.is_path_ignored(tmp_path, "out/keep", False)
+
+
+def test_ignored_dirs_are_pruned_unless_they_hold_tracked_files(tmp_path):
+    (tmp_path / ignore.IGNORE_FILE).write_text("out/\n*.tmp\n")
+    for rel_path in ("a", "b.tmp", "out/c", "out/x", "out/deep/d", "src/e", "src/f.tmp", ".swit/g"):
+        (tmp_path / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / rel_path).write_text("")
+    assert get_relpaths(tmp_path) == {ignore.IGNORE_FILE, "a", "src/e"}
+    # Only the tracked files of an ignored dir:
+    assert get_relpaths(tmp_path, tracked={"out/c", "b.tmp"}) == {ignore.IGNORE_FILE, "a", "b.tmp", "out/c", "src/e"}
+
+    # The same answers for single untracked paths:
+    for rel_path in ("a", "src/e"):
+        assert is_scanned(tmp_path, rel_path)
+    for rel_path in ("b.tmp", "src/f.tmp", ".swit/g", "out/x", "out/deep/d"):
+        assert not is_scanned(tmp_path, rel_path)
+
+
+def test_ignored_files_are_not_untracked_nor_added(repo, write):
+    write(ignore.IGNORE_FILE, "*.log\n")
+    write("a", "a")
+    write("b.log", "log")
+    repo.add(".")
+    repo.commit("first")
+    assert repo.status()["Untracked Files"] == set()
+    with pytest.raises(IgnoredPathError):
+        repo.add("b.log")
+
+
+def test_untracked_files_of_an_ignored_dir_with_tracked_files(repo, write):
+    write("out/c", "c")
+    repo.add("out")
+    repo.commit("first")
+    write(ignore.IGNORE_FILE, "out/\n")
+    write("out/x", "x")
+    write("out/c", "changed", age=30)
+
+    status = repo.status()
+    assert status["Untracked Files"] == {ignore.IGNORE_FILE}
+    assert status["Changes Not Staged for Commit"] == {"out/c"}
+    repo.add("out")
+    assert repo.status()["Changes to Be Committed"] == {"out/c"}
@@ -0,0 +1,83 @@
+import os
+import time
+
+import Swit.common.index as index
+import Swit.common.objects as objects
+
+
+def entry(rel_path, object_id="ab" * 20):
+    return index.IndexEntry(rel_path, objects.FILE_MODE, 3, 100, 200, 7, object_id)
+
+
+def test_write_and_read_the_index(repo):
+    entries = index.IndexEntries(
+        {p: entry(p) for p in ("b", "a/c", "a.txt", "a/b/d", "é")},
+        {"a/b": "cd" * 20},
+    )
+    with repo.use():
+        index.write_index(entries)
+        index._cache.clear()
+        read = index.read_index()
+        assert read == entries and read.trees == entries.trees
+        # Sorted by the bytes of the path, like the binary search expects:
+        assert list(read) == ["a.txt", "a/b/d", "a/c", "b", "é"]
+        assert index.find_entry("a/c") == entries["a/c"]
+        assert index.find_entry("a") is None
+
+        with index.IndexFile() as index_file:
+            assert len(index_file) == 5
+            assert index_file["é"] == entries["é"]
+            assert "a/b" not in index_file and "zz" not in index_file
+            assert index_file.has_dir("a") and index_file.has_dir("a/b") and not index_file.has_dir("b")
+            assert list(index_file.paths_under("a")) == ["a/b/d", "a/c"]
+            assert index_file.trees == {"a/b": "cd" * 20}
+
+
+def test_changing_an_entry_drops_the_cached_trees_above_it():
+    trees = {"": "1" * 40, "a": "2" * 40, "a/b": "3" * 40, "x": "4" * 40}
+    entries = index.IndexEntries({"a/b/c": entry("a/b/c")}, trees)
+    entries["a/b/c"] = entry("a/b/c")._replace(mtime_ns=5)
+    assert set(entries.trees) == {"", "a", "a/b", "x"}
+    entries["a/b/c"] = entry("a/b/c", "ef" * 20)
+    assert set(entries.trees) == {"x"}
+
+
+def test_the_staging_area_of_older_repositories_is_upgraded(repo):
+    staging_area = repo.path / ".swit" / "staging_area"
+    (staging_area / "d").mkdir(parents=True)
+    (staging_area / "d" / "f").write_text("content")
+    with repo.use():
+        entries = index.read_index()
+        assert list(entries) == ["d/f"]
+        assert objects.read_object(entries["d/f"].object_id) == b"content"
+    assert not staging_area.exists()
+    assert (repo.path / ".swit" / "index").exists()
+
+
+def test_racily_clean_entries_are_smudged(repo, write):
+    write("f", "aaaa")
+    repo.add("f")
+    repo.commit("first")
+    with repo.use():
+        staged_id = index.read_index()["f"].object_id
+
+    # `f` is edited, and staged in the same tick with its new stat info but its old content
+    # (a tick in the future, so it's at least as new as the index):
+    write("f", "bbbb", age=-3600)
+    with repo.use():
+        entries = index.read_index()
+        entries["f"] = index.new_entry("f", os.stat(repo.path / "f"), staged_id)
+        index.write_index(entries)
+        assert index.read_index()["f"].mtime_ns == 0
+
+    # Staging another file later gives the index a newer mtime than `f`'s:
+    write("g", "g")
+    repo.add("g")
+    later = time.time_ns() + 7200 * 10**9
+    os.utime(repo.path / ".swit" / "index", ns=(later, later))
+
+    assert repo.status()["Changes Not Staged for Commit"] == {"f"}
+    repo.add("f")
+    with repo.use():
+        assert index.read_index()["f"].object_id == objects.hash_file(repo.path / "f")
+    assert repo.status()["Changes Not Staged for Commit"] == set()
@@ -0,0 +1,60 @@
+import pytest
+
+from Swit.common.exceptions import ImpossibleCheckoutError, MergeConflictError
+
+
+def test_merge_conflict_writes_merge_head(repo, write):
+    write("f", "base\n")
+    repo.add("f")
+    repo.commit("base")
+    repo.branch("side")
+    write("f", "master\n", age=50)
+    repo.add("f")
+    master_id = repo.commit("on master")
+    repo.checkout("side")
+    write("f", "side\n", age=40)
+    repo.add("f")
+    side_id = repo.commit("on side")
+
+    with pytest.raises(MergeConflictError) as e:
+        repo.merge("master")
+    assert e.value.paths == ["f"]
+    merge_head = repo.path / ".swit" / "MERGE_HEAD"
+    assert merge_head.read_text().strip() == master_id
+    content = (repo.path / "f").read_text()
+    assert "<<<<<<<" in content and ">>>>>>>" in content
+
+    # HEAD can't move away from a merge in progress:
+    with pytest.raises(ImpossibleCheckoutError):
+        repo.checkout("master")
+
+    write("f", "resolved\n", age=30)
+    repo.add("f")
+    merge_id = repo.commit("")
+    assert not merge_head.exists()
+    assert repo.log(max_count=1)[0].parents == [side_id, master_id]
+    assert repo.head == merge_id
+
+
+def test_merge_combines_changes_to_different_lines(repo, write):
+    write("f", "1\n2\n3\n4\n5\n")
+    write("g", "g\n")
+    repo.add("f", "g")
+    repo.commit("base")
+    repo.branch("side")
+    write("f", "one\n2\n3\n4\n5\n", age=50)
+    repo.add("f")
+    master_id = repo.commit("on master")
+    repo.checkout("side")
+    write("f", "1\n2\n3\n4\nfive\n", age=40)
+    (repo.path / "g").unlink()
+    write("h", "h\n", age=40)
+    repo.add("f", "g", "h")
+    side_id = repo.commit("on side")
+
+    merge_id = repo.merge("master")
+    assert (repo.path / "f").read_text() == "one\n2\n3\n4\nfive\n"
+    assert not (repo.path / "g").exists() and (repo.path / "h").exists()
+    assert repo.log(max_count=1)[0].parents == [side_id, master_id]
+    assert repo.head == merge_id
+    assert not any(repo.status().values())
@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+import time
+from contextvars import copy_context
+
+import pytest
+
+import Swit.common.monitor as fs_monitor
+
+pytestmark = pytest.mark.skipif(sys.platform != "linux", reason="the monitor uses inotify")
+
+
+@pytest.fixture
+def watched(repo, write):
+    write("a", "a")
+    write("d/b", "b")
+    monitor = fs_monitor.Monitor(repo.path)
+    yield repo, monitor
+    monitor.close()
+
+
+def changes_since(monitor, token):
+    monitor.process_events()
+    changes = monitor.get_changes_since(token)
+    return None if changes is None else set(changes)
+
+
+def test_tokens_tell_what_changed_since(watched, write):
+    repo, monitor = watched
+    first = monitor.token
+    assert changes_since(monitor, first) == set()
+
+    write("a", "changed")
+    write("d/new", "new")
+    assert changes_since(monitor, first) == {"a", "d/new"}
+    second = monitor.token
+    assert second != first
+    assert changes_since(monitor, second) == set()
+
+    (repo.path / "d" / "b").unlink()
+    assert changes_since(monitor, second) == {"d/b"}
+    assert changes_since(monitor, first) == {"a", "d/new", "d/b"}
+
+
+def test_dirs_that_come_and_go(watched, write):
+    repo, monitor = watched
+    token = monitor.token
+    # The files of a new dir are reported one by one, and it's watched at once:
+    (repo.path / "new" / "deep").mkdir(parents=True)
+    write("new/deep/f", "f")
+    assert changes_since(monitor, token) >= {"new", "new/deep", "new/deep/f"}
+
+    token = monitor.token
+    os.rename(repo.path / "d", repo.path / "moved")
+    write("moved/c", "c")
+    assert changes_since(monitor, token) == {"d", "moved", "moved/b", "moved/c"}
+
+    # Changes under `.swit` are never reported:
+    token = monitor.token
+    write(".swit/anything", "x")
+    assert changes_since(monitor, token) == set()
+
+
+def test_tokens_of_another_instance_cant_be_answered(watched):
+    _, monitor = watched
+    token = monitor.token
+    assert monitor.get_changes_since("other-instance:0") is None
+    assert monitor.get_changes_since(token.partition(":")[0] + ":x") is None
+    monitor.reset()
+    assert monitor.get_changes_since(token) is None
+    assert changes_since(monitor, monitor.token) == set()
+
+
+def test_status_asks_the_running_monitor(repo, write):
+    write("a", "a")
+    repo.add("a")
+    repo.commit("first")
+    with repo.use():
+        thread = threading.Thread(target=copy_context().run, args=(fs_monitor.serve,))
+        thread.start()
+        try:
+            deadline = time.time() + 10
+            while fs_monitor.ping() is None:
+                assert time.time() < deadline
+                time.sleep(0.01)
+
+            assert not any(repo.status().values())
+            first = fs_monitor.read_state()
+            assert first is not None
+
+            write("a", "changed", age=30)
+            write("new", "new")
+            status = repo.status()
+            assert status["Changes Not Staged for Commit"] == {"a"}
+            assert status["Untracked Files"] == {"new"}
+            state = fs_monitor.read_state()
+            assert state.token != first.token
+            assert (state.not_staged, state.untracked) == ({"a"}, {"new"})
+
+            # What was reported last time is checked again, even if it didn't change since:
+            (repo.path / "new").unlink()
+            assert repo.status()["Untracked Files"] == set()
+            assert repo.status()["Changes Not Staged for Commit"] == {"a"}
+        finally:
+            fs_monitor.stop()
+            thread.join(10)
+    assert not thread.is_alive()
+    with repo.use():
+        assert fs_monitor.ping() is None
@@ -0,0 +1,82 @@
+import hashlib
+import os
+
+import pytest
+
+import Swit.common.compression as compression
+import Swit.common.config as config
+import Swit.common.objects as objects
+
+CODECS = [
+    compression.NONE, compression.ZLIB,
+    pytest.param(compression.ZSTD, marks=pytest.mark.skipif(compression.zstandard is None, reason="no zstandard")),
+]
+
+
+def git_blob_id(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def contents():
+    text = b"".join(b"line %d of a text file\n" % i for i in range(20000))
+    return {
+        "empty": b"",
+        "small": b"hello\n",
+        "text": text,
+        "random": os.urandom(300000),
+        "gzip": b"\x1f\x8b" + text[:1000],
+    }
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_blobs_round_trip_in_every_codec(repo, codec):
+    with repo.use():
+        config.set_value("compression.codec", codec)
+        for name, data in contents().items():
+            fp = repo.path / name
+            fp.write_bytes(data)
+            object_id = objects.write_blob(fp)
+            assert object_id == git_blob_id(data)
+            assert objects.read_object(object_id) == data
+            with objects.open_object(object_id) as f:
+                assert b"".join(iter(lambda: f.read(4096), b"")) == data
+            objects.materialize_blob(object_id, objects.FILE_MODE, repo.path / "out")
+            assert (repo.path / "out").read_bytes() == data
+
+            path, stored_codec = objects.find_object(object_id)
+            # Content that looks compressed already is stored as is:
+            expected = compression.NONE if name in ("random", "gzip") else codec
+            assert stored_codec == expected
+            if expected != compression.NONE and name == "text":
+                assert path.stat().st_size < len(data) / 5
+        assert not any(p.name.startswith("tmp_") for p in (repo.path / ".swit" / "objects").iterdir())
+
+
+def test_objects_stay_readable_after_the_codec_changes(repo):
+    with repo.use():
+        (repo.path / "f").write_bytes(b"some text\n" * 100)
+        object_id = objects.write_blob(repo.path / "f")
+        config.set_value("compression.codec", "none")
+        assert objects.read_object(object_id) == b"some text\n" * 100
+        # Already stored, so not stored again with the new codec:
+        assert objects.write_blob(repo.path / "f") == object_id
+        assert objects.find_object(object_id)[1] == compression.ZLIB
+
+
+@pytest.mark.parametrize("codec", CODECS[1:])
+def test_streaming_compression(repo, codec):
+    data = os.urandom(1000) + b"abc" * 300000
+    path = repo.path / "compressed"
+    with repo.use(), open(path, "wb") as f, compression.compressing_writer(f, codec) as writer:
+        for i in range(0, len(data), 7777):
+            writer.write(data[i:i + 7777])
+    assert compression.decompress(path.read_bytes(), codec) == data
+    with compression.decompressing_reader(open(path, "rb"), codec) as reader:
+        assert b"".join(iter(lambda: reader.read(10000), b"")) == data
+
+
+def test_compressibility_check():
+    assert compression.is_compressible(b"plain text " * 100)
+    assert compression.is_compressible(b"")
+    assert not compression.is_compressible(os.urandom(4096))
+    assert not compression.is_compressible(b"\x89PNG\r\n\x1a\n" + b"\0" * 100)
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+import Swit.common.objects as objects
+import Swit.common.pack as pack
+from Swit.inner.gc import inner_gc
+
+
+def edit(data: bytes, rng: random.Random, count: int) -> bytes:
+    data = bytearray(data)
+    for _ in range(count):
+        at = rng.randrange(len(data) + 1)
+        data[at:at + rng.randrange(50)] = rng.randbytes(rng.randrange(50))
+    return bytes(data)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_deltas_rebuild_the_target(seed):
+    rng = random.Random(seed)
+    base = rng.randbytes(rng.randrange(5000))
+    target = edit(base, rng, rng.randrange(10))
+    delta = pack.create_delta(base, target)
+    assert pack.apply_delta(base, delta) == target
+
+
+def test_deltas_of_edge_cases():
+    for base, target in [(b"", b""), (b"", b"new"), (b"old", b""), (b"x" * 100, b"x" * 1000), (b"short", b"short")]:
+        assert pack.apply_delta(base, pack.create_delta(base, target)) == target
+
+
+def test_deltas_of_similar_content_are_small():
+    rng = random.Random(0)
+    base = rng.randbytes(100000)
+    target = edit(base, rng, 5)
+    assert len(pack.create_delta(base, target)) < 1000
+
+
+def test_gc_packs_similar_versions_as_deltas(repo, write):
+    rng = random.Random(0)
+    content = b"".join(b"line %d: %s\n" % (i, rng.randbytes(8).hex().encode()) for i in range(2000))
+    commit_ids = []
+    versions = []
+    for i in range(4):
+        content = content.replace(b"line %d:" % (i * 100), b"changed %d:" % i)
+        (repo.path / "f").write_bytes(content)
+        write("g", f"g {i}", age=0)
+        repo.add("f", "g")
+        versions.append(content)
+        commit_ids.append(repo.commit(f"version {i}"))
+
+    with repo.use():
+        inner_gc()
+        packs = pack.get_packs()
+        assert len(packs) == 1
+        packed_ids = set(packs[0].object_ids())
+        # Nothing is left loose, and everything reads back from the pack:
+        objects_dir = repo.path / ".swit" / "objects"
+        assert [p.name for p in objects_dir.iterdir()] == ["pack"]
+        assert {objects.hash_object("blob", content) for content in versions} <= packed_ids
+        deltas = sum(packs[0].is_delta(packs[0].find(object_id)) for object_id in packed_ids)
+        assert deltas >= 3
+        assert packs[0].pack_path.stat().st_size < len(versions[0]) * 2
+
+        # A second gc packs the same objects again:
+        inner_gc()
+        assert set(pack.get_packs()[0].object_ids()) == packed_ids
+
+    for commit_id, content in zip(commit_ids, versions):
+        repo.checkout(commit_id)
+        assert (repo.path / "f").read_bytes() == content
+    repo.checkout("master")
@@ -0,0 +1,95 @@
+import socket
+import sys
+import threading
+import time
+from contextvars import copy_context
+
+import pytest
+from loguru import logger
+
+import Swit.common.server as command_server
+from Swit.common.client import iter_frames, send_request
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the server listens on a unix socket")
+
+
+@pytest.fixture
+def server(repo, write, monkeypatch):
+    write("a", "a")
+    write("d/b", "b")
+    repo.add("a", "d")
+    repo.commit("first")
+    # The server runs commands in the client's working dir, and goes back to the repository after each one:
+    monkeypatch.chdir(repo.path)
+    with repo.use():
+        thread = threading.Thread(target=copy_context().run, args=(command_server.serve,))
+        thread.start()
+        try:
+            deadline = time.time() + 10
+            while not command_server.ping():
+                assert time.time() < deadline
+                time.sleep(0.01)
+            yield repo
+        finally:
+            command_server.stop()
+            thread.join(10)
+            # The server sends its log to the client it's serving:
+            logger.remove()
+            logger.add(sys.stderr)
+    assert not thread.is_alive()
+    with repo.use():
+        assert not command_server.ping()
+
+
+def run_on_server(argv, cwd):
+    """Returns the stdout, stderr and exit code of a command run on the server."""
+    conn = send_request({"argv": argv, "cwd": str(cwd)}, str(cwd))
+    assert conn is not None
+    output = {b"o": b"", b"e": b""}
+    exit_code = None
+    with conn:
+        for channel, payload in iter_frames(conn):
+            if channel == b"x":
+                exit_code = int(payload)
+            else:
+                output[channel] += payload
+    return output[b"o"].decode(), output[b"e"].decode(), exit_code
+
+
+def test_commands_run_on_the_server(server, write):
+    write("d/b", "changed")
+    write("d/new", "new")
+    out, err, exit_code = run_on_server(["status"], server.path / "d")
+    assert exit_code == 0
+    assert "d/b" in out and "d/new" in out
+    assert err == ""
+
+    # The state the server keeps between commands follows changes made by other commands:
+    assert run_on_server(["add", "new"], server.path / "d")[2] == 0
+    out, _, _ = run_on_server(["status"], server.path)
+    changes_to_be_committed = out.split(">>> Changes to Be Committed:")[1].split(">>>")[0]
+    assert "d/new" in changes_to_be_committed
+
+
+def test_failures_are_sent_to_the_client(server):
+    out, err, exit_code = run_on_server(["no-such-command"], server.path)
+    assert exit_code == 2
+    assert "usage" in err
+    assert out == ""
+
+    _, err, exit_code = run_on_server(["checkout", "no-such-branch"], server.path)
+    assert "no-such-branch" in err
+    # The server keeps running after a command failed:
+    assert command_server.ping()
+
+
+def test_bad_requests_dont_stop_the_server(server):
+    for line in (b"not json\n", b""):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(str(server.path / ".swit" / "server.sock"))
+        with conn:
+            conn.sendall(line)
+            conn.shutdown(socket.SHUT_WR)
+            assert list(iter_frames(conn)) == []
+    assert command_server.ping()
+
@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+import Swit.common.index as index
+import Swit.common.objects as objects
+from Swit.common.helper_funcs import get_commit_tree
+from Swit.common.workers import measure_throughput
+
+
+def list_objects(repo):
+    return {fp for _, _, files in os.walk(repo.path / ".swit" / "objects") for fp in files}
+
+
+@pytest.fixture
+def committed(repo, write):
+    for rel_path in ("a", "d/b", "d/e/c", "x/y"):
+        write(rel_path, rel_path)
+    repo.add(".")
+    repo.commit("first")
+    return repo
+
+
+def test_status_sections(committed, write):
+    repo = committed
+    write("d/e/c", "staged")
+    repo.add("d/e/c")
+    write("a", "not staged", age=30)
+    write("new", "untracked")
+    (repo.path / "x/y").unlink()
+    repo.add("x/y")
+
+    assert repo.status() == {
+        "Changes to Be Committed": {"d/e/c", "x/y"},
+        "Changes Not Staged for Commit": {"a"},
+        "Untracked Files": {"new"},
+    }
+
+
+def test_status_reads_only_files_whose_stat_info_changed(committed, write):
+    repo = committed
+    with repo.use(), measure_throughput() as throughput:
+        assert not any(repo.status().values())
+    assert throughput.files == 0
+
+    # Same size and content, but touched: read once, then trusted again after a refresh.
+    write("d/b", "d/b", age=30)
+    with repo.use(), measure_throughput() as throughput:
+        assert not any(repo.status(refresh=True).values())
+    assert throughput.files == 1
+    with repo.use(), measure_throughput() as throughput:
+        repo.status()
+    assert throughput.files == 0
+
+    # A different size is a change, without reading the file:
+    write("x/y", "longer content", age=20)
+    with repo.use(), measure_throughput() as throughput:
+        assert repo.status()["Changes Not Staged for Commit"] == {"x/y"}
+    assert throughput.files == 0
+
+
+def test_status_stores_no_objects(committed, write):
+    repo = committed
+    write("d/e/c", "staged")
+    write("d/e/new", "new")
+    repo.add("d")
+    before = list_objects(repo)
+
+    assert repo.status()["Changes to Be Committed"] == {"d/e/c", "d/e/new"}
+    assert repo.status(refresh=True)["Changes to Be Committed"] == {"d/e/c", "d/e/new"}
+    assert list_objects(repo) == before
+
+
+def test_diff_tree_matches_the_diff_of_the_written_tree(committed, write):
+    repo = committed
+    # A dir that became a file, and a file that became a dir:
+    (repo.path / "d/e/c").unlink()
+    (repo.path / "d/e").rmdir()
+    write("d/e", "a file")
+    (repo.path / "a").unlink()
+    write("a/b", "a dir")
+    repo.add(".")
+    with repo.use():
+        head_tree_id = get_commit_tree(repo.head)
+        entries = index.read_index()
+        changes = index.diff_tree(head_tree_id, entries)
+        assert changes == objects.diff_trees(head_tree_id, index.write_tree(entries))
+    assert set(changes) == {"a", "a/b", "d/e", "d/e/c"}
+
+
+def test_index_file_keeps_loaded_entries_once_closed(committed):
+    with committed.use(), index.IndexFile() as entries:
+        assert "d/b" in entries
+        entries.load()
+    assert sorted(entries) == ["a", "d/b", "d/e/c", "x/y"]
+    assert entries["d/b"].path == "d/b"